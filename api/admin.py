@@ -3,8 +3,9 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     Rol, User, Empleado, Caso, Alerta, Documento, Carpeta,
     Seguimiento, Reporte, CasoReporte, TokenVerification, ExpiringToken,
-    AuditoriaDocumento,
+    AuditoriaDocumento, ArchivoDocumento, AuditoriaResumenDiario, SubidaDocumento,
 )
+from .particiones import mes_actual, sumar_meses
 
 
 @admin.register(Rol)
@@ -98,12 +99,58 @@ class DocumentoAdmin(admin.ModelAdmin):
     readonly_fields = ['fecha_carga', 'fecha_modificacion', 'ruta', 'tamano_bytes', 'checksum_sha256']
 
 
+class MesAuditoriaFilter(admin.SimpleListFilter):
+    """Filtro por mes (últimos 12): en PostgreSQL solo lee la partición de ese mes."""
+    title = 'mes'
+    parameter_name = 'mes'
+
+    def lookups(self, request, model_admin):
+        anio, mes = mes_actual()
+        meses = [sumar_meses(anio, mes, -i) for i in range(12)]
+        return [(f'{a:04d}-{m:02d}', f'{a:04d}-{m:02d}') for a, m in meses]
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            anio, mes = (int(parte) for parte in self.value().split('-'))
+        except ValueError:
+            return queryset.none()
+        return queryset.del_mes(anio, mes)
+
+
 @admin.register(AuditoriaDocumento)
 class AuditoriaDocumentoAdmin(admin.ModelAdmin):
     list_display = ['id_auditoria', 'documento', 'usuario', 'accion', 'fecha', 'ip_origen']
-    list_filter = ['accion', 'fecha']
+    list_filter = [MesAuditoriaFilter, 'accion', 'fecha']
+    list_select_related = ['documento', 'usuario']
     search_fields = ['usuario__username', 'documento__nombre']
     readonly_fields = ['fecha']
+    # Sin COUNT(*) de la tabla completa (recorre todas las particiones) en cada listado
+    show_full_result_count = False
+
+
+@admin.register(AuditoriaResumenDiario)
+class AuditoriaResumenDiarioAdmin(admin.ModelAdmin):
+    list_display = ['dia', 'documento', 'usuario', 'accion', 'total']
+    list_filter = ['accion', 'dia']
+    list_select_related = ['documento', 'usuario']
+    readonly_fields = ['dia', 'documento', 'usuario', 'accion', 'total']
+
+
+@admin.register(ArchivoDocumento)
+class ArchivoDocumentoAdmin(admin.ModelAdmin):
+    list_display = ['checksum_sha256', 'tamano_bytes', 'referencias', 'fecha_creacion']
+    search_fields = ['checksum_sha256']
+    readonly_fields = ['checksum_sha256', 'ruta', 'tamano_bytes', 'referencias', 'fecha_creacion']
+
+
+@admin.register(SubidaDocumento)
+class SubidaDocumentoAdmin(admin.ModelAdmin):
+    list_display = ['id_subida', 'nombre_archivo', 'usuario', 'recibidos', 'tamano_total', 'fecha_actualizacion']
+    list_select_related = ['usuario']
+    readonly_fields = ['id_subida', 'usuario', 'nombre_archivo', 'datos', 'tamano_total', 'recibidos',
+                       'fecha_creacion', 'fecha_actualizacion']
 
 
 @admin.register(Seguimiento)
@@ -0,0 +1,442 @@
+"""
+Escritura de la auditoría de documentos (Auditoria_Documento) fuera del camino de la petición.
+- AUDIT_ASYNC: los eventos se encolan en memoria y un hilo del proceso los inserta con
+  bulk_create al llegar a AUDIT_BATCH_SIZE o cada AUDIT_FLUSH_INTERVAL_SECONDS.
+- Cada evento se anota antes en un archivo de spool del proceso (AUDIT_SPOOL_DIR, JSON por
+  línea); el archivo se borra cuando su lote queda en la BD. Si el proceso muere, el spool
+  se reenvía al arrancar otro proceso (o con `manage.py reenviar_auditoria`).
+- Un lote que falla se reintenta aparte, con espera creciente, sin retener a los demás;
+  tras AUDIT_MAX_RETRIES intentos su spool pasa a <spool>/descartados/ para revisarlo a mano
+  (devolverlo a AUDIT_SPOOL_DIR lo reenvía `reenviar_auditoria --forzar`). Si la BD no
+  responde no se cuentan intentos.
+- Sin AUDIT_ASYNC (tests, scripts): INSERT síncrono como antes.
+- metricas(): profundidad de la cola y latencia de los vaciados.
+- Cada inserción incrementa en la misma transacción Auditoria_Resumen_Diario (upsert con
+  ON CONFLICT), que usan los reportes agregados de la API de auditoría.
+Los eventos se encolan al confirmar la transacción de la petición (on_commit).
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos, no se recuperan spools ajenos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+RESUMEN_LOTE = 150  # filas por INSERT del upsert (5 parámetros cada una)
+DESCARTADOS = 'descartados'  # subcarpeta del spool con los lotes que no se pudieron insertar
+
+
+def acumular_resumen(filas):
+    """
+    Suma las filas de auditoría (instancias AuditoriaDocumento) a Auditoria_Resumen_Diario.
+    Las claves van ordenadas para que escritores concurrentes bloqueen en el mismo orden.
+    """
+    from .models import AuditoriaResumenDiario
+    conteos = Counter(
+        (timezone.localdate(f.fecha), f.documento_id, f.usuario_id, f.accion) for f in filas
+    )
+    tabla = AuditoriaResumenDiario._meta.db_table
+    items = sorted(conteos.items())
+    with connection.cursor() as cursor:
+        for i in range(0, len(items), RESUMEN_LOTE):
+            lote = items[i:i + RESUMEN_LOTE]
+            cursor.execute(
+                f'INSERT INTO "{tabla}" ("Dia", "Id_Documento", "Id_Usuario", "Accion", "Total") '
+                f'VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(lote))} '
+                f'ON CONFLICT ("Dia", "Id_Documento", "Id_Usuario", "Accion") '
+                f'DO UPDATE SET "Total" = "{tabla}"."Total" + EXCLUDED."Total"',
+                [valor for clave, total in lote for valor in (*clave, total)],
+            )
+
+
+def _crear_auditorias(eventos):
+    """
+    bulk_create de eventos (dicts) y su suma al resumen diario, en una transacción.
+    Se omiten los de documentos o usuarios ya eliminados: sus filas de auditoría se
+    habrían borrado en cascada igualmente.
+    Returns: número de filas insertadas.
+    """
+    from .models import AuditoriaDocumento, Documento, User
+    documentos = set(Documento.objects.filter(
+        pk__in={e['documento_id'] for e in eventos}).values_list('pk', flat=True))
+    usuarios = set(User.objects.filter(
+        pk__in={e['usuario_id'] for e in eventos}).values_list('pk', flat=True))
+    filas = [
+        AuditoriaDocumento(
+            documento_id=e['documento_id'], usuario_id=e['usuario_id'], accion=e['accion'],
+            ip_origen=e['ip_origen'], fecha=parse_datetime(e['fecha']),
+        )
+        for e in eventos
+        if e['documento_id'] in documentos and e['usuario_id'] in usuarios
+    ]
+    if len(filas) < len(eventos):
+        logger.info("Auditoría: %d eventos de documentos/usuarios eliminados omitidos", len(eventos) - len(filas))
+    with transaction.atomic():
+        AuditoriaDocumento.objects.bulk_create(filas, batch_size=1000)
+        acumular_resumen(filas)
+    return len(filas)
+
+
+def _leer_spool(path):
+    eventos = []
+    with open(path, encoding='utf-8') as f:
+        for linea in f:
+            try:
+                eventos.append(json.loads(linea))
+            except ValueError:
+                # Última línea a medio escribir por una caída
+                logger.warning("Auditoría: línea de spool ilegible en %s", path)
+    return eventos
+
+
+def _a_descartados(path):
+    """Aparta un spool que no se pudo insertar a <spool_dir>/descartados/. Returns: ruta nueva."""
+    carpeta = os.path.join(os.path.dirname(path), DESCARTADOS)
+    os.makedirs(carpeta, exist_ok=True)
+    destino = os.path.join(carpeta, os.path.basename(path))
+    os.replace(path, destino)
+    return destino
+
+
+class EscritorAuditoria:
+    """Cola en memoria + spool por proceso + hilo de vaciado. Una instancia por proceso."""
+
+    def __init__(self, spool_dir, batch_size, intervalo, fsync=False, max_reintentos=5, espera_maxima=300.0):
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.intervalo = intervalo
+        self.fsync = fsync
+        self.max_reintentos = max_reintentos
+        self.espera_maxima = espera_maxima
+        self.pid = os.getpid()
+        self.prefijo = f'{self.pid}-{uuid.uuid4().hex[:8]}'
+        self._lock = threading.Lock()
+        self._vaciando = threading.Lock()
+        self._despertar = threading.Event()
+        self._cola = []
+        self._spool = None
+        self._spool_path = None
+        self._secuencia = 0
+        # [(spool_path, eventos, intentos, reintentar_en)] lotes cerrados aún no insertados
+        self._pendientes = []
+        self._hilo = None
+        self._lock_proceso = None
+        self.estadisticas = {
+            'encolados': 0, 'escritos': 0, 'omitidos': 0, 'lotes': 0, 'errores': 0, 'descartados': 0,
+            'ultimo_vaciado_ms': None, 'max_vaciado_ms': 0.0,
+        }
+        os.makedirs(spool_dir, exist_ok=True)
+        self._tomar_lock_proceso()
+
+    # ---------- API ----------
+
+    def encolar(self, evento):
+        linea = json.dumps(evento, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._spool is None:
+                self._abrir_spool()
+            self._spool.write(linea)
+            self._spool.flush()
+            if self.fsync:
+                os.fsync(self._spool.fileno())
+            self._cola.append(evento)
+            self.estadisticas['encolados'] += 1
+            lleno = len(self._cola) >= self.batch_size
+        self._arrancar_hilo()
+        if lleno:
+            self._despertar.set()
+
+    def vaciar(self):
+        """
+        Inserta lo encolado y los lotes fallidos cuyo reintento ya toca. Cada lote se intenta
+        por separado: uno que falla espera intervalo * 2^intentos (hasta espera_maxima) y,
+        agotados max_reintentos, se aparta a descartados/. Seguro entre hilos.
+        """
+        with self._vaciando:
+            with self._lock:
+                if self._cola:
+                    self._spool.close()
+                    self._pendientes.append((self._spool_path, self._cola, 0, 0.0))
+                    self._cola, self._spool, self._spool_path = [], None, None
+                pendientes, self._pendientes = self._pendientes, []
+            ahora = time.monotonic()
+            sin_bd = False
+            quedan = []
+            for path, eventos, intentos, reintentar_en in pendientes:
+                if sin_bd or reintentar_en > ahora:
+                    quedan.append((path, eventos, intentos, reintentar_en))
+                    continue
+                insertado = self._insertar(eventos)
+                if insertado:
+                    os.remove(path)
+                elif insertado is None:
+                    # BD caída: no es culpa del lote; el resto espera al próximo vaciado
+                    sin_bd = True
+                    quedan.append((path, eventos, intentos, ahora + self.intervalo))
+                elif intentos + 1 >= self.max_reintentos:
+                    self._descartar(path, eventos, intentos + 1)
+                else:
+                    espera = min(self.intervalo * 2 ** (intentos + 1), self.espera_maxima)
+                    quedan.append((path, eventos, intentos + 1, ahora + espera))
+            if quedan:
+                with self._lock:
+                    self._pendientes[:0] = quedan
+
+    def cerrar(self):
+        """Vacía la cola y, si no queda nada pendiente, suelta el spool y el bloqueo del proceso."""
+        self.vaciar()
+        with self._lock:
+            if self._cola or self._pendientes or self._lock_proceso is None:
+                return
+            os.remove(self._lock_proceso.name)
+            self._lock_proceso.close()
+            self._lock_proceso = None
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self.estadisticas)
+            datos['profundidad_cola'] = len(self._cola) + sum(len(p[1]) for p in self._pendientes)
+            datos['lotes_pendientes'] = len(self._pendientes)
+        datos['modo'] = 'asincrono'
+        return datos
+
+    # ---------- internos ----------
+
+    def _insertar(self, eventos):
+        """Returns: True si el lote quedó en la BD, None si la BD no responde, False si el lote falla."""
+        inicio = time.perf_counter()
+        try:
+            close_old_connections()
+            escritos = _crear_auditorias(eventos)
+        except (OperationalError, InterfaceError):
+            logger.exception("Auditoría: base de datos no disponible; %d eventos siguen en cola", len(eventos))
+            with self._lock:
+                self.estadisticas['errores'] += 1
+            return None
+        except Exception:
+            logger.exception("Auditoría: no se pudo insertar un lote de %d eventos; se reintentará", len(eventos))
+            with self._lock:
+                self.estadisticas['errores'] += 1
+            return False
+        ms = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self.estadisticas['escritos'] += escritos
+            self.estadisticas['omitidos'] += len(eventos) - escritos
+            self.estadisticas['lotes'] += 1
+            self.estadisticas['ultimo_vaciado_ms'] = round(ms, 2)
+            self.estadisticas['max_vaciado_ms'] = round(max(self.estadisticas['max_vaciado_ms'], ms), 2)
+        logger.debug("Auditoría: lote de %d eventos en %.1f ms", len(eventos), ms)
+        return True
+
+    def _descartar(self, path, eventos, intentos):
+        destino = _a_descartados(path)
+        logger.error(
+            "Auditoría: lote de %d eventos descartado tras %d intentos; spool apartado en %s",
+            len(eventos), intentos, destino,
+        )
+        with self._lock:
+            self.estadisticas['descartados'] += len(eventos)
+
+    def _abrir_spool(self):
+        self._secuencia += 1
+        self._spool_path = os.path.join(self.spool_dir, f'{self.prefijo}-{self._secuencia}.jsonl')
+        self._spool = open(self._spool_path, 'a', encoding='utf-8')
+
+    def _arrancar_hilo(self):
+        if self._hilo is None:
+            with self._lock:
+                if self._hilo is None:
+                    self._hilo = threading.Thread(target=self._bucle, name='auditoria-writer', daemon=True)
+                    self._hilo.start()
+
+    def _bucle(self):
+        # Fuera de cualquier transacción de petición: reenviar lo que dejaron procesos caídos
+        try:
+            recuperar_spools(self.spool_dir, excluir=self.prefijo)
+        except Exception:
+            logger.exception("Auditoría: no se pudieron reenviar spools huérfanos")
+        while True:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            try:
+                self.vaciar()
+            except Exception:
+                logger.exception("Auditoría: error en el hilo de vaciado")
+
+    def _tomar_lock_proceso(self):
+        """Bloqueo del proceso sobre <pid>.lock mientras vive; marca sus spools como propios."""
+        if fcntl is None:
+            return
+        self._lock_proceso = open(os.path.join(self.spool_dir, f'{self.pid}.lock'), 'w')
+        fcntl.flock(self._lock_proceso, fcntl.LOCK_EX)
+
+
+def recuperar_spools(spool_dir, forzar=False, excluir=None):
+    """
+    Reenvía los spools de procesos que ya no existen (su <pid>.lock se puede bloquear).
+    Los del propio pid son de un proceso anterior con el mismo pid, salvo los del
+    escritor activo (`excluir`: su prefijo). Con forzar=True reenvía todos los demás
+    (solo con la aplicación detenida). Un spool cuyos eventos no se pueden insertar se
+    aparta a descartados/ y se sigue con los demás; si la BD no responde se propaga el
+    error y los spools se quedan donde están.
+    Returns: (archivos, eventos) reenviados.
+    """
+    archivos = eventos_total = descartados = 0
+    propio = str(os.getpid())
+    pids = {os.path.basename(p).split('-', 1)[0] for p in glob.glob(os.path.join(spool_dir, '*-*.jsonl'))}
+    for pid in sorted(pids):
+        lock_path = os.path.join(spool_dir, f'{pid}.lock')
+        lock = None
+        if not forzar and pid != propio:
+            if fcntl is None:
+                continue
+            lock = open(lock_path, 'a')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                continue  # el proceso sigue vivo
+        try:
+            for path in sorted(glob.glob(os.path.join(spool_dir, f'{pid}-*.jsonl'))):
+                if excluir and os.path.basename(path).startswith(excluir + '-'):
+                    continue
+                eventos = _leer_spool(path)
+                try:
+                    if eventos:
+                        _crear_auditorias(eventos)
+                except (OperationalError, InterfaceError):
+                    raise
+                except Exception:
+                    destino = _a_descartados(path)
+                    logger.exception("Auditoría: no se pudo reenviar el spool %s; apartado en %s", path, destino)
+                    descartados += 1
+                    continue
+                os.remove(path)
+                archivos += 1
+                eventos_total += len(eventos)
+            if pid != propio and os.path.exists(lock_path):
+                os.remove(lock_path)
+        finally:
+            if lock is not None:
+                lock.close()
+    if archivos:
+        logger.warning("Auditoría: reenviados %d eventos de %d spools huérfanos", eventos_total, archivos)
+    if descartados:
+        logger.error("Auditoría: %d spools huérfanos apartados en %s", descartados, os.path.join(spool_dir, DESCARTADOS))
+    return archivos, eventos_total
+
+
+_escritor = None
+_escritor_lock = threading.Lock()
+
+
+def get_spool_dir():
+    return getattr(settings, 'AUDIT_SPOOL_DIR', None) or os.path.join(settings.BASE_DIR, 'spool_auditoria')
+
+
+def get_escritor():
+    """Escritor asíncrono del proceso, o None si AUDIT_ASYNC está desactivado."""
+    global _escritor
+    if not getattr(settings, 'AUDIT_ASYNC', False):
+        return None
+    if _escritor is None or _escritor.pid != os.getpid():
+        # Tras un fork (p. ej. gunicorn --preload) el hijo necesita su propio hilo y spool
+        with _escritor_lock:
+            if _escritor is None or _escritor.pid != os.getpid():
+                _escritor = EscritorAuditoria(
+                    get_spool_dir(),
+                    batch_size=getattr(settings, 'AUDIT_BATCH_SIZE', 500),
+                    intervalo=getattr(settings, 'AUDIT_FLUSH_INTERVAL_SECONDS', 2.0),
+                    fsync=getattr(settings, 'AUDIT_SPOOL_FSYNC', False),
+                    max_reintentos=getattr(settings, 'AUDIT_MAX_RETRIES', 5),
+                    espera_maxima=getattr(settings, 'AUDIT_RETRY_MAX_SECONDS', 300.0),
+                )
+    return _escritor
+
+
+def registrar(documento_id, usuario_id, accion, ip_origen=None):
+    """Registra un evento de auditoría (síncrono o encolado según AUDIT_ASYNC)."""
+    evento = {
+        'documento_id': documento_id,
+        'usuario_id': usuario_id,
+        'accion': accion,
+        'ip_origen': ip_origen,
+        'fecha': timezone.now().isoformat(),
+    }
+    escritor = get_escritor()
+    if escritor is None:
+        from .models import AuditoriaDocumento
+        with transaction.atomic():
+            fila = AuditoriaDocumento.objects.create(
+                documento_id=documento_id, usuario_id=usuario_id, accion=accion, ip_origen=ip_origen,
+            )
+            acumular_resumen([fila])
+        return
+    transaction.on_commit(lambda: escritor.encolar(evento))
+
+
+def registrar_varios(documento_ids, usuario_id, accion, ip_origen=None):
+    """
+    Un evento por documento (subidas y descargas en lote). En modo síncrono es un solo
+    bulk_create dentro de la transacción del llamador; con AUDIT_ASYNC se encolan al confirmarla.
+    """
+    fecha = timezone.now().isoformat()
+    eventos = [
+        {'documento_id': pk, 'usuario_id': usuario_id, 'accion': accion, 'ip_origen': ip_origen, 'fecha': fecha}
+        for pk in documento_ids
+    ]
+    if not eventos:
+        return
+    escritor = get_escritor()
+    if escritor is None:
+        from .models import AuditoriaDocumento
+        filas = [
+            AuditoriaDocumento(documento_id=e['documento_id'], usuario_id=usuario_id, accion=accion, ip_origen=ip_origen)
+            for e in eventos
+        ]
+        with transaction.atomic():
+            AuditoriaDocumento.objects.bulk_create(filas, batch_size=1000)
+            acumular_resumen(filas)
+        return
+
+    def _encolar():
+        for evento in eventos:
+            escritor.encolar(evento)
+    transaction.on_commit(_encolar)
+
+
+def vaciar():
+    """Fuerza la escritura de lo encolado en este proceso (no hace nada en modo síncrono)."""
+    if _escritor is not None and _escritor.pid == os.getpid():
+        _escritor.vaciar()
+
+
+def metricas():
+    if _escritor is None or _escritor.pid != os.getpid():
+        return {'modo': 'asincrono' if getattr(settings, 'AUDIT_ASYNC', False) else 'sincrono', 'profundidad_cola': 0}
+    return _escritor.metricas()
+
+
+@atexit.register
+def _vaciar_al_salir():
+    try:
+        if _escritor is not None and _escritor.pid == os.getpid():
+            _escritor.cerrar()
+    except Exception:
+        # Lo no insertado queda en el spool y se reenvía en el próximo arranque
+        logger.exception("Auditoría: no se pudo vaciar la cola al salir")
@@ -1,6 +1,48 @@
 from rest_framework.authentication import TokenAuthentication
 from rest_framework import exceptions
-from .models import ExpiringToken
+from .models import ExpiringToken, Rol, User
+from .token_cache import get_token_cache
+
+
+ROLES_ADMIN_O_THA = ('administrador', 'tha')
+
+
+class Principal:
+    """
+    Identidad resuelta de un usuario autenticado (id, rol normalizado, Admin/THA).
+    Se construye una sola vez por usuario cargado y se reutiliza en autenticación,
+    permisos y control de acceso a documentos.
+    """
+    __slots__ = ('user_id', 'rol_tipo', 'is_admin_or_tha')
+
+    def __init__(self, user_id, rol_tipo):
+        self.user_id = user_id
+        self.rol_tipo = (rol_tipo or '').lower()
+        self.is_admin_or_tha = self.rol_tipo in ROLES_ADMIN_O_THA
+
+    @classmethod
+    def for_user(cls, user):
+        """Principal del usuario, cacheado en la instancia (vive lo que dura la petición)."""
+        if not user or not user.is_authenticated:
+            return None
+        principal = getattr(user, '_principal', None)
+        if principal is None or principal.user_id != user.pk:
+            # Si el rol vino en el select_related del token, no hay consulta adicional
+            rol = user.rol if user.rol_id else None
+            principal = cls(user.pk, rol.tipo if rol else '')
+            user._principal = principal
+        return principal
+
+
+def _instancia(modelo, **valores):
+    """Instancia como leída de la BD con solo esos campos (el resto, diferidos)."""
+    campos = [f.attname for f in modelo._meta.concrete_fields if f.attname in valores]
+    return modelo.from_db(None, campos, [valores[c] for c in campos])
+
+
+def get_principal(request):
+    """Principal del usuario de la petición (None si no está autenticado)."""
+    return Principal.for_user(getattr(request, 'user', None))
 
 
 class ExpiringTokenAuthentication(TokenAuthentication):
@@ -8,8 +50,58 @@ class ExpiringTokenAuthentication(TokenAuthentication):
     model = ExpiringToken
     
     def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        datos = cache.get(key) if cache is not None else None
+        token = self.token_de(key, datos) if datos is not None else None
+        desde_cache = token is not None and not token.is_expired()
+        if desde_cache and not token.user.is_active:
+            raise exceptions.AuthenticationFailed('Usuario inactivo')
+        if not desde_cache:
+            # Fallo de caché (o actividad cacheada vencida): la BD decide
+            token = self._cargar_token(key)
+        
+        # Actualizar última actividad (solo se escribe si superó el umbral)
+        actividad_previa = token.ultima_actividad
+        token.registrar_actividad()
+        
+        Principal.for_user(token.user)
+        if cache is not None and (not desde_cache or token.ultima_actividad != actividad_previa):
+            cache.set(key, self.principal_de(token))
+        return (token.user, token)
+    
+    @staticmethod
+    def principal_de(token):
+        """Lo que se cachea de un token: sin el usuario completo ni su hash de contraseña."""
+        user = token.user
+        rol = user.rol if user.rol_id else None
+        return {
+            'user_id': user.pk,
+            'rol_id': user.rol_id,
+            'rol_tipo': rol.tipo if rol else None,
+            'is_active': user.is_active,
+            'ultima_actividad': token.ultima_actividad,
+        }
+    
+    @staticmethod
+    def token_de(key, datos):
+        """
+        Token y usuario reconstruidos desde el principal cacheado. Los campos no cacheados
+        quedan diferidos: si una vista los usa (p. ej. username) se cargan de la BD.
+        """
+        user = _instancia(User, id=datos['user_id'], is_active=datos['is_active'], rol_id=datos['rol_id'])
+        if datos['rol_id'] is not None:
+            user.rol = _instancia(Rol, id_rol=datos['rol_id'], tipo=datos['rol_tipo'])
+        token = _instancia(
+            ExpiringToken, key=key, token_ptr_id=key, user_id=datos['user_id'],
+            ultima_actividad=datos['ultima_actividad'],
+        )
+        token.user = user
+        return token
+    
+    def _cargar_token(self, key):
         try:
-            token = self.model.objects.get(key=key)
+            # Token, usuario y rol en una sola consulta
+            token = self.model.objects.select_related('user', 'user__rol').get(key=key)
         except self.model.DoesNotExist:
             raise exceptions.AuthenticationFailed('Token inválido')
         
@@ -20,8 +112,4 @@ class ExpiringTokenAuthentication(TokenAuthentication):
         if not token.user.is_active:
             raise exceptions.AuthenticationFailed('Usuario inactivo')
         
-        # Actualizar última actividad
-        token.save()
-        
-        return (token.user, token)
-
+        return token
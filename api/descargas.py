@@ -0,0 +1,353 @@
+"""
+Entrega HTTP de los archivos de documentos (DocumentoViewSet.descargar).
+- ETag fuerte desde checksum_sha256 (débil por tamaño/mtime si no hay checksum).
+- Last-Modified desde fecha_modificacion.
+- GET condicional: If-None-Match / If-Modified-Since -> 304, If-Match / If-Unmodified-Since -> 412.
+- Range de un solo intervalo (bytes=a-b, a-, -n) -> 206; If-Range (ETag fuerte o fecha
+  exacta si Last-Modified es fuerte); fuera de rango -> 416.
+- Política de auditoría DESCARGA configurable (DOCUMENT_DOWNLOAD_AUDIT), para no
+  registrar una fila por cada trozo que pide el visor de PDF.
+- Entrega (DOCUMENT_DELIVERY_BACKEND): 'python' transmite desde el worker (con fileno()
+  para que el servidor WSGI use sendfile vía wsgi.file_wrapper, p. ej. gunicorn);
+  'x-accel' (nginx) y 'x-sendfile' (Apache/lighttpd) devuelven solo cabeceras y el
+  proxy envía el archivo. Permisos, validadores y auditoría se resuelven igual en la vista.
+- Miniaturas (DocumentoViewSet.miniatura) con caché larga: su URL va ligada al checksum.
+- ZIP de varios documentos (descargar-zip de Carpeta y Caso) generado en flujo: sin archivo
+  temporal y con memoria constante; los formatos ya comprimidos se guardan sin comprimir.
+"""
+import calendar
+import os
+import re
+import time
+import zipfile
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .document_service import get_document_storage_root
+
+# Políticas de auditoría de descargas
+AUDITAR_COMPLETA = 'completa'      # 200 y rangos que empiezan en el byte 0 (una por descarga)
+AUDITAR_CADA_RANGO = 'cada_rango'  # 200 y cada 206
+AUDITAR_SIEMPRE = 'siempre'        # además, las revalidaciones 304
+
+# Backends de entrega del archivo
+ENTREGA_PYTHON = 'python'
+ENTREGA_X_ACCEL = 'x-accel'
+ENTREGA_X_SENDFILE = 'x-sendfile'
+
+RANGO_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangoNoSatisfacible(Exception):
+    pass
+
+
+class _TramoArchivo:
+    """Archivo abierto limitado a `longitud` bytes desde la posición actual (para FileResponse)."""
+
+    def __init__(self, archivo, longitud):
+        self.archivo = archivo
+        self.restante = longitud
+
+    def read(self, size=-1):
+        if self.restante <= 0:
+            return b''
+        if size is None or size < 0 or size > self.restante:
+            size = self.restante
+        datos = self.archivo.read(size)
+        self.restante -= len(datos)
+        return datos
+
+    def fileno(self):
+        # El servidor WSGI (wsgi.file_wrapper) puede usar os.sendfile desde la posición
+        # actual con Content-Length como límite, sin pasar los bytes por Python
+        return self.archivo.fileno()
+
+    def close(self):
+        self.archivo.close()
+
+
+def etag_documento(documento, path):
+    if documento.checksum_sha256:
+        return f'"{documento.checksum_sha256}"'
+    st = os.stat(path)
+    return f'W/"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def last_modified_documento(documento, path):
+    """Timestamp (segundos UTC) de fecha_modificacion, o el mtime del archivo si no hay fecha."""
+    if documento.fecha_modificacion:
+        return calendar.timegm(documento.fecha_modificacion.timetuple())
+    return int(os.stat(path).st_mtime)
+
+
+def last_modified_fuerte(documento, path):
+    """
+    Si Last-Modified sirve como validador fuerte (RFC 9110 8.8.2.2) para If-Range: solo el
+    mtime del archivo, con al menos un segundo de antigüedad. fecha_modificacion es un día
+    entero: el documento pudo cambiar después de enviarse con esa misma fecha.
+    """
+    if documento.fecha_modificacion:
+        return False
+    return time.time() - os.stat(path).st_mtime >= 1
+
+
+def parse_range(cabecera, tamano):
+    """
+    Intervalo (inicio, fin) inclusivo pedido en `Range`, o None si se debe enviar el archivo
+    completo (sin cabecera, sintaxis no soportada o varios intervalos).
+    Lanza RangoNoSatisfacible si el intervalo cae fuera del archivo.
+    """
+    if not cabecera:
+        return None
+    coincidencia = RANGO_RE.match(cabecera.strip())
+    if not coincidencia:
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:
+        # Sufijo: los últimos N bytes
+        sufijo = int(fin)
+        if sufijo == 0 or tamano == 0:
+            raise RangoNoSatisfacible()
+        return max(tamano - sufijo, 0), tamano - 1
+    inicio = int(inicio)
+    fin = int(fin) if fin else None
+    if fin is not None and fin < inicio:
+        return None
+    if inicio >= tamano:
+        raise RangoNoSatisfacible()
+    return inicio, tamano - 1 if fin is None else min(fin, tamano - 1)
+
+
+def _if_range_vigente(request, etag, last_modified, fuerte):
+    """
+    If-Range: el rango solo vale si el validador coincide exactamente (ETag fuerte, o la
+    fecha si Last-Modified es fuerte); si no, se envía el archivo completo.
+    """
+    valor = request.META.get('HTTP_IF_RANGE')
+    if not valor:
+        return True
+    valor = valor.strip()
+    if valor.startswith('"') or valor.startswith('W/'):
+        return not etag.startswith('W/') and valor == etag
+    fecha = parse_http_date_safe(valor)
+    return fuerte and fecha is not None and fecha == last_modified
+
+
+def responder_descarga(request, documento, path, filename, content_type):
+    """
+    Respuesta de descarga con validadores y soporte de Range.
+    Returns: HttpResponse (200, 206, 304, 412 o 416) con el atributo `rango`
+    (intervalo servido o delegado al proxy, None si es el archivo completo).
+    """
+    etag = etag_documento(documento, path)
+    last_modified = last_modified_documento(documento, path)
+    validadores = HttpResponse()
+    validadores.headers['ETag'] = etag
+    validadores.headers['Last-Modified'] = http_date(last_modified)
+    # El navegador puede guardar la copia pero debe revalidar siempre (documentos privados)
+    validadores.headers['Cache-Control'] = 'private, no-cache'
+
+    condicional = get_conditional_response(request, etag=etag, last_modified=last_modified, response=validadores)
+    if condicional is not validadores:
+        return condicional
+
+    tamano = os.path.getsize(path)
+    rango = None
+    if _if_range_vigente(request, etag, last_modified, last_modified_fuerte(documento, path)):
+        try:
+            rango = parse_range(request.META.get('HTTP_RANGE'), tamano)
+        except RangoNoSatisfacible:
+            respuesta = HttpResponse(status=416)
+            respuesta.headers['Content-Range'] = f'bytes */{tamano}'
+            respuesta.headers['Accept-Ranges'] = 'bytes'
+            return respuesta
+
+    backend = getattr(settings, 'DOCUMENT_DELIVERY_BACKEND', ENTREGA_PYTHON)
+    if backend == ENTREGA_PYTHON:
+        respuesta = _respuesta_python(path, rango, tamano, filename, content_type)
+    else:
+        respuesta = _respuesta_delegada(backend, path, filename, content_type)
+    respuesta.rango = rango
+    respuesta.headers['Accept-Ranges'] = 'bytes'
+    for cabecera in ('ETag', 'Last-Modified', 'Cache-Control'):
+        respuesta.headers[cabecera] = validadores.headers[cabecera]
+    return respuesta
+
+
+def _respuesta_python(path, rango, tamano, filename, content_type):
+    archivo = open(path, 'rb')
+    if rango is None:
+        respuesta = FileResponse(archivo, as_attachment=True, filename=filename, content_type=content_type)
+    else:
+        inicio, fin = rango
+        archivo.seek(inicio)
+        respuesta = FileResponse(
+            _TramoArchivo(archivo, fin - inicio + 1), status=206,
+            as_attachment=True, filename=filename, content_type=content_type,
+        )
+        respuesta.headers['Content-Length'] = str(fin - inicio + 1)
+        respuesta.headers['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+    respuesta.block_size = getattr(settings, 'DOCUMENT_IO_CHUNK_SIZE', 1024 * 1024)
+    return respuesta
+
+
+def _respuesta_delegada(backend, path, filename, content_type):
+    """
+    Solo cabeceras: el proxy resuelve la redirección interna y envía el archivo con sendfile
+    (incluido el Range de la petición original).
+    """
+    respuesta = HttpResponse(content_type=content_type)
+    respuesta.headers['Content-Disposition'] = content_disposition_header(True, filename)
+    if backend == ENTREGA_X_ACCEL:
+        relativa = os.path.relpath(path, get_document_storage_root()).replace(os.sep, '/')
+        prefijo = getattr(settings, 'DOCUMENT_ACCEL_PREFIX', '/documentos-internos/')
+        respuesta.headers['X-Accel-Redirect'] = prefijo.rstrip('/') + '/' + quote(relativa)
+    elif backend == ENTREGA_X_SENDFILE:
+        respuesta.headers['X-Sendfile'] = path
+    else:
+        raise ImproperlyConfigured(f"DOCUMENT_DELIVERY_BACKEND no soportado: {backend!r}")
+    return respuesta
+
+
+def debe_auditar_descarga(respuesta):
+    """Si la respuesta de descarga debe registrar DESCARGA según DOCUMENT_DOWNLOAD_AUDIT."""
+    politica = getattr(settings, 'DOCUMENT_DOWNLOAD_AUDIT', AUDITAR_COMPLETA)
+    if respuesta.status_code in (200, 206):
+        rango = getattr(respuesta, 'rango', None)
+        return rango is None or politica != AUDITAR_COMPLETA or rango[0] == 0
+    if respuesta.status_code == 304:
+        return politica == AUDITAR_SIEMPRE
+    return False
+
+
+def responder_miniatura(request, checksum, obtener_path):
+    """
+    Miniatura WebP de un contenido. La URL lleva el checksum, así que la respuesta no cambia:
+    caché privada de un año, y 304 si el navegador ya la tiene (sin tocar el disco).
+    obtener_path: callable que devuelve el path de la miniatura (generándola si falta) o None.
+    Returns: HttpResponse (200 o 304) o None si no hay miniatura.
+    """
+    validadores = HttpResponse()
+    validadores.headers['ETag'] = f'"miniatura-{checksum}"'
+    validadores.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    condicional = get_conditional_response(request, etag=validadores.headers['ETag'], response=validadores)
+    if condicional is not validadores:
+        return condicional
+    path = obtener_path()
+    if not path:
+        return None
+    respuesta = FileResponse(open(path, 'rb'), content_type='image/webp')
+    for cabecera in ('ETag', 'Cache-Control'):
+        respuesta.headers[cabecera] = validadores.headers[cabecera]
+    return respuesta
+
+
+def nombre_descarga(documento):
+    """Nombre del archivo entregado: nombre del documento con su extensión."""
+    name = documento.nombre or documento.ruta or 'documento'
+    if documento.extension and not name.endswith('.' + documento.extension):
+        name = f"{name}.{documento.extension}"
+    return name
+
+
+# ==================== ZIP EN FLUJO ====================
+
+# Extensiones ya comprimidas: deflate apenas las reduce y cuesta CPU (ZIP_STORED)
+YA_COMPRIMIDOS = {
+    'pdf', 'docx', 'xlsx', 'pptx', 'odt', 'ods', 'odp', 'zip', '7z', 'rar', 'gz', 'bz2', 'xz',
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic', 'mp3', 'mp4', 'm4a', 'mov', 'avi',
+}
+
+
+class _SalidaZip:
+    """
+    Destino de zipfile sin seek: acumula lo escrito hasta que el generador lo entrega.
+    Sin seek(), ZipFile escribe descriptores de datos tras cada entrada en vez de volver atrás.
+    """
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def _fecha_zip(path):
+    # El formato ZIP no admite fechas anteriores a 1980
+    return max(time.localtime(os.path.getmtime(path))[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def generar_zip(entradas, notas=None):
+    """
+    Genera el ZIP por trozos. entradas: iterable de (nombre_en_zip, path);
+    notas: texto opcional que se añade al final como LEEME.txt.
+    """
+    bloque = getattr(settings, 'DOCUMENT_IO_CHUNK_SIZE', 1024 * 1024)
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, 'w', allowZip64=True) as zf:
+        for nombre, path in entradas:
+            info = zipfile.ZipInfo(nombre, date_time=_fecha_zip(path))
+            extension = nombre.rsplit('.', 1)[-1].lower() if '.' in nombre else ''
+            info.compress_type = zipfile.ZIP_STORED if extension in YA_COMPRIMIDOS else zipfile.ZIP_DEFLATED
+            info.file_size = os.path.getsize(path)  # decide si la entrada necesita ZIP64
+            with open(path, 'rb') as origen, zf.open(info, 'w') as destino:
+                for chunk in iter(lambda: origen.read(bloque), b''):
+                    destino.write(chunk)
+                    datos = salida.vaciar()
+                    if datos:
+                        yield datos
+            yield salida.vaciar()
+        if notas:
+            zf.writestr('LEEME.txt', notas, compress_type=zipfile.ZIP_DEFLATED)
+    yield salida.vaciar()
+
+
+def _nombre_seguro(nombre, por_defecto):
+    return nombre.replace('/', '_').replace('\\', '_').strip().lstrip('.') or por_defecto
+
+
+def nombres_en_zip(nombres):
+    """
+    Nombres de entrada únicos y sin separadores de ruta ('a.pdf', 'a (2).pdf', ...).
+    nombres: iterable de (carpeta o None, nombre); la carpeta se usa como subdirectorio.
+    """
+    usados = set()
+    for carpeta, nombre in nombres:
+        nombre = _nombre_seguro(nombre, 'documento')
+        prefijo = _nombre_seguro(carpeta, 'carpeta') + '/' if carpeta else ''
+        base, punto, extension = nombre.rpartition('.')
+        candidato, n = prefijo + nombre, 1
+        while candidato.lower() in usados:
+            n += 1
+            candidato = f"{prefijo}{base} ({n}).{extension}" if punto else f"{prefijo}{nombre} ({n})"
+        usados.add(candidato.lower())
+        yield candidato
+
+
+def responder_zip(entradas, filename, notas=None):
+    """StreamingHttpResponse con el ZIP de `entradas` [(nombre_en_zip, path)]."""
+    respuesta = StreamingHttpResponse(generar_zip(entradas, notas), content_type='application/zip')
+    respuesta['Content-Disposition'] = content_disposition_header(True, filename)
+    respuesta['Cache-Control'] = 'private, no-store'
+    return respuesta
@@ -1,15 +1,26 @@
 """
 Servicio centralizado para subida, descarga y eliminación de documentos.
 - Archivos en ruta privada (no servidos por URL directa).
-- Nombre físico UUID; solo metadata en BD.
+- Nombre físico UUID en subdirectorios <aa>/<bb>/ (DOCUMENT_STORAGE_SHARDED); solo metadata en BD.
 - Checksum SHA-256 y auditoría obligatoria.
+- Modo deduplicado opcional (DOCUMENT_STORAGE_DEDUP): el contenido se guarda una sola vez
+  en cas/<aa>/<bb>/<sha256> y ArchivoDocumento cuenta los Documento que lo referencian.
+- Al guardar se encola la miniatura del contenido (ver api/miniaturas.py).
+- El tipo MIME se detecta por contenido en la misma pasada y se valida contra la extensión
+  y DOCUMENT_MIME_POLICY (ver api/tipos_mime.py).
 """
 import os
 import uuid
 import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from django.conf import settings
 from django.core.files.uploadedfile import UploadedFile
+from django.db import connections, transaction
+from django.db.models import F
+
+from . import auditoria, tipos_mime
 
 logger = logging.getLogger(__name__)
 
@@ -31,19 +42,25 @@ def _ensure_storage_dir():
     return root
 
 
+def _chunk_size():
+    """Tamaño de bloque para leer/escribir archivos (por defecto 1 MiB)."""
+    return getattr(settings, 'DOCUMENT_IO_CHUNK_SIZE', 1024 * 1024)
+
+
 def compute_sha256(file_path_or_content):
     """
     Calcula SHA-256 de un archivo (ruta) o de contenido en memoria.
     Retorna string hex de 64 caracteres.
     """
     hasher = hashlib.sha256()
+    bloque = _chunk_size()
     if isinstance(file_path_or_content, (str, os.PathLike)) and os.path.isfile(file_path_or_content):
         with open(file_path_or_content, 'rb') as f:
-            for chunk in iter(lambda: f.read(8192), b''):
+            for chunk in iter(lambda: f.read(bloque), b''):
                 hasher.update(chunk)
     else:
         if hasattr(file_path_or_content, 'read'):
-            for chunk in iter(lambda: file_path_or_content.read(8192), b''):
+            for chunk in iter(lambda: file_path_or_content.read(bloque), b''):
                 hasher.update(chunk)
             file_path_or_content.seek(0)
         else:
@@ -51,62 +68,360 @@ def compute_sha256(file_path_or_content):
     return hasher.hexdigest()
 
 
-def save_uploaded_file(uploaded_file, nombre_logico=None):
+def _write_stream_temp(chunks, directorio, fsync=False):
     """
-    Guarda un archivo subido en la ruta privada con nombre físico UUID.
-    No guarda nada en la BD.
-    Returns: dict con ruta_relativa, extension, tamano_bytes, checksum_sha256
+    Escribe `chunks` en un temporal de `directorio` calculando SHA-256 y tamaño en la misma pasada.
+    Si falla, borra el temporal. Returns: (ruta_temporal, tamano_bytes, checksum_sha256)
     """
-    if not uploaded_file or not hasattr(uploaded_file, 'read'):
-        raise ValueError("Se requiere un archivo subido válido")
-    root = _ensure_storage_dir()
-    ext = ""
-    if nombre_logico and "." in nombre_logico:
-        ext = "." + nombre_logico.rsplit(".", 1)[-1].lower()
-    elif getattr(uploaded_file, 'name', None) and "." in uploaded_file.name:
-        ext = "." + uploaded_file.name.rsplit(".", 1)[-1].lower()
-    nombre_fisico = f"{uuid.uuid4().hex}{ext}"
-    ruta_completa = os.path.join(root, nombre_fisico)
-    # Guardar archivo en disco
-    with open(ruta_completa, 'wb') as dest:
-        for chunk in uploaded_file.chunks():
-            dest.write(chunk)
-    tamano = os.path.getsize(ruta_completa)
-    checksum = compute_sha256(ruta_completa)
-    ruta_relativa = nombre_fisico
+    temporal = os.path.join(directorio, f".subida-{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    tamano = 0
+    try:
+        with open(temporal, 'xb') as dest:
+            for chunk in chunks:
+                hasher.update(chunk)
+                dest.write(chunk)
+                tamano += len(chunk)
+            if fsync:
+                dest.flush()
+                os.fsync(dest.fileno())
+    except BaseException:
+        _remove_quietly(temporal)
+        raise
+    return temporal, tamano, hasher.hexdigest()
+
+
+def _fsync_dir(directorio):
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directorio, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def write_stream_atomic(chunks, ruta_destino, fsync=None):
+    """
+    Escribe `chunks` en una sola pasada: calcula SHA-256 y tamaño mientras escribe
+    en un temporal del mismo directorio y luego lo renombra atómicamente al destino.
+    Si falla, no queda ni el temporal ni un archivo parcial en `ruta_destino`.
+    fsync (por defecto DOCUMENT_STORAGE_FSYNC) fuerza los datos a disco antes del rename.
+    Returns: (tamano_bytes, checksum_sha256)
+    """
+    if fsync is None:
+        fsync = getattr(settings, 'DOCUMENT_STORAGE_FSYNC', False)
+    directorio = os.path.dirname(ruta_destino)
+    temporal, tamano, checksum = _write_stream_temp(chunks, directorio, fsync)
+    try:
+        os.replace(temporal, ruta_destino)
+    except BaseException:
+        _remove_quietly(temporal)
+        raise
+    if fsync:
+        _fsync_dir(directorio)
+    return tamano, checksum
+
+
+# ==================== REPARTO EN SUBDIRECTORIOS ====================
+
+def sharding_enabled():
+    return getattr(settings, 'DOCUMENT_STORAGE_SHARDED', True)
+
+
+def sharded_relative_path(nombre):
+    """Ruta relativa repartida por los dos primeros pares hex del nombre: ab/cd/abcd....ext"""
+    return '/'.join((nombre[:2], nombre[2:4], nombre))
+
+
+def is_flat_path(ruta):
+    """True si la ruta es un nombre plano en la raíz (formato anterior al reparto)."""
+    return bool(ruta) and '/' not in ruta.strip().replace('\\', '/')
+
+
+# ==================== ALMACENAMIENTO DEDUPLICADO (CAS) ====================
+
+CAS_DIR = 'cas'
+
+
+def dedup_enabled():
+    return getattr(settings, 'DOCUMENT_STORAGE_DEDUP', False)
+
+
+def cas_relative_path(checksum):
+    """Ruta relativa del contenido con ese SHA-256: cas/ab/cd/abcd..."""
+    return '/'.join((CAS_DIR, checksum[:2], checksum[2:4], checksum))
+
+
+def is_cas_path(ruta):
+    return bool(ruta) and ruta.replace('\\', '/').startswith(CAS_DIR + '/')
+
+
+def publish_blob(temporal, checksum, tamano):
+    """
+    Publica un temporal ya hasheado en el almacén CAS y suma una referencia.
+    Si el contenido ya existía, descarta el temporal (no se duplica en disco).
+    El bloqueo de la fila ArchivoDocumento serializa la operación con release_blob.
+    Returns: ruta relativa del contenido.
+    """
+    from .models import ArchivoDocumento
+    ruta = cas_relative_path(checksum)
+    destino = os.path.join(get_document_storage_root(), *ruta.split('/'))
+    try:
+        with transaction.atomic():
+            ArchivoDocumento.objects.select_for_update().get_or_create(
+                checksum_sha256=checksum, defaults={'ruta': ruta, 'tamano_bytes': tamano},
+            )
+            if os.path.isfile(destino):
+                _remove_quietly(temporal)
+            else:
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                os.replace(temporal, destino)
+            ArchivoDocumento.objects.filter(pk=checksum).update(referencias=F('referencias') + 1)
+    except BaseException:
+        _remove_quietly(temporal)
+        raise
+    return ruta
+
+
+def release_blob(ruta):
+    """
+    Resta una referencia al contenido CAS. Al soltar la última, el archivo se borra tras el
+    commit (_borrar_blob): si la transacción se revierte, la referencia y el archivo siguen.
+    Si no hay fila ArchivoDocumento, solo se borra si ningún Documento usa ya esa ruta.
+    Returns: si era la última referencia.
+    """
+    from .models import ArchivoDocumento, Documento
+    checksum = ruta.rsplit('/', 1)[-1]
+    with transaction.atomic():
+        blob = ArchivoDocumento.objects.select_for_update().filter(pk=checksum).first()
+        if blob is None and Documento.objects.filter(ruta=ruta).exists():
+            return False
+        if blob is not None:
+            ArchivoDocumento.objects.filter(pk=checksum, referencias__gt=0).update(referencias=F('referencias') - 1)
+            if blob.referencias > 1:
+                return False
+        transaction.on_commit(partial(_borrar_blob, ruta))
+    return True
+
+
+def _borrar_blob(ruta):
+    """
+    Borra el contenido CAS que quedó sin referencias y su fila. Vuelve a bloquear la fila:
+    si publish_blob sumó una referencia entretanto (el mismo contenido subido otra vez),
+    el archivo se conserva.
+    """
+    from .models import ArchivoDocumento
+    checksum = ruta.rsplit('/', 1)[-1]
+    path = resolve_storage_path(ruta)
+    try:
+        with transaction.atomic():
+            blob = ArchivoDocumento.objects.select_for_update().filter(pk=checksum).first()
+            if blob is not None:
+                if blob.referencias > 0:
+                    return
+                blob.delete()
+            if path and os.path.isfile(path):
+                os.remove(path)
+                logger.info("Contenido CAS eliminado: %s", path)
+    except OSError as e:
+        # Queda como huérfano para limpiar_huerfanos
+        logger.warning("No se pudo eliminar contenido %s: %s", ruta, e)
+
+
+def _extension(nombre_logico, nombre_archivo=None):
+    """Extensión en minúsculas con punto ('.pdf') del nombre lógico o del archivo, o ''."""
+    for nombre in (nombre_logico, nombre_archivo):
+        if nombre and "." in nombre:
+            return "." + nombre.rsplit(".", 1)[-1].lower()
+    return ""
+
+
+def _resultado_guardado(root, ruta_relativa, ext, tamano, checksum, mime_type=None):
     extension = ext.lstrip(".") if ext else None
+    from . import miniaturas
+    miniaturas.programar(os.path.join(root, *ruta_relativa.split('/')), checksum, extension)
     return {
         "ruta": ruta_relativa,
         "extension": extension,
         "tamano_bytes": tamano,
         "checksum_sha256": checksum,
+        "mime_type": mime_type,
     }
 
 
+def _con_tipo(chunks, nombre, nivel_sensibilidad, resultado):
+    """
+    Deja pasar `chunks` tras validar su tipo (tipos_mime.validar) con la cabecera de los
+    primeros bloques, retenidos hasta entonces: un tipo rechazado no llega a escribirse.
+    Deja el tipo en resultado['mime_type'].
+    """
+    retenidos = []
+    cabecera = b''
+    for chunk in chunks:
+        if 'mime_type' in resultado:
+            yield chunk
+            continue
+        retenidos.append(chunk)
+        cabecera += chunk[:tipos_mime.TAMANO_CABECERA - len(cabecera)]
+        if len(cabecera) >= tipos_mime.TAMANO_CABECERA:
+            resultado['mime_type'] = tipos_mime.validar(cabecera, nombre, nivel_sensibilidad)
+            yield from retenidos
+            retenidos = []
+    if 'mime_type' not in resultado:
+        resultado['mime_type'] = tipos_mime.validar(cabecera, nombre, nivel_sensibilidad)
+        yield from retenidos
+
+
+def _nueva_ruta_relativa(ext):
+    ruta_relativa = f"{uuid.uuid4().hex}{ext}"
+    if sharding_enabled():
+        ruta_relativa = sharded_relative_path(ruta_relativa)
+    return ruta_relativa
+
+
+def save_uploaded_file(uploaded_file, nombre_logico=None, nivel_sensibilidad=None):
+    """
+    Guarda un archivo subido en la ruta privada con nombre físico UUID, en <aa>/<bb>/
+    si DOCUMENT_STORAGE_SHARDED (o en el almacén CAS si DOCUMENT_STORAGE_DEDUP está activo).
+    Una sola pasada: escribe, cuenta, calcula el checksum y detecta el tipo a la vez (ver
+    write_stream_atomic). Lanza tipos_mime.TipoNoPermitido (ValueError) si el contenido no
+    corresponde a la extensión o no se admite para `nivel_sensibilidad`.
+    No guarda nada en la BD.
+    Returns: dict con ruta_relativa, extension, tamano_bytes, checksum_sha256, mime_type
+    """
+    if not uploaded_file or not hasattr(uploaded_file, 'read'):
+        raise ValueError("Se requiere un archivo subido válido")
+    root = _ensure_storage_dir()
+    nombre = nombre_logico or getattr(uploaded_file, 'name', None)
+    ext = _extension(nombre_logico, getattr(uploaded_file, 'name', None))
+    tipo = {}
+    chunks = _con_tipo(uploaded_file.chunks(chunk_size=_chunk_size()), nombre, nivel_sensibilidad, tipo)
+    if dedup_enabled():
+        fsync = getattr(settings, 'DOCUMENT_STORAGE_FSYNC', False)
+        temporal, tamano, checksum = _write_stream_temp(chunks, root, fsync)
+        ruta_relativa = publish_blob(temporal, checksum, tamano)
+    else:
+        ruta_relativa = _nueva_ruta_relativa(ext)
+        destino = os.path.join(root, *ruta_relativa.split('/'))
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        tamano, checksum = write_stream_atomic(chunks, destino)
+    return _resultado_guardado(root, ruta_relativa, ext, tamano, checksum, tipo['mime_type'])
+
+
+def publish_staged_file(temporal, tamano, checksum, nombre_logico=None, mime_type=None):
+    """
+    Publica un temporal de la raíz de almacenamiento ya escrito, hasheado y con el tipo
+    validado (subida por fragmentos, ver api/subidas.py): lo renombra a su ruta definitiva
+    o al almacén CAS.
+    Returns: el mismo dict que save_uploaded_file.
+    """
+    root = _ensure_storage_dir()
+    ext = _extension(nombre_logico)
+    fsync = getattr(settings, 'DOCUMENT_STORAGE_FSYNC', False)
+    if fsync:
+        with open(temporal, 'rb') as f:
+            os.fsync(f.fileno())
+    if dedup_enabled():
+        ruta_relativa = publish_blob(temporal, checksum, tamano)
+    else:
+        ruta_relativa = _nueva_ruta_relativa(ext)
+        destino = os.path.join(root, *ruta_relativa.split('/'))
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        os.replace(temporal, destino)
+        if fsync:
+            _fsync_dir(os.path.dirname(destino))
+    return _resultado_guardado(root, ruta_relativa, ext, tamano, checksum, mime_type)
+
+
+def save_uploaded_files(archivos, max_workers=None, nivel_sensibilidad=None):
+    """
+    save_uploaded_file de varios archivos a la vez en un pool de hilos: la escritura y el
+    SHA-256 (hashlib) liberan el GIL, así que los archivos se procesan en paralelo.
+    Returns: lista en el orden de `archivos`, con el dict de save_uploaded_file o la
+    excepción (ValueError/OSError) de cada uno.
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'DOCUMENT_BULK_UPLOAD_WORKERS', 4)
+
+    def _guardar(archivo):
+        try:
+            return save_uploaded_file(
+                archivo, nombre_logico=getattr(archivo, 'name', None), nivel_sensibilidad=nivel_sensibilidad,
+            )
+        except (ValueError, OSError) as e:
+            logger.warning("No se pudo guardar %s: %s", getattr(archivo, 'name', ''), e)
+            return e
+
+    def _guardar_en_hilo(archivo):
+        try:
+            return _guardar(archivo)
+        finally:
+            # publish_blob (modo CAS) abre una conexión a la BD propia de cada hilo
+            connections.close_all()
+
+    if max_workers <= 1 or len(archivos) <= 1:
+        return [_guardar(a) for a in archivos]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(archivos))) as pool:
+        return list(pool.map(_guardar_en_hilo, archivos))
+
+
+def resolve_storage_path(ruta):
+    """
+    Ruta absoluta de una ruta relativa al almacenamiento ('UUID.ext' o 'cas/ab/cd/sha').
+    Rechaza rutas absolutas o con '..' (path traversal). No comprueba que exista.
+    """
+    if not ruta:
+        return None
+    partes = [p for p in ruta.strip().replace('\\', '/').split('/') if p not in ('', '.')]
+    if not partes or '..' in partes or os.path.isabs(ruta.strip()):
+        return None
+    root = os.path.abspath(get_document_storage_root())
+    path = os.path.abspath(os.path.join(root, *partes))
+    if os.path.commonpath([root, path]) != root:
+        return None
+    return path
+
+
 def get_document_file_path(documento):
     """
     Obtiene la ruta absoluta en disco del archivo de un documento.
-    documento.ruta debe ser el nombre relativo (UUID.ext).
+    documento.ruta es el nombre relativo (ab/cd/UUID.ext, UUID.ext plano o cas/ab/cd/sha256).
+    Si no está donde indica la ruta, prueba la ubicación repartida y la plana del mismo
+    nombre: reorganizar_almacenamiento puede haber movido el archivo con la fila ya leída.
     Returns: str path absoluto o None si no existe.
     """
     if not documento or not documento.ruta:
         return None
-    root = get_document_storage_root()
-    # Evitar path traversal
-    nombre = os.path.basename(documento.ruta.strip())
-    if not nombre:
-        return None
-    path = os.path.join(root, nombre)
-    if not os.path.abspath(path).startswith(os.path.abspath(root)):
-        return None
-    return path if os.path.isfile(path) else None
+    path = resolve_storage_path(documento.ruta)
+    if path and os.path.isfile(path):
+        return path
+    nombre = os.path.basename(documento.ruta.strip().replace('\\', '/'))
+    for alternativa in (sharded_relative_path(nombre), nombre):
+        legado = resolve_storage_path(alternativa)
+        if legado and legado != path and os.path.isfile(legado):
+            return legado
+    return None
 
 
 def delete_document_file(documento):
     """
     Elimina el archivo físico del documento si existe.
+    En el almacén CAS solo se borra al soltar la última referencia.
     No borra el registro en BD ni registra auditoría (eso lo hace la vista).
     """
+    if documento and is_cas_path(documento.ruta):
+        try:
+            release_blob(documento.ruta.replace('\\', '/'))
+        except OSError as e:
+            logger.warning("No se pudo liberar contenido %s: %s", documento.ruta, e)
+        return
     path = get_document_file_path(documento)
     if path and os.path.isfile(path):
         try:
@@ -116,25 +431,45 @@ def delete_document_file(documento):
             logger.warning("No se pudo eliminar archivo %s: %s", path, e)
 
 
+def discard_uploaded_file(ruta):
+    """
+    Deshace save_uploaded_file cuando el Documento no llega a crearse: borra el archivo
+    (o suelta la referencia CAS que se sumó al guardarlo).
+    """
+    if not ruta:
+        return
+    try:
+        if is_cas_path(ruta):
+            release_blob(ruta.replace('\\', '/'))
+            return
+        path = resolve_storage_path(ruta)
+        if path and os.path.isfile(path):
+            os.remove(path)
+    except OSError as e:
+        logger.warning("No se pudo descartar el archivo %s: %s", ruta, e)
+
+
 def registrar_auditoria_documento(accion, documento, usuario, request=None):
     """
-    Registra una acción en Auditoria_Documento.
+    Registra una acción en Auditoria_Documento (en lote y fuera de la petición si AUDIT_ASYNC;
+    ver api/auditoria.py).
     accion: 'SUBIDA' | 'DESCARGA' | 'ELIMINADO'
     """
-    from .models import AuditoriaDocumento
-    ip = None
-    if request:
-        xff = request.META.get('HTTP_X_FORWARDED_FOR')
-        if xff:
-            ip = xff.split(',')[0].strip()
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-    AuditoriaDocumento.objects.create(
-        documento=documento,
-        usuario=usuario,
-        accion=accion,
-        ip_origen=ip,
-    )
+    auditoria.registrar(documento.pk, usuario.pk, accion, ip_origen=_ip_origen(request))
+
+
+def registrar_auditoria_documentos(accion, documentos, usuario, request=None):
+    """Como registrar_auditoria_documento para varios documentos, con una sola inserción."""
+    auditoria.registrar_varios([d.pk for d in documentos], usuario.pk, accion, ip_origen=_ip_origen(request))
+
+
+def _ip_origen(request):
+    if not request:
+        return None
+    xff = request.META.get('HTTP_X_FORWARDED_FOR')
+    if xff:
+        return xff.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR')
 
 
 def user_can_access_document(user, documento):
@@ -147,15 +482,10 @@ def user_can_access_document(user, documento):
     """
     if not user or not user.is_authenticated:
         return False
-    from .models import User
-    try:
-        user = User.objects.select_related('rol').get(pk=user.pk)
-    except User.DoesNotExist:
-        return False
-    rol_tipo = (user.rol.tipo or '').lower() if user.rol else ''
-    is_admin_or_tha = rol_tipo in ('administrador', 'tha')
+    from .authentication import Principal
+    principal = Principal.for_user(user)
     # Administrador y THA tienen autorización total sobre todos los documentos
-    if is_admin_or_tha:
+    if principal.is_admin_or_tha:
         return True
     nivel = (documento.nivel_sensibilidad or 'CONFIDENCIAL').upper()
     if nivel == 'PUBLICO':
@@ -163,9 +493,9 @@ def user_can_access_document(user, documento):
     if nivel == 'RESTRINGIDO':
         return False
     if nivel == 'CONFIDENCIAL':
-        if documento.caso and documento.caso.responsable_id == user.pk:
+        if documento.caso and documento.caso.responsable_id == principal.user_id:
             return True
-        if documento.usuario_creador_id == user.pk:
+        if documento.usuario_creador_id == principal.user_id:
             return True
         return False
     return False
@@ -0,0 +1,149 @@
+"""
+Variantes de Empleado.foto para el directorio: tamaños fijos (VARIANTES) en WebP y JPEG,
+sin metadatos EXIF (ubicación GPS, cámara) y con la orientación EXIF ya aplicada.
+- Se generan tras guardar un Empleado cuya foto cambió (señal post_save), en un pool de
+  hilos del proceso (EMPLEADO_FOTO_WORKERS; 0 = en el mismo hilo, tras el commit).
+- Empleado.foto_variantes guarda la foto de origen y los nombres generados; si la foto
+  cambia, se generan otras (nombres nuevos: URLs cacheables sin caducidad) y se borran
+  las anteriores.
+- Para las fotos existentes: python manage.py generar_variantes_fotos
+Las variantes se guardan en el mismo storage que la foto (MEDIA_ROOT por defecto).
+"""
+import io
+import logging
+import os
+import posixpath
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Lado máximo (px) de cada variante; nunca se amplía una foto más pequeña
+VARIANTES = {'full': 1280, 'card': 320, 'thumb': 96}
+FORMATOS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def generar_variantes(nombre_foto, storage=None):
+    """
+    Genera las variantes de la foto `nombre_foto` (nombre en el storage).
+    No toca la BD: se puede ejecutar en otro proceso.
+    Returns: dict para Empleado.foto_variantes ({'origen', 'variantes': {variante: {...}}}).
+    """
+    from PIL import Image, ImageOps
+    storage = storage or default_storage
+    directorio, archivo = posixpath.split(nombre_foto)
+    base = posixpath.join(directorio, 'variantes', f"{os.path.splitext(archivo)[0]}-{uuid.uuid4().hex[:8]}")
+    with storage.open(nombre_foto, 'rb') as f:
+        with Image.open(f) as original:
+            # JPEG: decodificar ya reducido a la escala más cercana a la variante mayor
+            original.draft('RGB', (max(VARIANTES.values()),) * 2)
+            imagen = ImageOps.exif_transpose(original)
+    if imagen.mode != 'RGB':
+        # JPEG no admite transparencia: se aplana sobre blanco
+        rgba = imagen.convert('RGBA')
+        imagen = Image.new('RGB', rgba.size, 'white')
+        imagen.paste(rgba, mask=rgba.getchannel('A'))
+    variantes = {}
+    # De mayor a menor: cada variante se reduce desde la anterior, no desde el original
+    for variante, lado in sorted(VARIANTES.items(), key=lambda v: -v[1]):
+        imagen.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+        datos = {'ancho': imagen.width, 'alto': imagen.height}
+        for extension, (formato, opciones) in FORMATOS.items():
+            salida = io.BytesIO()
+            imagen.save(salida, formato, **opciones)  # sin exif=: los metadatos no se copian
+            datos[extension] = storage.save(f"{base}/{variante}.{extension}", ContentFile(salida.getvalue()))
+        variantes[variante] = datos
+    return {'origen': nombre_foto, 'variantes': variantes}
+
+
+def nombres_generados(foto_variantes):
+    """Nombres en el storage de todas las variantes registradas."""
+    for datos in ((foto_variantes or {}).get('variantes') or {}).values():
+        for extension in FORMATOS:
+            if datos.get(extension):
+                yield datos[extension]
+
+
+def borrar_variantes(foto_variantes, storage=None):
+    storage = storage or default_storage
+    for nombre in nombres_generados(foto_variantes):
+        try:
+            storage.delete(nombre)
+        except OSError as e:
+            logger.warning("No se pudo borrar la variante %s: %s", nombre, e)
+
+
+def pendiente(empleado):
+    """Si las variantes registradas no corresponden a la foto actual."""
+    origen = (empleado.foto_variantes or {}).get('origen')
+    return (empleado.foto.name or None) != origen
+
+
+def registrar_variantes(empleado_id, nombre_foto, nuevas):
+    """
+    Guarda `nuevas` (variantes de `nombre_foto`) en el empleado y borra las que tenía. Si su
+    foto ya no es `nombre_foto` (cambió mientras se generaban), se descartan las nuevas.
+    Returns: si se registraron.
+    """
+    from django.db import transaction
+    from .models import Empleado
+    with transaction.atomic():
+        fila = Empleado.objects.select_for_update().filter(pk=empleado_id).values('foto', 'foto_variantes').first()
+        vigente = fila is not None and (fila['foto'] or None) == nombre_foto
+        if vigente:
+            Empleado.objects.filter(pk=empleado_id).update(foto_variantes=nuevas)
+    borrar_variantes(fila['foto_variantes'] if vigente else nuevas)
+    return vigente
+
+
+def actualizar_empleado(empleado_id, nombre_foto):
+    """Genera y registra las variantes de la foto `nombre_foto` del empleado."""
+    nuevas = generar_variantes(nombre_foto) if nombre_foto else None
+    registrar_variantes(empleado_id, nombre_foto, nuevas)
+    return nuevas
+
+
+def _actualizar(empleado_id, nombre_foto):
+    """actualizar_empleado sin propagar errores: una foto ilegible no rompe el guardado."""
+    try:
+        return actualizar_empleado(empleado_id, nombre_foto)
+    except Exception:
+        logger.exception("No se pudieron generar las variantes de la foto de Empleado %s", empleado_id)
+        return None
+
+
+def _actualizar_en_hilo(empleado_id, nombre_foto):
+    try:
+        _actualizar(empleado_id, nombre_foto)
+    finally:
+        connections.close_all()
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'EMPLEADO_FOTO_WORKERS', 2), thread_name_prefix='fotos',
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def programar(empleado):
+    """Encola la regeneración de variantes si la foto del empleado cambió (tras el commit)."""
+    if not pendiente(empleado):
+        return None
+    argumentos = (empleado.pk, empleado.foto.name or None)
+    if getattr(settings, 'EMPLEADO_FOTO_WORKERS', 2) <= 0:
+        return _actualizar(*argumentos)
+    return _get_pool().submit(_actualizar_en_hilo, *argumentos)
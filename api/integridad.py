@@ -0,0 +1,189 @@
+"""
+Verificación de integridad del almacenamiento de documentos (ver `manage.py verificar_integridad`).
+- verificar_archivo: recalcula SHA-256 y tamaño de un archivo en un proceso del pool, con
+  búfer grande reutilizado (readinto) y límite de lectura por proceso (bytes/s).
+- recorrer_almacenamiento / archivos_huerfanos: listado ordenado del disco cruzado por mezcla
+  con las rutas de la BD, ambos en flujo (sin cargar todo en memoria). Lo usa también
+  `manage.py limpiar_huerfanos`.
+Las funciones que corren en el pool no usan la BD ni los modelos.
+"""
+import hashlib
+import os
+import time
+
+# Estado de cada proceso del pool (ver iniciar_trabajador)
+_bytes_por_segundo = 0
+_bufer = None
+_leidos = 0
+_inicio = None
+
+ESTADO_OK = 'ok'
+ESTADO_FALTANTE = 'faltante'
+ESTADO_CORRUPTO = 'corrupto'
+ESTADO_TAMANO = 'tamano_distinto'
+ESTADO_SIN_CHECKSUM = 'sin_checksum'
+ESTADO_ERROR = 'error_lectura'
+
+
+def iniciar_trabajador(bytes_por_segundo, tamano_bufer, prioridad=0):
+    """Initializer del pool: cuota de lectura de este proceso, búfer y prioridad de CPU."""
+    global _bytes_por_segundo, _bufer, _leidos, _inicio
+    _bytes_por_segundo = bytes_por_segundo
+    _bufer = bytearray(tamano_bufer)
+    _leidos = 0
+    _inicio = time.monotonic()
+    if prioridad:
+        try:
+            os.nice(prioridad)
+        except OSError:
+            pass
+
+
+def _regular(leidos):
+    """Duerme lo necesario para no superar _bytes_por_segundo de media en este proceso."""
+    global _leidos
+    _leidos += leidos
+    if _bytes_por_segundo <= 0:
+        return
+    adelanto = _leidos / _bytes_por_segundo - (time.monotonic() - _inicio)
+    if adelanto > 0:
+        time.sleep(adelanto)
+
+
+def _aconsejar(fd, consejo):
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, 0, 0, consejo)
+        except OSError:
+            pass
+
+
+def hash_archivo(path):
+    """
+    SHA-256 y tamaño leídos en una pasada. Lectura secuencial; al terminar se pide al kernel
+    que suelte esas páginas de la caché para no desplazar los archivos que se están sirviendo.
+    Returns: (checksum_hex, tamano_bytes)
+    """
+    if _bufer is None:
+        iniciar_trabajador(0, 8 * 1024 * 1024)
+    hasher = hashlib.sha256()
+    vista = memoryview(_bufer)
+    tamano = 0
+    with open(path, 'rb', buffering=0) as f:
+        fd = f.fileno()
+        _aconsejar(fd, getattr(os, 'POSIX_FADV_SEQUENTIAL', 0))
+        try:
+            while True:
+                n = f.readinto(vista)
+                if not n:
+                    break
+                hasher.update(vista[:n])
+                tamano += n
+                _regular(n)
+        finally:
+            _aconsejar(fd, getattr(os, 'POSIX_FADV_DONTNEED', 0))
+    return hasher.hexdigest(), tamano
+
+
+def verificar_archivo(tarea):
+    """
+    tarea: (path, tamano_esperado, checksum_esperado); path None = no se encontró el archivo.
+    Returns: (estado, checksum_calculado, tamano_calculado, detalle)
+    """
+    path, tamano_esperado, checksum_esperado = tarea
+    if not path:
+        return ESTADO_FALTANTE, None, None, ''
+    try:
+        checksum, tamano = hash_archivo(path)
+    except FileNotFoundError:
+        return ESTADO_FALTANTE, None, None, ''
+    except OSError as e:
+        return ESTADO_ERROR, None, None, str(e)
+    if not checksum_esperado:
+        return ESTADO_SIN_CHECKSUM, checksum, tamano, ''
+    if checksum != checksum_esperado.lower():
+        return ESTADO_CORRUPTO, checksum, tamano, f'esperado {checksum_esperado}'
+    if tamano_esperado is not None and tamano != tamano_esperado:
+        return ESTADO_TAMANO, checksum, tamano, f'esperado {tamano_esperado} bytes'
+    return ESTADO_OK, checksum, tamano, ''
+
+
+def normalizar_ruta(ruta):
+    return ruta.strip().replace('\\', '/') if ruta else ''
+
+
+PREFIJO_TEMPORAL = '.subida-'
+
+
+def recorrer_almacenamiento(root, relativa='', temporales=False, excluir=()):
+    """
+    Rutas relativas ('ab/cd/UUID.ext') de los archivos bajo root, en orden de bytes de la
+    ruta completa: cada directorio se ordena como si su nombre terminara en '/', igual que
+    lo compara ORDER BY ... COLLATE "C". Omite nombres que empiezan por '.' (temporales de
+    subida, bloqueos) salvo, con temporales=True, los '.subida-*' de subidas interrumpidas.
+    excluir: directorios de primer nivel que no se recorren (p. ej. 'miniaturas').
+    """
+    directorio = os.path.join(root, *relativa.split('/')) if relativa else root
+    try:
+        with os.scandir(directorio) as it:
+            entradas = [
+                (e.name + '/' if e.is_dir(follow_symlinks=False) else e.name, e)
+                for e in it
+                if (not e.name.startswith('.') or (temporales and e.name.startswith(PREFIJO_TEMPORAL)))
+                and not (not relativa and e.name in excluir)
+            ]
+    except FileNotFoundError:
+        return
+    entradas.sort(key=lambda par: par[0].encode('utf-8', 'surrogateescape'))
+    for clave, entrada in entradas:
+        ruta = f'{relativa}/{entrada.name}' if relativa else entrada.name
+        if clave.endswith('/'):
+            yield from recorrer_almacenamiento(root, ruta, temporales)
+        elif entrada.is_file(follow_symlinks=False):
+            yield ruta
+
+
+def archivos_huerfanos(archivos, rutas_bd):
+    """
+    Mezcla dos secuencias ordenadas por bytes (archivos en disco y rutas en BD, sin repetir)
+    y devuelve las rutas de disco que no aparecen en la BD.
+    """
+    def clave(ruta):
+        return ruta.encode('utf-8', 'surrogateescape')
+
+    rutas_bd = iter(rutas_bd)
+    actual = next(rutas_bd, None)
+    for archivo in archivos:
+        k = clave(archivo)
+        while actual is not None and clave(actual) < k:
+            actual = next(rutas_bd, None)
+        if actual is None or clave(actual) != k:
+            yield archivo
+
+
+def valores_en_bd(campo, tamano_lote=2000):
+    """
+    Valores distintos y normalizados de Documento.<campo>, ordenados por bytes (COLLATE "C"
+    en PostgreSQL, BINARY en SQLite). Se leen con iterator(): en PostgreSQL, cursor del lado
+    del servidor.
+    """
+    from django.db import connection
+    from django.db.models.functions import Collate
+    from .models import Documento
+    colacion = 'C' if connection.vendor == 'postgresql' else 'BINARY'
+    consulta = (
+        Documento.objects.exclude(**{f'{campo}__isnull': True}).exclude(**{campo: ''})
+        .annotate(valor_orden=Collate(campo, colacion)).order_by('valor_orden')
+        .values_list(campo, flat=True).distinct()
+    )
+    anterior = None
+    for valor in consulta.iterator(chunk_size=tamano_lote):
+        valor = normalizar_ruta(valor)
+        if valor and valor != anterior:
+            yield valor
+            anterior = valor
+
+
+def rutas_en_bd(tamano_lote=2000):
+    """Documento.ruta distintas, en el orden de recorrer_almacenamiento."""
+    return valores_en_bd('ruta', tamano_lote)
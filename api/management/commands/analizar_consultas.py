@@ -0,0 +1,84 @@
+"""
+Ejecuta EXPLAIN sobre las consultas representativas de cada viewset (filtros + primera
+página) y reporta las que hacen recorridos secuenciales.
+Uso: python manage.py analizar_consultas [--analyze] [--verbose-plan]
+Nota: con tablas pequeñas el planificador de PostgreSQL prefiere Seq Scan aunque exista
+el índice; ejecutar contra una BD con volumen real (o con ANALYZE reciente).
+"""
+import re
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api import views
+from api.models import User
+
+# (etiqueta, viewset, query params)
+CONSULTAS = [
+    ('empleados', views.EmpleadoViewSet, {}),
+    ('empleados?estado', views.EmpleadoViewSet, {'estado': 'Activo'}),
+    ('empleados?area', views.EmpleadoViewSet, {'area': 'Talento Humano'}),
+    ('empleados?tipo_documento', views.EmpleadoViewSet, {'tipo_documento': 'CC'}),
+    ('casos', views.CasoViewSet, {}),
+    ('casos?estado', views.CasoViewSet, {'estado': 'abierto'}),
+    ('casos?tipo_fuero', views.CasoViewSet, {'tipo_fuero': 'Salud'}),
+    ('casos?empleado&estado', views.CasoViewSet, {'empleado': '1', 'estado': 'abierto'}),
+    ('alertas', views.AlertaViewSet, {}),
+    ('alertas?estado', views.AlertaViewSet, {'estado': 'pendiente'}),
+    ('alertas?caso', views.AlertaViewSet, {'caso': '1'}),
+    ('carpetas?empleado', views.CarpetaViewSet, {'empleado': '1'}),
+    ('documentos', views.DocumentoViewSet, {}),
+    ('documentos?caso', views.DocumentoViewSet, {'caso': '1'}),
+    ('documentos?tipo', views.DocumentoViewSet, {'tipo': 'Incapacidad'}),
+    ('seguimientos?caso', views.SeguimientoViewSet, {'caso': '1'}),
+]
+
+PATRONES_SEQ_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on "?(\w+)"?'),
+    'sqlite': re.compile(r'SCAN (\w+)(?!\w| USING)'),
+}
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN de las consultas de los viewsets; reporta recorridos secuenciales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (solo PostgreSQL)')
+        parser.add_argument('--usuario', help='username con el que se evalúa la visibilidad de documentos')
+        parser.add_argument('--verbose-plan', action='store_true', help='Imprime el plan completo')
+
+    def handle(self, *args, **options):
+        patron = PATRONES_SEQ_SCAN.get(connection.vendor)
+        if patron is None:
+            self.stderr.write(f"Motor no soportado: {connection.vendor}")
+            return
+        usuario = AnonymousUser()
+        if options['usuario']:
+            usuario = User.objects.select_related('rol').get(username=options['usuario'])
+        explain_kwargs = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+
+        con_seq_scan = 0
+        for etiqueta, viewset, params in CONSULTAS:
+            queryset = self._queryset(viewset, params, usuario)
+            plan = queryset.explain(**explain_kwargs)
+            tablas = sorted(set(patron.findall(plan)))
+            if tablas:
+                con_seq_scan += 1
+                self.stdout.write(self.style.WARNING(f"SEQ SCAN  {etiqueta:<28} {', '.join(tablas)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"OK        {etiqueta}"))
+            if options['verbose_plan']:
+                self.stdout.write(plan + '\n')
+        self.stdout.write(f"\n{con_seq_scan} de {len(CONSULTAS)} consultas con recorrido secuencial")
+
+    def _queryset(self, viewset, params, usuario):
+        """Queryset de la primera página tal como lo arma el viewset para `list`."""
+        request = Request(APIRequestFactory().get('/', params))
+        request.user = usuario
+        view = viewset(request=request, action='list', format_kwarg=None, kwargs={})
+        queryset = view.get_queryset()
+        if hasattr(view, '_filter_by_permission'):
+            queryset = view._filter_by_permission(queryset, request)
+        return queryset[:20]
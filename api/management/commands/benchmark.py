@@ -0,0 +1,426 @@
+"""
+Benchmarks de rendimiento sobre la BD configurada.
+Todo se ejecuta dentro de una transacción que se revierte al final: no deja datos.
+Uso: python manage.py benchmark visibilidad --tamanos 100 1000 10000
+"""
+import hashlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+from unittest import mock
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from django.core.files.uploadedfile import UploadedFile
+
+from api.authentication import ExpiringTokenAuthentication
+from api.document_service import get_document_file_path, save_uploaded_file
+from api.pagination import codificar_cursor
+from api.token_cache import invalidate_all
+
+from api.models import Rol, User, Empleado, Caso, Alerta, Carpeta, Documento, Seguimiento, ExpiringToken
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta benchmarks de rendimiento (los datos se revierten al terminar)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('escenario', choices=sorted(self.escenarios()))
+        parser.add_argument('--tamanos', nargs='+', type=int, default=[100, 1000, 10000])
+
+    @classmethod
+    def escenarios(cls):
+        return {
+            'visibilidad': '_bench_visibilidad',
+            'autenticacion': '_bench_autenticacion',
+            'actividad': '_bench_actividad',
+            'casos': '_bench_casos',
+            'empleados': '_bench_empleados',
+            'paginacion': '_bench_paginacion',
+            'subida': '_bench_subida',
+            'entrega': '_bench_entrega',
+            'zip': '_bench_zip',
+        }
+
+    def handle(self, *args, **options):
+        metodo = getattr(self, self.escenarios()[options['escenario']])
+        try:
+            with transaction.atomic():
+                metodo(**options)
+                raise _Rollback()
+        except _Rollback:
+            pass
+        except Exception as e:
+            raise CommandError(f"Benchmark fallido: {e}")
+
+    # ---------- utilidades ----------
+
+    def _usuario(self, username, rol_tipo):
+        rol, _ = Rol.objects.get_or_create(tipo=rol_tipo)
+        return User.objects.create(
+            username=username, nombre=username, correo=f'{username}@bench.local', rol=rol,
+        )
+
+    def _empleado(self, sufijo):
+        return Empleado.objects.create(
+            nombre='Bench', apellido=str(sufijo), fecha_nacimiento='1990-01-01',
+            fecha_ingreso='2020-01-01', correo=f'bench{sufijo}@bench.local', telefono='0',
+            ciudad='Bogotá', numero_documento=f'BENCH-{sufijo}', tipo_documento='CC',
+        )
+
+    def _medir(self, client, url):
+        with CaptureQueriesContext(connection) as ctx:
+            inicio = time.perf_counter()
+            response = client.get(url)
+            ms = (time.perf_counter() - inicio) * 1000
+        if response.status_code != 200:
+            raise CommandError(f"GET {url} -> {response.status_code}")
+        return len(ctx.captured_queries), ms
+
+    # ---------- escenarios ----------
+
+    def _bench_visibilidad(self, tamanos, **options):
+        """Consultas y tiempo de GET /api/documentos/ según el tamaño de la tabla."""
+        usuario = self._usuario('bench_usuario', 'Usuario')
+        otro = self._usuario('bench_otro', 'Usuario')
+        caso = Caso.objects.create(empleado=self._empleado('vis'), responsable=usuario)
+        client = APIClient()
+        client.force_authenticate(usuario)
+        niveles = ['PUBLICO', 'CONFIDENCIAL', 'RESTRINGIDO']
+        total = 0
+        self.stdout.write(f"{'documentos':>12} {'consultas':>10} {'ms':>10}")
+        for tamano in sorted(tamanos):
+            nuevos = [
+                Documento(
+                    nombre=f'bench-{i}', caso=caso if i % 2 else None,
+                    usuario_creador=otro, nivel_sensibilidad=niveles[i % 3],
+                )
+                for i in range(total, tamano)
+            ]
+            Documento.objects.bulk_create(nuevos, batch_size=1000)
+            total = max(total, tamano)
+            consultas, ms = self._medir(client, '/api/documentos/')
+            self.stdout.write(f"{total:>12} {consultas:>10} {ms:>10.1f}")
+
+    def _bench_autenticacion(self, **options):
+        """Consultas de GETs autenticados por token (caché de tokens fría y caliente)."""
+        admin = self._usuario('bench_admin', 'Administrador')
+        token = ExpiringToken.objects.create(user=admin)
+        documento = Documento.objects.create(nombre='bench', usuario_creador=admin)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.stdout.write(f"{'endpoint':<40} {'consultas':>10} {'ms':>10}")
+        # La primera petición llena la caché de tokens; las siguientes no consultan el token
+        for url in (f'/api/documentos/{documento.pk}/', f'/api/documentos/{documento.pk}/',
+                    '/api/documentos/', '/api/roles/'):
+            consultas, ms = self._medir(client, url)
+            self.stdout.write(f"{url:<40} {consultas:>10} {ms:>10.1f}")
+
+    def _bench_actividad(self, tamanos, **options):
+        """
+        Escrituras en authtoken por clientes concurrentes simulados (peticiones intercaladas,
+        1 petición/s por cliente durante 10 minutos de reloj simulado), con y sin umbral.
+        """
+        clientes = tamanos[0]
+        tokens = [
+            ExpiringToken.objects.create(user=self._usuario(f'bench_act_{i}', 'Usuario')).key
+            for i in range(clientes)
+        ]
+        auth = ExpiringTokenAuthentication()
+        inicio = timezone.now()
+        segundos = 600
+        self.stdout.write(f"{'umbral (s)':>10} {'peticiones':>12} {'UPDATEs':>10} {'ms':>10}")
+        for umbral in (0, 60):
+            ExpiringToken.objects.filter(key__in=tokens).update(ultima_actividad=inicio)
+            invalidate_all()
+            escrituras = []
+
+            def contar_updates(execute, sql, params, many, context):
+                if sql.lstrip().upper().startswith('UPDATE'):
+                    escrituras.append(sql)
+                return execute(sql, params, many, context)
+
+            with override_settings(TOKEN_ACTIVITY_THRESHOLD_SECONDS=umbral), \
+                    connection.execute_wrapper(contar_updates):
+                t0 = time.perf_counter()
+                for segundo in range(segundos):
+                    ahora = inicio + timedelta(seconds=segundo)
+                    with mock.patch('django.utils.timezone.now', return_value=ahora):
+                        for key in tokens:
+                            auth.authenticate_credentials(key)
+                ms = (time.perf_counter() - t0) * 1000
+            self.stdout.write(f"{umbral:>10} {segundos * clientes:>12} {len(escrituras):>10} {ms:>10.1f}")
+
+    def _bench_casos(self, tamanos, **options):
+        """Consultas de GET /api/casos/ y /api/empleados/{id}/casos/ según el número de casos."""
+        usuario = self._usuario('bench_casos', 'Usuario')
+        empleado = self._empleado('casos')
+        client = APIClient()
+        client.force_authenticate(usuario)
+        total = 0
+        self.stdout.write(f"{'casos':>8} {'endpoint':<32} {'consultas':>10} {'ms':>10}")
+        for tamano in sorted(tamanos):
+            for _ in range(total, tamano):
+                caso = Caso.objects.create(empleado=empleado, responsable=usuario)
+                Documento.objects.create(caso=caso, nombre='bench')
+                Alerta.objects.create(caso=caso, titulo='bench')
+                Seguimiento.objects.create(caso=caso)
+            total = max(total, tamano)
+            for url in ('/api/casos/', f'/api/empleados/{empleado.pk}/casos/'):
+                consultas, ms = self._medir(client, url)
+                self.stdout.write(f"{total:>8} {url:<32} {consultas:>10} {ms:>10.1f}")
+
+    def _bench_empleados(self, tamanos, **options):
+        """Consultas y tiempo de GET /api/empleados/ (directorio) según el número de empleados."""
+        usuario = self._usuario('bench_empleados', 'Usuario')
+        client = APIClient()
+        client.force_authenticate(usuario)
+        total = 0
+        self.stdout.write(f"{'empleados':>10} {'consultas':>10} {'ms':>10}")
+        for tamano in sorted(tamanos):
+            for i in range(total, tamano):
+                empleado = self._empleado(f'dir{i}')
+                empleado.foto.name = f'empleados/fotos/bench{i}.jpg'
+                empleado.save(update_fields=['foto'])
+                Caso.objects.create(empleado=empleado, estado=Caso.ESTADO_CHOICES[i % 3][0])
+            total = max(total, tamano)
+            consultas, ms = self._medir(client, '/api/empleados/')
+            self.stdout.write(f"{total:>10} {consultas:>10} {ms:>10.1f}")
+
+    def _bench_paginacion(self, tamanos, **options):
+        """Última página de GET /api/documentos/: ?page=N (COUNT + OFFSET) frente a ?cursor=."""
+        usuario = self._usuario('bench_paginacion', 'Administrador')
+        client = APIClient()
+        client.force_authenticate(usuario)
+        total = 0
+        self.stdout.write(f"{'documentos':>12} {'modo':<8} {'consultas':>10} {'ms':>10}")
+        for tamano in sorted(tamanos):
+            Documento.objects.bulk_create(
+                [Documento(nombre=f'bench-{i}') for i in range(total, tamano)], batch_size=1000
+            )
+            total = max(total, tamano)
+            paginas = max(1, -(-total // 20))
+            frontera = (
+                Documento.objects.order_by('-fecha_carga', 'id_documento')
+                .values_list('fecha_carga', 'id_documento')[(paginas - 1) * 20 - 1]
+                if paginas > 1 else None
+            )
+            cursor = codificar_cursor([str(v) for v in frontera]) if frontera else ''
+            for modo, url in (('page', f'/api/documentos/?page={paginas}'),
+                              ('cursor', f'/api/documentos/?cursor={cursor}')):
+                consultas, ms = self._medir(client, url)
+                self.stdout.write(f"{total:>12} {modo:<8} {consultas:>10} {ms:>10.1f}")
+
+    def _bench_subida(self, tamanos, **options):
+        """
+        Rendimiento de save_uploaded_file frente a la versión anterior (escribir con bloques
+        de 64 KiB y volver a leer el archivo con bloques de 8 KiB para el checksum).
+        --tamanos en KiB, p. ej.: --tamanos 1 1024 102400 512000
+        """
+        def subida_anterior(archivo, root):
+            ruta = os.path.join(root, uuid.uuid4().hex)
+            with open(ruta, 'wb') as dest:
+                for chunk in archivo.chunks():
+                    dest.write(chunk)
+            os.path.getsize(ruta)
+            hasher = hashlib.sha256()
+            with open(ruta, 'rb') as f:
+                for chunk in iter(lambda: f.read(8192), b''):
+                    hasher.update(chunk)
+            return hasher.hexdigest()
+
+        trabajo = tempfile.mkdtemp(prefix='bench-subida-')
+        try:
+            self.stdout.write(f"{'KiB':>10} {'modo':<10} {'MB/s':>10} {'ms':>10}")
+            for kib in sorted(tamanos):
+                origen = os.path.join(trabajo, 'origen.bin')
+                with open(origen, 'wb') as f:
+                    bloque = _bloque_pdf(min(kib, 1024) * 1024)
+                    for _ in range(max(1, kib // 1024)):
+                        f.write(bloque)
+                tamano = os.path.getsize(origen)
+                destino = os.path.join(trabajo, 'docs')
+                os.makedirs(destino, exist_ok=True)
+                with override_settings(DOCUMENT_STORAGE_ROOT=destino):
+                    for modo in ('anterior', 'actual'):
+                        with open(origen, 'rb') as f:
+                            archivo = UploadedFile(file=f, name='bench.pdf', size=tamano)
+                            t0 = time.perf_counter()
+                            if modo == 'anterior':
+                                subida_anterior(archivo, destino)
+                            else:
+                                save_uploaded_file(archivo, nombre_logico='bench.pdf')
+                            segundos = time.perf_counter() - t0
+                        mbs = tamano / (1024 * 1024) / segundos if segundos else 0
+                        self.stdout.write(f"{kib:>10} {modo:<10} {mbs:>10.1f} {segundos * 1000:>10.1f}")
+                shutil.rmtree(destino)
+        finally:
+            shutil.rmtree(trabajo, ignore_errors=True)
+
+    def _bench_entrega(self, tamanos, **options):
+        """
+        Descarga por backend de entrega hacia un proxy local simulado (socket que descarta lo
+        recibido). 'worker ms' es el tiempo que el worker WSGI queda ocupado; 'total ms' incluye
+        el envío del proxy en x-accel. --tamanos en KiB, p. ej.: --tamanos 1024 102400
+        """
+        trabajo = tempfile.mkdtemp(prefix='bench-entrega-')
+        admin = self._usuario(f'bench-entrega-{uuid.uuid4().hex[:8]}', 'Administrador')
+        client = APIClient()
+        client.force_authenticate(admin)
+        modos = ['python', 'sendfile', 'x-accel'] if hasattr(os, 'sendfile') else ['python', 'x-accel']
+        try:
+            self.stdout.write(f"{'KiB':>10} {'modo':<10} {'worker ms':>10} {'total ms':>10} {'MB/s':>10}")
+            with override_settings(DOCUMENT_STORAGE_ROOT=trabajo, DOCUMENT_ACCEL_PREFIX='/interno/'):
+                for kib in sorted(tamanos):
+                    bloque = _bloque_pdf(min(kib, 1024) * 1024)
+                    datos = UploadedFile(file=_Repetido(bloque, max(1, kib // 1024)), name='bench.pdf')
+                    meta = save_uploaded_file(datos, nombre_logico='bench.pdf')
+                    documento = Documento.objects.create(
+                        nombre='bench.pdf', ruta=meta['ruta'], extension='pdf',
+                        tamano_bytes=meta['tamano_bytes'], checksum_sha256=meta['checksum_sha256'],
+                    )
+                    url = f'/api/documentos/{documento.pk}/descargar/'
+                    for modo in modos:
+                        backend = 'x-accel' if modo == 'x-accel' else 'python'
+                        with override_settings(DOCUMENT_DELIVERY_BACKEND=backend):
+                            worker, total = self._entregar(client, url, modo, trabajo, get_document_file_path(documento))
+                        mbs = meta['tamano_bytes'] / (1024 * 1024) / total if total else 0
+                        self.stdout.write(
+                            f"{kib:>10} {modo:<10} {worker * 1000:>10.1f} {total * 1000:>10.1f} {mbs:>10.1f}"
+                        )
+        finally:
+            shutil.rmtree(trabajo, ignore_errors=True)
+
+    def _bench_zip(self, tamanos, **options):
+        """
+        descargar-zip de una carpeta con PDF de 20 MiB: throughput y memoria Python máxima
+        (tracemalloc) mientras se consume el cuerpo, y trozo más grande entregado.
+        --tamanos en MiB totales de la carpeta, p. ej.: --tamanos 100 2048
+        """
+        trabajo = tempfile.mkdtemp(prefix='bench-zip-')
+        admin = self._usuario(f'bench-zip-{uuid.uuid4().hex[:8]}', 'Administrador')
+        client = APIClient()
+        client.force_authenticate(admin)
+        por_archivo = 20
+        try:
+            self.stdout.write(
+                f"{'MiB':>8} {'archivos':>9} {'zip MiB':>9} {'s':>8} {'MB/s':>8} {'pico KiB':>9} {'trozo KiB':>10}"
+            )
+            with override_settings(DOCUMENT_STORAGE_ROOT=trabajo):
+                for mib in sorted(tamanos):
+                    carpeta = Carpeta.objects.create(empleado=self._empleado(uuid.uuid4().hex[:8]), nombre='bench')
+                    bloque = _bloque_pdf(1024 * 1024)
+                    n = max(1, mib // por_archivo)
+                    for i in range(n):
+                        datos = UploadedFile(file=_Repetido(bloque, min(por_archivo, mib)), name='bench.pdf')
+                        meta = save_uploaded_file(datos, nombre_logico='bench.pdf')
+                        Documento.objects.create(
+                            nombre=f'bench-{i}.pdf', carpeta=carpeta, ruta=meta['ruta'], extension='pdf',
+                            tamano_bytes=meta['tamano_bytes'], checksum_sha256=meta['checksum_sha256'],
+                        )
+                    tracemalloc.start()
+                    t0 = time.perf_counter()
+                    respuesta = client.get(f'/api/carpetas/{carpeta.pk}/descargar-zip/')
+                    total = trozo = 0
+                    for chunk in respuesta.streaming_content:
+                        total += len(chunk)
+                        trozo = max(trozo, len(chunk))
+                    segundos = time.perf_counter() - t0
+                    pico = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    self.stdout.write(
+                        f"{mib:>8} {n:>9} {total / 1048576:>9.1f} {segundos:>8.2f} "
+                        f"{total / 1048576 / segundos:>8.1f} {pico / 1024:>9.0f} {trozo / 1024:>10.0f}"
+                    )
+                    shutil.rmtree(trabajo)
+                    os.makedirs(trabajo)
+        finally:
+            shutil.rmtree(trabajo, ignore_errors=True)
+
+    def _entregar(self, client, url, modo, root, path):
+        """Una descarga hasta el socket del proxy simulado. Returns: (segundos_worker, segundos_total)."""
+        salida, proxy = socket.socketpair()
+        recibidos = []
+
+        def drenar():
+            total = 0
+            while True:
+                datos = proxy.recv(1 << 20)
+                if not datos:
+                    break
+                total += len(datos)
+            recibidos.append(total)
+
+        lector = threading.Thread(target=drenar)
+        lector.start()
+        try:
+            t0 = time.perf_counter()
+            respuesta = client.get(url)
+            if modo == 'python':
+                # Worker iterando el cuerpo en Python (sin wsgi.file_wrapper)
+                for chunk in respuesta.streaming_content:
+                    salida.sendall(chunk)
+                worker = time.perf_counter() - t0
+            elif modo == 'sendfile':
+                # Worker con wsgi.file_wrapper que usa os.sendfile (p. ej. gunicorn sync);
+                # el cliente de pruebas envuelve streaming_content, así que se reabre el archivo.
+                # (respuesta.close() dispararía request_finished y cerraría la conexión de la BD)
+                with open(path, 'rb') as f:
+                    self._sendfile(salida, f.fileno(), int(respuesta['Content-Length']))
+                worker = time.perf_counter() - t0
+            else:
+                # El worker solo produce cabeceras; el proxy resuelve X-Accel-Redirect
+                worker = time.perf_counter() - t0
+                relativa = respuesta['X-Accel-Redirect'].split('/interno/', 1)[1]
+                with open(os.path.join(root, *relativa.split('/')), 'rb') as f:
+                    self._sendfile(salida, f.fileno(), os.fstat(f.fileno()).st_size)
+            salida.shutdown(socket.SHUT_WR)
+            lector.join()
+            return worker, time.perf_counter() - t0
+        finally:
+            salida.close()
+            proxy.close()
+
+    def _sendfile(self, sock, fd, cantidad):
+        desplazamiento = os.lseek(fd, 0, os.SEEK_CUR)
+        if not hasattr(os, 'sendfile'):
+            sock.sendfile(os.fdopen(os.dup(fd), 'rb'), desplazamiento, cantidad)
+            return
+        while cantidad > 0:
+            enviados = os.sendfile(sock.fileno(), fd, desplazamiento, cantidad)
+            if not enviados:
+                break
+            desplazamiento += enviados
+            cantidad -= enviados
+
+
+def _bloque_pdf(tamano):
+    """Bytes aleatorios con cabecera PDF: las subidas validan el tipo por contenido."""
+    return b'%PDF-1.4\n' + os.urandom(tamano - 9)
+
+
+class _Repetido:
+    """Archivo de solo lectura que repite `bloque` n veces (para generar subidas grandes)."""
+
+    def __init__(self, bloque, veces):
+        self.bloque = bloque
+        self.restantes = veces
+
+    def read(self, size=-1):
+        if not self.restantes:
+            return b''
+        self.restantes -= 1
+        return self.bloque
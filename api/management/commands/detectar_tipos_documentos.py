@@ -0,0 +1,53 @@
+"""
+Rellena Documento.mime_type de los documentos subidos antes de la detección por contenido,
+leyendo solo la cabecera de cada archivo (api/tipos_mime.py). No aplica DOCUMENT_MIME_POLICY
+a lo ya subido: informa de los documentos cuya extensión no corresponde al contenido o
+cuyo tipo ya no se admitiría para su nivel.
+Uso: python manage.py detectar_tipos_documentos [--lote 500] [--dry-run]
+"""
+from django.core.management.base import BaseCommand
+
+from api import tipos_mime
+from api.document_service import get_document_file_path
+from api.models import Documento
+
+
+class Command(BaseCommand):
+    help = 'Detecta y guarda el tipo MIME de los documentos que no lo tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        resumen = {'detectados': 0, 'extension_distinta': 0, 'no_permitidos': 0, 'faltantes': 0}
+        pendientes = (
+            Documento.objects.filter(mime_type__isnull=True).exclude(ruta__isnull=True).exclude(ruta='')
+            .only('pk', 'ruta', 'nombre', 'extension', 'nivel_sensibilidad').order_by('pk')
+        )
+        ultimo = 0
+        while True:
+            lote = list(pendientes.filter(pk__gt=ultimo)[:options['lote']])
+            if not lote:
+                break
+            ultimo = lote[-1].pk
+            for documento in lote:
+                path = get_document_file_path(documento)
+                if not path:
+                    resumen['faltantes'] += 1
+                    continue
+                with open(path, 'rb') as f:
+                    cabecera = f.read(tipos_mime.TAMANO_CABECERA)
+                nombre = f"x.{documento.extension}" if documento.extension else documento.nombre
+                tipo, coincide = tipos_mime.tipo_contenido(cabecera, nombre)
+                if not coincide:
+                    resumen['extension_distinta'] += 1
+                    self.stderr.write(f"Documento {documento.pk}: contenido {tipo}, extensión .{documento.extension}")
+                if not tipos_mime.permitido(tipo, documento.nivel_sensibilidad):
+                    resumen['no_permitidos'] += 1
+                    self.stderr.write(f"Documento {documento.pk}: {tipo} no se admite para {documento.nivel_sensibilidad}")
+                if not options['dry_run']:
+                    Documento.objects.filter(pk=documento.pk).update(mime_type=tipo)
+                resumen['detectados'] += 1
+            self.stdout.write(f"... hasta Id_Documento {ultimo}: {resumen}")
+        self.stdout.write(self.style.SUCCESS(f"Terminado: {resumen}"))
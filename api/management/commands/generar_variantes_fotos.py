@@ -0,0 +1,70 @@
+"""
+Genera las variantes WebP/JPEG (api/fotos.py) de las fotos de empleados que aún no las
+tienen o cuyas variantes no corresponden a la foto actual (--forzar: todas).
+- Las imágenes se procesan en un pool de procesos (--procesos); el proceso principal
+  registra cada resultado en la BD con la misma comprobación que la señal post_save
+  (si la foto cambió entretanto, se descartan).
+- Se puede repetir: solo procesa lo pendiente.
+Uso: python manage.py generar_variantes_fotos [--procesos 4] [--forzar]
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import django
+from django.core.management.base import BaseCommand
+
+from api import fotos
+from api.models import Empleado
+
+
+def _generar(nombre_foto):
+    """Corre en el pool: solo Pillow y el storage, sin BD."""
+    try:
+        return fotos.generar_variantes(nombre_foto), None
+    except Exception as e:  # foto ilegible o inexistente: se informa y se sigue
+        return None, f'{type(e).__name__}: {e}'
+
+
+class Command(BaseCommand):
+    help = 'Genera las variantes WebP/JPEG de las fotos de empleados existentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=min(4, os.cpu_count() or 1))
+        parser.add_argument('--forzar', action='store_true', help='Regenera también las que ya están al día')
+
+    def handle(self, *args, **options):
+        resumen = {'generadas': 0, 'descartadas': 0, 'limpiadas': 0, 'errores': 0}
+        pendientes = []
+        empleados = Empleado.objects.only('pk', 'foto', 'foto_variantes').order_by('pk')
+        for empleado in empleados.iterator(chunk_size=500):
+            if not empleado.foto:
+                # Sin foto pero con variantes de una foto anterior
+                if empleado.foto_variantes and fotos.registrar_variantes(empleado.pk, None, None):
+                    resumen['limpiadas'] += 1
+            elif options['forzar'] or fotos.pendiente(empleado):
+                pendientes.append((empleado.pk, empleado.foto.name))
+        self.stdout.write(f"Fotos por procesar: {len(pendientes)}")
+        if not pendientes:
+            self.stdout.write(self.style.SUCCESS(f"Terminado: {resumen}"))
+            return
+
+        # spawn: los procesos del pool no heredan la conexión a la BD ni los hilos del padre
+        with ProcessPoolExecutor(
+            max_workers=max(1, options['procesos']),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        ) as pool:
+            tareas = {pool.submit(_generar, nombre): (empleado_id, nombre) for empleado_id, nombre in pendientes}
+            for hecho, futuro in enumerate(as_completed(tareas), 1):
+                empleado_id, nombre = tareas[futuro]
+                nuevas, error = futuro.result()
+                if error:
+                    resumen['errores'] += 1
+                    self.stderr.write(f"Empleado {empleado_id} ({nombre}): {error}")
+                elif fotos.registrar_variantes(empleado_id, nombre, nuevas):
+                    resumen['generadas'] += 1
+                else:
+                    resumen['descartadas'] += 1
+                if hecho % 100 == 0:
+                    self.stdout.write(f"... {hecho}/{len(pendientes)}: {resumen}")
+        self.stdout.write(self.style.SUCCESS(f"Terminado: {resumen}"))
@@ -0,0 +1,158 @@
+"""
+Borra del almacenamiento de documentos los archivos que ningún Documento referencia:
+subidas cuyo Documento no llegó a crearse, borrados anteriores a la limpieza automática
+(señal post_delete), temporales '.subida-*' de escrituras interrumpidas (en la raíz,
+los repartidos ab/cd/, cas/ y miniaturas/) y miniaturas de
+contenido que ya ningún Documento tiene (por checksum).
+- Antes, cancela las subidas por fragmentos caducadas (DOCUMENT_CHUNKED_UPLOAD_EXPIRY_HOURS);
+  el temporal de la raíz de una subida que sigue abierta no se toca.
+- El listado del disco y las rutas de la BD se cruzan ordenados y en flujo (merge-join);
+  ninguno de los dos se carga entero en memoria.
+- Solo se borran archivos con más de --gracia-horas (DOCUMENT_ORPHAN_GRACE_HOURS) sin
+  modificar, y tras volver a comprobar por lotes que siguen sin Documento (también en la
+  ubicación plana o repartida del mismo nombre, ver get_document_file_path).
+- Contenido CAS: se bloquea su fila ArchivoDocumento como en release_blob y no se borra
+  si tiene referencias.
+Uso: python manage.py limpiar_huerfanos [--gracia-horas 24] [--lote 500] [--dry-run]
+"""
+import itertools
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import integridad, subidas
+from api.document_service import (
+    get_document_storage_root,
+    is_cas_path,
+    resolve_storage_path,
+    sharded_relative_path,
+)
+from api.miniaturas import MINIATURAS_DIR, ruta_miniatura
+from api.models import ArchivoDocumento, Documento, SubidaDocumento
+
+
+class Command(BaseCommand):
+    help = 'Elimina los archivos de documentos que no tienen Documento (huérfanos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gracia-horas', type=float, default=None,
+                            help='Por defecto DOCUMENT_ORPHAN_GRACE_HOURS')
+        parser.add_argument('--lote', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        gracia = options['gracia_horas']
+        if gracia is None:
+            gracia = getattr(settings, 'DOCUMENT_ORPHAN_GRACE_HOURS', 24)
+        self.corte = time.time() - gracia * 3600
+        self.dry_run = options['dry_run']
+        self.resumen = {'eliminados': 0, 'bytes_liberados': 0, 'recientes': 0, 'en_uso': 0}
+        if not self.dry_run:
+            self.resumen['subidas_caducadas'] = subidas.expirar()
+        root = get_document_storage_root()
+        archivos = integridad.archivos_huerfanos(
+            integridad.recorrer_almacenamiento(root, temporales=True, excluir={MINIATURAS_DIR}),
+            integridad.rutas_en_bd(),
+        )
+        # Miniaturas: se cruzan con los checksum en uso (ruta_miniatura conserva su orden)
+        prefijo = len(MINIATURAS_DIR) + 1
+        miniaturas = (
+            f'{MINIATURAS_DIR}/{ruta}' for ruta in integridad.archivos_huerfanos(
+                integridad.recorrer_almacenamiento(os.path.join(root, MINIATURAS_DIR), temporales=True),
+                (ruta_miniatura(c)[prefijo:] for c in integridad.valores_en_bd('checksum_sha256')),
+            )
+        )
+        candidatos = []
+        for ruta in itertools.chain(archivos, miniaturas):
+            candidatos.append(ruta)
+            if len(candidatos) >= options['lote']:
+                self._procesar(candidatos)
+                candidatos = []
+        if candidatos:
+            self._procesar(candidatos)
+        accion = 'Se eliminarían' if self.dry_run else 'Terminado'
+        self.stdout.write(self.style.SUCCESS(f"{accion}: {self.resumen}"))
+
+    def _procesar(self, rutas):
+        antiguas = {}
+        for ruta in rutas:
+            path = resolve_storage_path(ruta)
+            try:
+                info = os.lstat(path)
+            except (OSError, TypeError):
+                continue
+            if info.st_mtime > self.corte:
+                self.resumen['recientes'] += 1
+            else:
+                antiguas[ruta] = (path, info.st_size)
+        # Segunda comprobación: el documento pudo crearse o moverse durante el recorrido
+        alternativas = {}
+        miniaturas = {}
+        sesiones = {}
+        temporales = set()
+        for ruta in antiguas:
+            if os.path.basename(ruta).startswith(integridad.PREFIJO_TEMPORAL):
+                # Solo los de la raíz pueden ser de una subida por fragmentos abierta; el resto
+                # (escrituras atómicas repartidas, CAS o de miniaturas) ya no es de nadie
+                id_subida = subidas.id_de_temporal(ruta)
+                if id_subida:
+                    sesiones[ruta] = id_subida
+                temporales.add(ruta)
+                continue
+            if ruta.startswith(MINIATURAS_DIR + '/'):
+                miniaturas[ruta] = os.path.basename(ruta).split('.', 1)[0]
+                continue
+            if is_cas_path(ruta):
+                continue
+            nombre = os.path.basename(ruta)
+            alternativas[ruta] = {ruta, nombre, sharded_relative_path(nombre)}
+        en_uso = set(Documento.objects.filter(
+            ruta__in=set().union(*alternativas.values()),
+        ).values_list('ruta', flat=True)) if alternativas else set()
+        checksums_en_uso = set(Documento.objects.filter(
+            checksum_sha256__in=set(miniaturas.values()),
+        ).values_list('checksum_sha256', flat=True)) if miniaturas else set()
+        sesiones_abiertas = set(SubidaDocumento.objects.filter(
+            pk__in=set(sesiones.values()),
+        ).values_list('pk', flat=True)) if sesiones else set()
+        for ruta, (path, tamano) in antiguas.items():
+            if (alternativas.get(ruta, set()) & en_uso or miniaturas.get(ruta) in checksums_en_uso
+                    or sesiones.get(ruta) in sesiones_abiertas):
+                self.resumen['en_uso'] += 1
+                continue
+            if self.dry_run:
+                self.stdout.write(f"Huérfano: {ruta} ({tamano} bytes)")
+            elif is_cas_path(ruta) and ruta not in temporales:
+                if not self._eliminar_blob(ruta, path):
+                    self.resumen['en_uso'] += 1
+                    continue
+            elif not self._eliminar(path):
+                continue
+            self.resumen['eliminados'] += 1
+            self.resumen['bytes_liberados'] += tamano
+
+    def _eliminar(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            self.stderr.write(f"No se pudo borrar {path}: {e}")
+            return False
+
+    def _eliminar_blob(self, ruta, path):
+        checksum = ruta.rsplit('/', 1)[-1]
+        with transaction.atomic():
+            blob = ArchivoDocumento.objects.select_for_update().filter(pk=checksum).first()
+            if blob is not None and blob.referencias > 0:
+                return False
+            if Documento.objects.filter(ruta=ruta).exists():
+                return False
+            if not self._eliminar(path):
+                return False
+            if blob is not None:
+                blob.delete()
+        return True
@@ -0,0 +1,77 @@
+"""
+Pasa los documentos con archivo UUID plano al almacén deduplicado (cas/<aa>/<bb>/<sha256>).
+Por documento: verifica el checksum, enlaza (o copia) el archivo al CAS, suma la referencia
+y actualiza Documento.ruta en una transacción; el archivo antiguo se borra tras el commit.
+Se puede interrumpir y volver a ejecutar: solo procesa rutas que aún no son CAS.
+Uso: python manage.py migrar_almacenamiento_cas [--lote 500] [--dry-run]
+"""
+import os
+import shutil
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.document_service import (
+    compute_sha256,
+    get_document_file_path,
+    get_document_storage_root,
+    publish_blob,
+)
+from api.models import Documento
+
+
+class Command(BaseCommand):
+    help = 'Migra los archivos existentes al almacén deduplicado por SHA-256 (CAS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        pendientes = (
+            Documento.objects.exclude(ruta__isnull=True).exclude(ruta='')
+            .exclude(ruta__startswith='cas/').order_by('pk')
+        )
+        resumen = {'migrados': 0, 'faltantes': 0, 'corruptos': 0, 'bytes_liberados': 0}
+        ultimo = 0
+        while True:
+            lote = list(pendientes.filter(pk__gt=ultimo).only('pk', 'ruta', 'checksum_sha256')[:options['lote']])
+            if not lote:
+                break
+            ultimo = lote[-1].pk
+            for documento in lote:
+                self._migrar(documento, options['dry_run'], resumen)
+            self.stdout.write(f"... hasta Id_Documento {ultimo}: {resumen}")
+        self.stdout.write(self.style.SUCCESS(f"Terminado: {resumen}"))
+
+    def _migrar(self, documento, dry_run, resumen):
+        path = get_document_file_path(documento)
+        if not path:
+            resumen['faltantes'] += 1
+            self.stderr.write(f"Documento {documento.pk}: archivo no encontrado ({documento.ruta})")
+            return
+        checksum = compute_sha256(path)
+        if documento.checksum_sha256 and documento.checksum_sha256 != checksum:
+            resumen['corruptos'] += 1
+            self.stderr.write(f"Documento {documento.pk}: checksum distinto al registrado, se omite")
+            return
+        tamano = os.path.getsize(path)
+        if dry_run:
+            resumen['migrados'] += 1
+            return
+        temporal = os.path.join(get_document_storage_root(), f".subida-{uuid.uuid4().hex}.part")
+        try:
+            os.link(path, temporal)
+        except OSError:
+            shutil.copyfile(path, temporal)
+        with transaction.atomic():
+            ruta = publish_blob(temporal, checksum, tamano)
+            Documento.objects.filter(pk=documento.pk).update(
+                ruta=ruta, checksum_sha256=checksum, tamano_bytes=tamano,
+            )
+        try:
+            os.remove(path)
+            resumen['bytes_liberados'] += tamano
+        except OSError as e:
+            self.stderr.write(f"No se pudo borrar {path}: {e}")
+        resumen['migrados'] += 1
@@ -0,0 +1,68 @@
+"""
+Mantenimiento de las particiones mensuales de Auditoria_Documento (PostgreSQL).
+- Crea las particiones del mes actual y de los --meses-futuros siguientes.
+- Archiva los meses anteriores a la retención (--retener-meses, AUDIT_RETENTION_MONTHS):
+  DETACH, COPY a <AUDIT_ARCHIVE_DIR>/<partición>.csv.gz y DROP.
+- Reintenta el archivo de particiones que quedaron desacopladas en una ejecución anterior.
+Uso: python manage.py particiones_auditoria [--meses-futuros 3] [--retener-meses 24] [--dry-run]
+Programar una vez al mes (cron) antes de que empiece el mes siguiente.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api import particiones
+
+
+class Command(BaseCommand):
+    help = 'Crea particiones futuras de Auditoria_Documento y archiva las antiguas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses-futuros', type=int, default=3)
+        parser.add_argument('--retener-meses', type=int, default=None,
+                            help='Por defecto AUDIT_RETENTION_MONTHS; 0 = no archivar')
+        parser.add_argument('--archivo-dir', default=None, help='Por defecto AUDIT_ARCHIVE_DIR')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(f"Motor {connection.vendor}: Auditoria_Documento no está particionada, nada que hacer")
+            return
+        with connection.cursor() as cursor:
+            if not particiones.es_particionada(cursor):
+                raise CommandError("Auditoria_Documento no es una tabla particionada (¿falta migrar 0016?)")
+            adjuntas, sueltas = particiones.listar_particiones(cursor)
+        dry_run = options['dry_run']
+
+        anio, mes = particiones.mes_actual()
+        for desplazamiento in range(options['meses_futuros'] + 1):
+            objetivo = particiones.sumar_meses(anio, mes, desplazamiento)
+            if objetivo in adjuntas:
+                continue
+            nombre = particiones.nombre_particion(*objetivo)
+            if not dry_run:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    particiones.crear_particion(cursor, *objetivo)
+            self.stdout.write(self.style.SUCCESS(f"Creada {nombre}"))
+
+        retener = options['retener_meses']
+        if retener is None:
+            retener = getattr(settings, 'AUDIT_RETENTION_MONTHS', 0)
+        directorio = options['archivo_dir'] or getattr(settings, 'AUDIT_ARCHIVE_DIR')
+        viejas = particiones.meses_a_archivar(adjuntas, retener) if retener else []
+        for objetivo in viejas:
+            nombre = particiones.nombre_particion(*objetivo)
+            if dry_run:
+                self.stdout.write(f"Se archivaría {nombre}")
+                continue
+            # DETACH en su propia transacción: el bloqueo sobre la tabla padre dura poco
+            with transaction.atomic(), connection.cursor() as cursor:
+                particiones.desacoplar_particion(cursor, nombre)
+            sueltas.append(nombre)
+        for nombre in sueltas:
+            if dry_run:
+                self.stdout.write(f"Se archivaría {nombre} (ya desacoplada)")
+                continue
+            with transaction.atomic():
+                ruta, tamano = particiones.archivar_particion(connection, nombre, directorio)
+            self.stdout.write(self.style.SUCCESS(f"Archivada {nombre} -> {ruta} ({tamano} bytes)"))
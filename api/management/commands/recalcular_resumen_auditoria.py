@@ -0,0 +1,58 @@
+"""
+Reconstruye Auditoria_Resumen_Diario a partir de Auditoria_Documento (carga inicial o
+corrección). Solo toca días que aún tienen filas de auditoría: los meses ya archivados
+(particiones_auditoria) conservan su resumen.
+Por defecto recalcula hasta ayer; con --incluir-hoy también el día en curso (los eventos
+que se escriban mientras corre pueden quedar contados dos veces o ninguna).
+Uso: python manage.py recalcular_resumen_auditoria [--desde YYYY-MM-DD] [--hasta YYYY-MM-DD] [--incluir-hoy]
+"""
+from datetime import date, datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from api.models import AuditoriaDocumento, AuditoriaResumenDiario
+
+
+def _inicio_del_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, datetime.min.time()))
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el resumen diario de auditoría desde Auditoria_Documento'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=date.fromisoformat)
+        parser.add_argument('--hasta', type=date.fromisoformat, help='Último día incluido')
+        parser.add_argument('--incluir-hoy', action='store_true')
+
+    def handle(self, *args, **options):
+        primero = AuditoriaDocumento.objects.aggregate(minimo=Min('fecha'))['minimo']
+        if primero is None:
+            self.stdout.write("Sin filas de auditoría")
+            return
+        desde = max(options['desde'] or date.min, timezone.localdate(primero))
+        hoy = timezone.localdate()
+        tope = hoy + timedelta(days=1) if options['incluir_hoy'] else hoy
+        fin = min(options['hasta'] + timedelta(days=1), tope) if options['hasta'] else tope
+        if desde >= fin:
+            raise CommandError(f"Rango vacío: {desde} .. {fin - timedelta(days=1)}")
+
+        grupos = (
+            AuditoriaDocumento.objects.en_rango(_inicio_del_dia(desde), _inicio_del_dia(fin))
+            .annotate(dia=TruncDate('fecha', tzinfo=timezone.get_current_timezone()))
+            .values('dia', 'documento_id', 'usuario_id', 'accion')
+            .annotate(total=Count('pk'))
+            .order_by()
+        )
+        with transaction.atomic():
+            borradas, _ = AuditoriaResumenDiario.objects.filter(dia__gte=desde, dia__lt=fin).delete()
+            creadas = len(AuditoriaResumenDiario.objects.bulk_create(
+                (AuditoriaResumenDiario(**grupo) for grupo in grupos.iterator(chunk_size=5000)),
+                batch_size=1000,
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Resumen {desde} .. {fin - timedelta(days=1)}: {borradas} filas reemplazadas por {creadas}"
+        ))
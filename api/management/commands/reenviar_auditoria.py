@@ -0,0 +1,20 @@
+"""
+Reenvía a Auditoria_Documento los eventos que quedaron en el spool de procesos caídos
+(AUDIT_SPOOL_DIR). Los procesos vivos conservan sus archivos; con --forzar se reenvían
+todos (usar solo con la aplicación detenida).
+Uso: python manage.py reenviar_auditoria [--forzar]
+"""
+from django.core.management.base import BaseCommand
+
+from api.auditoria import get_spool_dir, recuperar_spools
+
+
+class Command(BaseCommand):
+    help = 'Reenvía a la BD los eventos de auditoría pendientes en el spool local'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forzar', action='store_true', help='Incluye spools de procesos que parecen vivos')
+
+    def handle(self, *args, **options):
+        archivos, eventos = recuperar_spools(get_spool_dir(), forzar=options['forzar'])
+        self.stdout.write(self.style.SUCCESS(f"{eventos} eventos reenviados desde {archivos} archivos"))
@@ -0,0 +1,87 @@
+"""
+Mueve los archivos con ruta plana (UUID.ext en la raíz) al reparto <aa>/<bb>/UUID.ext
+sin detener el servicio. Por ruta: enlaza (o copia) el archivo en su nueva ubicación,
+actualiza Documento.ruta y borra el nombre antiguo. Mientras tanto las lecturas siguen
+funcionando: get_document_file_path prueba ambas ubicaciones.
+Se puede interrumpir y volver a ejecutar.
+Uso: python manage.py reorganizar_almacenamiento [--lote 500] [--pausa 0.5] [--dry-run]
+"""
+import os
+import shutil
+import time
+import uuid
+from django.core.management.base import BaseCommand
+
+from api.document_service import is_flat_path, resolve_storage_path, sharded_relative_path
+from api.models import Documento
+
+
+class Command(BaseCommand):
+    help = 'Reparte en subdirectorios <aa>/<bb>/ los documentos guardados en la raíz'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500)
+        parser.add_argument('--pausa', type=float, default=0.0, help='Segundos de espera entre lotes')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        planas = (
+            Documento.objects.exclude(ruta__isnull=True).exclude(ruta='')
+            .exclude(ruta__contains='/').order_by('pk')
+        )
+        resumen = {'movidos': 0, 'faltantes': 0, 'omitidos': 0}
+        ultimo = 0
+        while True:
+            lote = list(planas.filter(pk__gt=ultimo).values_list('pk', 'ruta')[:options['lote']])
+            if not lote:
+                break
+            ultimo = lote[-1][0]
+            for ruta in dict.fromkeys(ruta for _, ruta in lote):
+                self._mover(ruta, options['dry_run'], resumen)
+            self.stdout.write(f"... hasta Id_Documento {ultimo}: {resumen}")
+            if options['pausa']:
+                time.sleep(options['pausa'])
+        self.stdout.write(self.style.SUCCESS(f"Terminado: {resumen}"))
+
+    def _mover(self, ruta, dry_run, resumen):
+        nueva = sharded_relative_path(ruta.strip())
+        origen = resolve_storage_path(ruta)
+        destino = resolve_storage_path(nueva)
+        if not is_flat_path(ruta) or not origen or not destino:
+            resumen['omitidos'] += 1
+            self.stderr.write(f"Ruta no válida, se omite: {ruta!r}")
+            return
+        existe_origen = os.path.isfile(origen)
+        if not existe_origen and not os.path.isfile(destino):
+            resumen['faltantes'] += 1
+            self.stderr.write(f"Archivo no encontrado: {ruta}")
+            return
+        if dry_run:
+            resumen['movidos'] += 1
+            return
+        creado = False
+        if existe_origen and not os.path.isfile(destino):
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            self._enlazar(origen, destino)
+            creado = True
+        if not Documento.objects.filter(ruta=ruta).update(ruta=nueva):
+            # El documento se eliminó mientras tanto: no dejar la copia nueva huérfana
+            if creado:
+                os.remove(destino)
+            resumen['omitidos'] += 1
+            return
+        if existe_origen:
+            try:
+                os.remove(origen)
+            except FileNotFoundError:
+                pass
+        resumen['movidos'] += 1
+
+    def _enlazar(self, origen, destino):
+        """Enlace duro (sin copiar datos); si el sistema de archivos no lo permite, copia atómica."""
+        try:
+            os.link(origen, destino)
+        except OSError:
+            temporal = os.path.join(os.path.dirname(destino), f".subida-{uuid.uuid4().hex}.part")
+            shutil.copyfile(origen, temporal)
+            os.replace(temporal, destino)
@@ -0,0 +1,157 @@
+"""
+Verifica los archivos de documentos contra Documento.checksum_sha256 y tamano_bytes.
+- Recorre Documento por lotes de Id_Documento; cada lote se hashea en un pool de procesos
+  (--procesos) con lectura limitada (--mb-por-segundo, repartido entre procesos) y a baja
+  prioridad, para poder ejecutarlo en horario laboral.
+- Informa de archivos faltantes, corruptos (checksum distinto), con tamaño distinto, sin
+  checksum registrado (--completar los rellena) y, al final, de los archivos huérfanos del
+  almacenamiento (en disco sin Documento).
+- Reanudable: guarda el último Id_Documento verificado en --estado
+  (DOCUMENT_SCRUB_STATE_FILE); --max-minutos corta la ejecución y la siguiente sigue desde ahí.
+Uso: python manage.py verificar_integridad [--procesos 2] [--mb-por-segundo 20]
+     [--max-minutos 60] [--informe problemas.jsonl] [--completar] [--reiniciar]
+"""
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from api import integridad
+from api.document_service import get_document_file_path, get_document_storage_root
+from api.miniaturas import MINIATURAS_DIR
+from api.models import Documento
+
+PROBLEMAS = (
+    integridad.ESTADO_FALTANTE, integridad.ESTADO_CORRUPTO, integridad.ESTADO_TAMANO,
+    integridad.ESTADO_SIN_CHECKSUM, integridad.ESTADO_ERROR,
+)
+
+
+class Command(BaseCommand):
+    help = 'Verifica checksum y tamaño de los archivos de documentos e informa de faltantes, corruptos y huérfanos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=min(4, os.cpu_count() or 1))
+        parser.add_argument('--lote', type=int, default=200)
+        parser.add_argument('--mb-por-segundo', type=float, default=None,
+                            help='Lectura total máxima; por defecto DOCUMENT_SCRUB_MB_PER_SECOND, 0 = sin límite')
+        parser.add_argument('--bufer-mb', type=int, default=8, help='Búfer de lectura por proceso')
+        parser.add_argument('--estado', default=None, help='Por defecto DOCUMENT_SCRUB_STATE_FILE')
+        parser.add_argument('--reiniciar', action='store_true', help='Empieza una pasada nueva desde el principio')
+        parser.add_argument('--max-minutos', type=float, default=0, help='0 = hasta terminar')
+        parser.add_argument('--informe', default=None, help='Añade cada problema como una línea JSON')
+        parser.add_argument('--completar', action='store_true',
+                            help='Rellena checksum_sha256/tamano_bytes de los documentos que no los tienen')
+        parser.add_argument('--sin-huerfanos', action='store_true', help='No recorre el almacenamiento buscando huérfanos')
+
+    def handle(self, *args, **options):
+        self.ruta_estado = options['estado'] or getattr(settings, 'DOCUMENT_SCRUB_STATE_FILE')
+        estado = self._leer_estado()
+        if options['reiniciar'] or estado.get('completado'):
+            estado = {}
+        if not estado:
+            estado = {'inicio': timezone.now().isoformat(), 'ultimo_id': 0, 'resumen': {}}
+            self.stdout.write("Nueva pasada de verificación")
+        else:
+            self.stdout.write(f"Reanudando desde Id_Documento {estado['ultimo_id']}")
+        resumen = estado['resumen']
+        self.informe = open(options['informe'], 'a', encoding='utf-8') if options['informe'] else None
+        mb = options['mb_por_segundo']
+        if mb is None:
+            mb = getattr(settings, 'DOCUMENT_SCRUB_MB_PER_SECOND', 0)
+        procesos = max(1, options['procesos'])
+        limite = time.monotonic() + options['max_minutos'] * 60 if options['max_minutos'] else None
+
+        documentos = (
+            Documento.objects.exclude(ruta__isnull=True).exclude(ruta='')
+            .only('pk', 'ruta', 'tamano_bytes', 'checksum_sha256').order_by('pk')
+        )
+        # spawn: los procesos del pool no heredan la conexión a la BD ni los hilos del padre
+        with ProcessPoolExecutor(
+            max_workers=procesos,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=integridad.iniciar_trabajador,
+            initargs=(int(mb * 1024 * 1024 / procesos), options['bufer_mb'] * 1024 * 1024, 10),
+        ) as pool:
+            while True:
+                lote = list(documentos.filter(pk__gt=estado['ultimo_id'])[:options['lote']])
+                if not lote:
+                    break
+                self._verificar_lote(pool, lote, procesos, resumen, options['completar'])
+                estado['ultimo_id'] = lote[-1].pk
+                self._guardar_estado(estado)
+                self.stdout.write(f"... hasta Id_Documento {estado['ultimo_id']}: {resumen}")
+                close_old_connections()
+                if limite and time.monotonic() >= limite:
+                    self.stdout.write(self.style.WARNING(
+                        f"Tiempo agotado; la próxima ejecución sigue desde Id_Documento {estado['ultimo_id']}"
+                    ))
+                    self._cerrar_informe()
+                    return
+
+        if not options['sin_huerfanos']:
+            for ruta in integridad.archivos_huerfanos(
+                integridad.recorrer_almacenamiento(get_document_storage_root(), excluir={MINIATURAS_DIR}),
+                integridad.rutas_en_bd(),
+            ):
+                resumen['huerfanos'] = resumen.get('huerfanos', 0) + 1
+                self._problema('huerfano', ruta=ruta)
+        estado['completado'] = True
+        estado['fin'] = timezone.now().isoformat()
+        self._guardar_estado(estado)
+        self._cerrar_informe()
+        self.stdout.write(self.style.SUCCESS(f"Terminado: {resumen}"))
+
+    def _verificar_lote(self, pool, lote, procesos, resumen, completar):
+        # Varios Documento pueden compartir archivo (almacén CAS): se hashea una vez
+        tareas = {}
+        for documento in lote:
+            clave = (get_document_file_path(documento), documento.tamano_bytes, documento.checksum_sha256)
+            tareas.setdefault(clave, []).append(documento)
+        claves = list(tareas)
+        resultados = pool.map(integridad.verificar_archivo, claves,
+                              chunksize=max(1, len(claves) // (procesos * 4)))
+        for clave, (estado, checksum, tamano, detalle) in zip(claves, resultados):
+            for documento in tareas[clave]:
+                resumen[estado] = resumen.get(estado, 0) + 1
+                if estado in PROBLEMAS:
+                    self._problema(estado, documento=documento.pk, ruta=documento.ruta,
+                                   checksum=checksum, tamano=tamano, detalle=detalle)
+                if completar and checksum and not documento.checksum_sha256:
+                    Documento.objects.filter(pk=documento.pk).update(
+                        checksum_sha256=checksum, tamano_bytes=tamano,
+                    )
+                elif completar and estado == integridad.ESTADO_OK and documento.tamano_bytes is None:
+                    Documento.objects.filter(pk=documento.pk).update(tamano_bytes=tamano)
+
+    def _problema(self, estado, **datos):
+        texto = ', '.join(f'{k}={v}' for k, v in datos.items() if v not in (None, ''))
+        self.stderr.write(f"{estado}: {texto}")
+        if self.informe:
+            self.informe.write(json.dumps({'estado': estado, 'fecha': timezone.now().isoformat(), **datos}) + '\n')
+            self.informe.flush()
+
+    def _cerrar_informe(self):
+        if self.informe:
+            self.informe.close()
+
+    def _leer_estado(self):
+        try:
+            with open(self.ruta_estado, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _guardar_estado(self, estado):
+        directorio = os.path.dirname(os.path.abspath(self.ruta_estado))
+        os.makedirs(directorio, exist_ok=True)
+        temporal = os.path.join(directorio, f".verificacion-{uuid.uuid4().hex}.part")
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(estado, f)
+        os.replace(temporal, self.ruta_estado)
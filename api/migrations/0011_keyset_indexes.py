@@ -0,0 +1,46 @@
+# Índices (orden del modelo + PK) para la paginación por keyset (?cursor=)
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_documento_privado_auditoria'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(fields=['-fecha_generada', 'id_alerta'], name='alerta_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditoriadocumento',
+            index=models.Index(fields=['-fecha', 'id_auditoria'], name='auditoria_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carpeta',
+            index=models.Index(fields=['-fecha_creacion', 'nombre', 'id_carpeta'], name='carpeta_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['-fecha_inicio', 'id_caso'], name='caso_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['-fecha_carga', 'id_documento'], name='documento_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='empleado',
+            index=models.Index(fields=['apellido', 'nombre', 'id_empleado'], name='empleado_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seguimiento',
+            index=models.Index(fields=['-fecha', 'id_seguimiento'], name='seguimiento_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['nombre', 'id'], name='usuario_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Índices para los filtros y órdenes de los viewsets (incluye índices parciales)
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(fields=['estado', '-fecha_generada'], name='alerta_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(fields=['caso', '-fecha_generada'], name='alerta_caso_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['fecha_vencimiento'], name='alerta_pendientes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditoriadocumento',
+            index=models.Index(fields=['documento', '-fecha'], name='auditoria_documento_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carpeta',
+            index=models.Index(fields=['empleado', '-fecha_creacion'], name='carpeta_empleado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['empleado', 'estado'], name='caso_empleado_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['estado', '-fecha_inicio'], name='caso_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['tipo_fuero'], name='caso_tipo_fuero_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(condition=models.Q(('estado', 'abierto')), fields=['-fecha_inicio'], name='caso_abiertos_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['caso', '-fecha_carga'], name='documento_caso_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['tipo'], name='documento_tipo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['nivel_sensibilidad', '-fecha_carga'], name='documento_nivel_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='empleado',
+            index=models.Index(fields=['estado'], name='empleado_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='empleado',
+            index=models.Index(fields=['area'], name='empleado_area_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='empleado',
+            index=models.Index(fields=['tipo_documento'], name='empleado_tipo_doc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seguimiento',
+            index=models.Index(fields=['caso', '-fecha'], name='seguimiento_caso_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Búsqueda de empleados en PostgreSQL: pg_trgm + unaccent e índice GIN de trigramas sobre
+# el nombre completo sin tildes. El prefijo de Numero_Documento ya lo cubre el índice
+# varchar_pattern_ops (_like) que Django crea para el campo unique.
+# Crear extensiones requiere privilegios; si no se tienen, crearlas antes como superusuario.
+# En otros motores (SQLite) la migración no hace nada: api/search.py usa icontains.
+
+from django.db import migrations
+
+SQL_CREAR = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE EXTENSION IF NOT EXISTS unaccent',
+    # unaccent() no es IMMUTABLE; el envoltorio permite usarlo en un índice de expresión
+    """CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+       LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+       AS $$ SELECT public.unaccent('public.unaccent', $1) $$""",
+    """CREATE INDEX IF NOT EXISTS empleado_busqueda_trgm_idx ON "Empleado"
+       USING gin (f_unaccent(lower("Nombre" || ' ' || "Apellido")) gin_trgm_ops)""",
+]
+
+SQL_BORRAR = [
+    'DROP INDEX IF EXISTS empleado_busqueda_trgm_idx',
+    'DROP FUNCTION IF EXISTS f_unaccent(text)',
+]
+
+
+def _ejecutar(sentencias):
+    def operacion(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in sentencias:
+            schema_editor.execute(sql)
+    return operacion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(_ejecutar(SQL_CREAR), _ejecutar(SQL_BORRAR)),
+    ]
@@ -0,0 +1,28 @@
+# Tabla Archivo_Documento: contenido deduplicado por SHA-256 con contador de referencias
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_empleado_busqueda_trigram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoDocumento',
+            fields=[
+                ('checksum_sha256', models.CharField(db_column='Checksum_SHA256', max_length=64, primary_key=True, serialize=False)),
+                ('ruta', models.TextField(db_column='Ruta')),
+                ('tamano_bytes', models.BigIntegerField(db_column='Tamano_Bytes')),
+                ('referencias', models.PositiveIntegerField(db_column='Referencias', default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, db_column='Fecha_Creacion')),
+            ],
+            options={
+                'verbose_name': 'Archivo de documento',
+                'verbose_name_plural': 'Archivos de documentos',
+                'db_table': 'Archivo_Documento',
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Auditoria_Documento.Fecha con default en lugar de auto_now_add (escritor de auditoría asíncrono)
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_archivo_documento_cas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditoriadocumento',
+            name='fecha',
+            field=models.DateTimeField(db_column='Fecha', default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Auditoria_Documento pasa a tabla particionada por rango mensual de "Fecha" (PostgreSQL).
+# La clave primaria de una tabla particionada debe incluir la columna de partición:
+# en BD es ("Id_Auditoria", "Fecha"); Id_Auditoria sigue siendo único por secuencia.
+# Se crean particiones desde el mes de la fila más antigua hasta 3 meses adelante, más una
+# DEFAULT; después, `manage.py particiones_auditoria` crea las futuras y archiva las viejas.
+# Copia toda la tabla: con muchas filas, ejecutar en una ventana de mantenimiento.
+# En otros motores (SQLite) la migración no hace nada.
+
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import migrations
+
+TABLA = 'Auditoria_Documento'
+NUEVA = 'Auditoria_Documento_nueva'
+SECUENCIA = 'Auditoria_Documento_Id_Auditoria_seq'
+MESES_FUTUROS = 3
+
+
+def _meses(desde, hasta):
+    anio, mes = desde
+    while (anio, mes) <= hasta:
+        yield anio, mes
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+
+def _limite(anio, mes):
+    return datetime(anio, mes, 1, tzinfo=ZoneInfo(settings.TIME_ZONE)).isoformat()
+
+
+def _crear_relaciones(schema_editor, modelo):
+    """FKs e índices con los mismos nombres que generaría Django para el modelo."""
+    for nombre in ('documento', 'usuario'):
+        campo = modelo._meta.get_field(nombre)
+        schema_editor.execute(schema_editor._create_fk_sql(modelo, campo, '_fk_%(to_table)s_%(to_column)s'))
+        schema_editor.execute(schema_editor._create_index_sql(modelo, fields=[campo]))
+    for indice in modelo._meta.indexes:
+        schema_editor.add_index(modelo, indice)
+
+
+def particionar(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    modelo = apps.get_model('api', 'AuditoriaDocumento')
+    execute = schema_editor.execute
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT min("Fecha") FROM "{TABLA}"')
+        minimo = cursor.fetchone()[0]
+    zona = ZoneInfo(settings.TIME_ZONE)
+    hoy = datetime.now(zona)
+    inicio = minimo.astimezone(zona) if minimo else hoy
+    fin_anio, fin_mes = divmod(hoy.year * 12 + hoy.month - 1 + MESES_FUTUROS, 12)
+
+    execute(f'CREATE TABLE "{NUEVA}" (LIKE "{TABLA}") PARTITION BY RANGE ("Fecha")')
+    execute(f'CREATE SEQUENCE "{NUEVA}_seq" OWNED BY "{NUEVA}"."Id_Auditoria"')
+    execute(f'ALTER TABLE "{NUEVA}" ALTER COLUMN "Id_Auditoria" SET DEFAULT nextval(\'"{NUEVA}_seq"\')')
+    execute(f'ALTER TABLE "{NUEVA}" ADD CONSTRAINT "{NUEVA}_pkey" PRIMARY KEY ("Id_Auditoria", "Fecha")')
+    execute(f'CREATE TABLE "{TABLA}_pdefault" PARTITION OF "{NUEVA}" DEFAULT')
+    for anio, mes in _meses((inicio.year, inicio.month), (fin_anio, fin_mes + 1)):
+        siguiente = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+        execute(
+            f'CREATE TABLE "{TABLA}_p{anio:04d}_{mes:02d}" PARTITION OF "{NUEVA}" '
+            f"FOR VALUES FROM ('{_limite(anio, mes)}') TO ('{_limite(*siguiente)}')"
+        )
+    execute(f'INSERT INTO "{NUEVA}" SELECT * FROM "{TABLA}"')
+    execute(f'SELECT setval(\'"{NUEVA}_seq"\', COALESCE(max("Id_Auditoria"), 0) + 1, false) FROM "{NUEVA}"')
+    execute(f'DROP TABLE "{TABLA}"')
+    execute(f'ALTER TABLE "{NUEVA}" RENAME TO "{TABLA}"')
+    execute(f'ALTER TABLE "{TABLA}" RENAME CONSTRAINT "{NUEVA}_pkey" TO "{TABLA}_pkey"')
+    execute(f'ALTER SEQUENCE "{NUEVA}_seq" RENAME TO "{SECUENCIA}"')
+    _crear_relaciones(schema_editor, modelo)
+
+
+def desparticionar(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    modelo = apps.get_model('api', 'AuditoriaDocumento')
+    execute = schema_editor.execute
+    execute(f'CREATE TABLE "{NUEVA}" (LIKE "{TABLA}" INCLUDING DEFAULTS)')
+    execute(f'ALTER SEQUENCE "{SECUENCIA}" OWNED BY NONE')
+    execute(f'INSERT INTO "{NUEVA}" SELECT * FROM "{TABLA}"')
+    execute(f'DROP TABLE "{TABLA}"')
+    execute(f'ALTER TABLE "{NUEVA}" RENAME TO "{TABLA}"')
+    execute(f'ALTER SEQUENCE "{SECUENCIA}" OWNED BY "{TABLA}"."Id_Auditoria"')
+    execute(f'ALTER TABLE "{TABLA}" ADD CONSTRAINT "{TABLA}_pkey" PRIMARY KEY ("Id_Auditoria")')
+    _crear_relaciones(schema_editor, modelo)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_auditoria_fecha_evento'),
+    ]
+
+    operations = [
+        migrations.RunPython(particionar, desparticionar),
+    ]
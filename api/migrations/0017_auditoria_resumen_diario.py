@@ -0,0 +1,34 @@
+# Resumen diario de auditoría (conteos por día/documento/usuario/acción) para reportes
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_auditoria_particionada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditoriaResumenDiario',
+            fields=[
+                ('id_resumen', models.BigAutoField(db_column='Id_Resumen', primary_key=True, serialize=False)),
+                ('dia', models.DateField(db_column='Dia')),
+                ('accion', models.CharField(choices=[('SUBIDA', 'Subida'), ('DESCARGA', 'Descarga'), ('ELIMINADO', 'Eliminado')], db_column='Accion', max_length=20)),
+                ('total', models.PositiveIntegerField(db_column='Total', default=0)),
+                ('documento', models.ForeignKey(db_column='Id_Documento', on_delete=django.db.models.deletion.CASCADE, related_name='resumen_auditoria', to='api.documento')),
+                ('usuario', models.ForeignKey(db_column='Id_Usuario', on_delete=django.db.models.deletion.CASCADE, related_name='resumen_auditoria', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Resumen diario de auditoría',
+                'verbose_name_plural': 'Resúmenes diarios de auditoría',
+                'db_table': 'Auditoria_Resumen_Diario',
+                'ordering': ['-dia'],
+                'indexes': [models.Index(fields=['documento', 'dia'], name='resumen_documento_dia_idx'), models.Index(fields=['usuario', 'dia'], name='resumen_usuario_dia_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dia', 'documento', 'usuario', 'accion'), name='resumen_auditoria_clave_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Empleado.foto_variantes: tamaños WebP/JPEG generados de la foto (api/fotos.py).
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_auditoria_resumen_diario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empleado',
+            name='foto_variantes',
+            field=models.JSONField(blank=True, db_column='Foto_Variantes', editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Subida_Documento: subidas reanudables por fragmentos (api/subidas.py).
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_empleado_foto_variantes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaDocumento',
+            fields=[
+                ('id_subida', models.UUIDField(db_column='Id_Subida', default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre_archivo', models.CharField(db_column='Nombre_Archivo', max_length=255)),
+                ('datos', models.JSONField(db_column='Datos', default=dict)),
+                ('tamano_total', models.BigIntegerField(db_column='Tamano_Total')),
+                ('recibidos', models.BigIntegerField(db_column='Recibidos', default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, db_column='Fecha_Creacion')),
+                ('fecha_actualizacion', models.DateTimeField(db_column='Fecha_Actualizacion', db_index=True, default=django.utils.timezone.now)),
+                ('usuario', models.ForeignKey(db_column='Id_Usuario', on_delete=django.db.models.deletion.CASCADE, related_name='subidas_documentos', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Subida de documento',
+                'verbose_name_plural': 'Subidas de documentos',
+                'db_table': 'Subida_Documento',
+            },
+        ),
+    ]
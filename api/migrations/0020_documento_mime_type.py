@@ -0,0 +1,18 @@
+# Documento.mime_type: tipo detectado por contenido al subir (api/tipos_mime.py).
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_subida_documento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='mime_type',
+            field=models.CharField(blank=True, db_column='Mime_Type', max_length=100, null=True),
+        ),
+    ]
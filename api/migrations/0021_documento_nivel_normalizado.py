@@ -0,0 +1,23 @@
+# Índice de Documento sobre el nivel normalizado del predicado de acceso (DocumentoQuerySet._acceso_q).
+
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_documento_mime_type'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='documento',
+            name='documento_nivel_fecha_idx',
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Coalesce(django.db.models.functions.comparison.NullIf('nivel_sensibilidad', models.Value('')), models.Value('CONFIDENCIAL'))), models.OrderBy(models.F('fecha_carga'), descending=True), name='documento_nivel_fecha_idx'),
+        ),
+    ]
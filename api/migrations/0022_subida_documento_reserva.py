@@ -0,0 +1,18 @@
+# Reserva del fragmento en curso de una subida por fragmentos (api/subidas.py).
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_documento_nivel_normalizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subidadocumento',
+            name='reserva',
+            field=models.UUIDField(blank=True, db_column='Reserva', null=True),
+        ),
+    ]
@@ -0,0 +1,138 @@
+"""
+Miniaturas de documentos (primera página / imagen reducida) para los listados.
+- Se generan al subir (save_uploaded_file) en un pool de hilos del proceso, fuera de la
+  petición; si faltan (proceso reiniciado, documentos anteriores) se generan al pedirlas.
+- Imágenes con Pillow; PDF con `pdftoppm` (poppler-utils, DOCUMENT_PDFTOPPM_PATH) si está
+  instalado; sin él los PDF no tienen miniatura.
+- Se guardan en la raíz privada por checksum: miniaturas/<aa>/<bb>/<sha256>.webp. El mismo
+  contenido comparte miniatura y su URL se puede cachear sin caducidad.
+"""
+import functools
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+
+from .document_service import get_document_storage_root
+
+logger = logging.getLogger(__name__)
+
+MINIATURAS_DIR = 'miniaturas'
+EXTENSIONES_IMAGEN = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'tif', 'tiff'}
+EXTENSIONES_PDF = {'pdf'}
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def habilitadas():
+    return getattr(settings, 'DOCUMENT_THUMBNAILS', True)
+
+
+def _tamano():
+    return getattr(settings, 'DOCUMENT_THUMBNAIL_SIZE', 320)
+
+
+@functools.lru_cache(maxsize=8)
+def _buscar_ejecutable(nombre):
+    return shutil.which(nombre)
+
+
+def _pdftoppm():
+    # soporta() se consulta por fila al serializar listados: no recorrer PATH cada vez
+    return _buscar_ejecutable(getattr(settings, 'DOCUMENT_PDFTOPPM_PATH', 'pdftoppm'))
+
+
+def soporta(extension):
+    """Si hay forma de generar miniatura para esa extensión (sin mirar el archivo)."""
+    extension = (extension or '').lower()
+    return extension in EXTENSIONES_IMAGEN or (extension in EXTENSIONES_PDF and _pdftoppm() is not None)
+
+
+def ruta_miniatura(checksum):
+    """Ruta relativa de la miniatura del contenido con ese SHA-256."""
+    return '/'.join((MINIATURAS_DIR, checksum[:2], checksum[2:4], f'{checksum}.webp'))
+
+
+def path_miniatura(checksum):
+    return os.path.join(get_document_storage_root(), *ruta_miniatura(checksum).split('/'))
+
+
+def _abrir_pdf(path, lado):
+    """Primera página del PDF como imagen (pdftoppm en un directorio temporal)."""
+    from PIL import Image
+    with tempfile.TemporaryDirectory(prefix='miniatura-') as trabajo:
+        salida = os.path.join(trabajo, 'pagina')
+        subprocess.run(
+            [_pdftoppm(), '-f', '1', '-l', '1', '-singlefile', '-png', '-scale-to', str(lado), path, salida],
+            check=True, timeout=60, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        with Image.open(salida + '.png') as imagen:
+            imagen.load()
+            return imagen.copy()
+
+
+def generar_miniatura(path, checksum, extension):
+    """
+    Genera la miniatura si no existe. Returns: path absoluto de la miniatura, o None si
+    el tipo no se soporta o el archivo no se pudo leer como imagen/PDF.
+    """
+    from PIL import Image, ImageOps
+    destino = path_miniatura(checksum)
+    if os.path.isfile(destino):
+        return destino
+    extension = (extension or '').lower()
+    if not soporta(extension):
+        return None
+    lado = _tamano()
+    try:
+        if extension in EXTENSIONES_PDF:
+            imagen = _abrir_pdf(path, lado)
+        else:
+            with Image.open(path) as original:
+                # JPEG: decodificar ya reducido (1/2, 1/4, 1/8) en vez de la foto completa
+                original.draft('RGB', (lado, lado))
+                imagen = ImageOps.exif_transpose(original)
+        with imagen:
+            imagen.thumbnail((lado, lado))
+            if imagen.mode not in ('RGB', 'RGBA'):
+                imagen = imagen.convert('RGBA' if 'A' in imagen.getbands() or 'transparency' in imagen.info else 'RGB')
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            temporal = os.path.join(os.path.dirname(destino), f".subida-{uuid.uuid4().hex}.part")
+            try:
+                imagen.save(temporal, 'WEBP', quality=80, method=4)
+                os.replace(temporal, destino)
+            finally:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+    except (OSError, ValueError, Image.DecompressionBombError, subprocess.SubprocessError) as e:
+        logger.warning("Sin miniatura para %s: %s", path, e)
+        return None
+    return destino
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'DOCUMENT_THUMBNAIL_WORKERS', 2),
+                thread_name_prefix='miniaturas',
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def programar(path, checksum, extension):
+    """Encola la generación de la miniatura (no bloquea la subida)."""
+    if not habilitadas() or not checksum or not soporta(extension):
+        return None
+    if os.path.isfile(path_miniatura(checksum)):
+        return None
+    return _get_pool().submit(generar_miniatura, path, checksum, extension)
@@ -1,9 +1,13 @@
 from django.db import models
+from django.db.models import F, Q, Value, BooleanField, ExpressionWrapper, OuterRef, Subquery, Count
+from django.db.models.functions import Coalesce, NullIf, Upper
+from django.db.models.lookups import Exact
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from rest_framework.authtoken.models import Token as DRFToken
 from django.conf import settings
 from datetime import timedelta
+import uuid
 
 
 class Rol(models.Model):
@@ -43,6 +47,7 @@ class User(AbstractUser):
         verbose_name = 'Usuario'
         verbose_name_plural = 'Usuarios'
         ordering = ['nombre']
+        indexes = [models.Index(fields=['nombre', 'id'], name='usuario_keyset_idx')]
     
     def __str__(self):
         return f"{self.nombre} ({self.rol.tipo if self.rol else 'Sin rol'})"
@@ -70,7 +75,10 @@ class ExpiringToken(DRFToken):
         verbose_name_plural = 'Tokens con Expiración'
     
     def is_expired(self):
-        """Verifica si el token ha expirado basado en última actividad"""
+        """
+        Verifica si el token ha expirado basado en última actividad.
+        Con escrituras agrupadas la precisión es de TOKEN_ACTIVITY_THRESHOLD_SECONDS.
+        """
         minutos_expiracion = getattr(settings, 'TOKEN_EXPIRATION_MINUTES', 30)
         # Usar última actividad en lugar de fecha de creación para mejor UX
         tiempo_inactivo = (timezone.now() - self.ultima_actividad).total_seconds()
@@ -81,6 +89,46 @@ class ExpiringToken(DRFToken):
             self.fecha_creacion = timezone.now()
         self.ultima_actividad = timezone.now()
         return super().save(*args, **kwargs)
+    
+    def registrar_actividad(self):
+        """
+        Expiración deslizante con escrituras agrupadas: solo persiste ultima_actividad
+        cuando ha derivado más de TOKEN_ACTIVITY_THRESHOLD_SECONDS (0 = en cada petición).
+        El UPDATE toca solo la columna y solo si nadie la refrescó antes, así peticiones
+        concurrentes del mismo usuario no reescriben la fila.
+        Retorna True si se escribió en BD.
+        """
+        ahora = timezone.now()
+        umbral = timedelta(seconds=getattr(settings, 'TOKEN_ACTIVITY_THRESHOLD_SECONDS', 60))
+        if self.ultima_actividad and ahora - self.ultima_actividad < umbral:
+            return False
+        filtro = ExpiringToken.objects.filter(pk=self.pk)
+        if umbral:
+            filtro = filtro.filter(ultima_actividad__lte=ahora - umbral)
+        actualizado = filtro.update(ultima_actividad=ahora)
+        self.ultima_actividad = ahora
+        return bool(actualizado)
+
+
+def _conteo_relacionado(modelo, campo='caso', **filtros):
+    """Subconsulta COUNT(*) de filas de `modelo` que apuntan a la fila externa por `campo` (0 si no hay)."""
+    conteo = (
+        modelo.objects.filter(**{campo: OuterRef('pk')}, **filtros)
+        .order_by().values(campo).annotate(total=Count('pk')).values('total')
+    )
+    return Coalesce(Subquery(conteo, output_field=models.IntegerField()), 0)
+
+
+class EmpleadoQuerySet(models.QuerySet):
+    """Consultas de empleados con los datos que necesita EmpleadoSerializer."""
+
+    def con_totales(self):
+        """Anota total_casos y casos_<estado> para cada estado de Caso.ESTADO_CHOICES."""
+        por_estado = {
+            f'casos_{estado}': _conteo_relacionado(Caso, 'empleado', estado=estado)
+            for estado, _ in Caso.ESTADO_CHOICES
+        }
+        return self.annotate(total_casos=_conteo_relacionado(Caso, 'empleado'), **por_estado)
 
 
 class Empleado(models.Model):
@@ -108,6 +156,7 @@ class Empleado(models.Model):
     telefono = models.CharField(max_length=50, db_column='Telefono')  # Ahora obligatorio
     estado = models.CharField(max_length=50, blank=True, null=True, db_column='Estado', default='Activo')
     foto = models.ImageField(upload_to='empleados/fotos/', blank=True, null=True)  # Campo adicional no en BD
+    foto_variantes = models.JSONField(blank=True, null=True, editable=False, db_column='Foto_Variantes')  # Tamaños WebP/JPEG generados (api/fotos.py)
     
     # Nuevos campos obligatorios
     ciudad = models.CharField(max_length=100, db_column='Ciudad')  # Ahora obligatorio
@@ -118,16 +167,36 @@ class Empleado(models.Model):
         choices=TIPO_DOCUMENTO_CHOICES
     )  # Ahora obligatorio
     
+    objects = EmpleadoQuerySet.as_manager()
+    
     class Meta:
         db_table = 'Empleado'
         verbose_name = 'Empleado'
         verbose_name_plural = 'Empleados'
         ordering = ['apellido', 'nombre']
+        indexes = [
+            models.Index(fields=['apellido', 'nombre', 'id_empleado'], name='empleado_keyset_idx'),
+            models.Index(fields=['estado'], name='empleado_estado_idx'),
+            models.Index(fields=['area'], name='empleado_area_idx'),
+            models.Index(fields=['tipo_documento'], name='empleado_tipo_doc_idx'),
+        ]
     
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
 
 
+class CasoQuerySet(models.QuerySet):
+    """Consultas de casos con los datos que necesita CasoSerializer."""
+
+    def con_totales(self):
+        """Carga empleado/responsable y anota total_documentos, total_alertas y total_seguimientos."""
+        return self.select_related('empleado', 'responsable').annotate(
+            total_documentos=_conteo_relacionado(Documento),
+            total_alertas=_conteo_relacionado(Alerta),
+            total_seguimientos=_conteo_relacionado(Seguimiento),
+        )
+
+
 class Caso(models.Model):
     """Casos de documentación - Mapea a tabla Caso"""
     ESTADO_CHOICES = [
@@ -151,11 +220,20 @@ class Caso(models.Model):
     fecha_cierre = models.DateField(blank=True, null=True, db_column='Fecha_Cierre')
     observaciones = models.TextField(blank=True, null=True, db_column='Observaciones')
     
+    objects = CasoQuerySet.as_manager()
+    
     class Meta:
         db_table = 'Caso'
         verbose_name = 'Caso'
         verbose_name_plural = 'Casos'
         ordering = ['-fecha_inicio']
+        indexes = [
+            models.Index(fields=['-fecha_inicio', 'id_caso'], name='caso_keyset_idx'),
+            models.Index(fields=['empleado', 'estado'], name='caso_empleado_estado_idx'),
+            models.Index(fields=['estado', '-fecha_inicio'], name='caso_estado_fecha_idx'),
+            models.Index(fields=['tipo_fuero'], name='caso_tipo_fuero_idx'),
+            models.Index(fields=['-fecha_inicio'], condition=Q(estado='abierto'), name='caso_abiertos_idx'),
+        ]
     
     def __str__(self):
         return f"Caso #{self.id_caso} - {self.empleado} ({self.estado})"
@@ -197,6 +275,12 @@ class Alerta(models.Model):
         verbose_name = 'Alerta'
         verbose_name_plural = 'Alertas'
         ordering = ['-fecha_generada']
+        indexes = [
+            models.Index(fields=['-fecha_generada', 'id_alerta'], name='alerta_keyset_idx'),
+            models.Index(fields=['estado', '-fecha_generada'], name='alerta_estado_fecha_idx'),
+            models.Index(fields=['caso', '-fecha_generada'], name='alerta_caso_fecha_idx'),
+            models.Index(fields=['fecha_vencimiento'], condition=Q(estado='pendiente'), name='alerta_pendientes_idx'),
+        ]
     
     def __str__(self):
         return f"{self.titulo} - {self.caso}"
@@ -214,11 +298,57 @@ class Carpeta(models.Model):
         verbose_name = 'Carpeta'
         verbose_name_plural = 'Carpetas'
         ordering = ['-fecha_creacion', 'nombre']
+        indexes = [
+            models.Index(fields=['-fecha_creacion', 'nombre', 'id_carpeta'], name='carpeta_keyset_idx'),
+            models.Index(fields=['empleado', '-fecha_creacion'], name='carpeta_empleado_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"{self.nombre} - {self.empleado}"
 
 
+def nivel_normalizado():
+    """
+    Nivel_Sensibilidad como lo interpreta user_can_access_document:
+    (nivel_sensibilidad or 'CONFIDENCIAL').upper(), para filas antiguas en minúsculas o NULL.
+    """
+    return Upper(Coalesce(NullIf('nivel_sensibilidad', Value('')), Value('CONFIDENCIAL')))
+
+
+class DocumentoQuerySet(models.QuerySet):
+    """Consultas de documentos con reglas de visibilidad (Rol + Nivel_Sensibilidad) en SQL."""
+
+    def _acceso_q(self, user):
+        """
+        Predicado de acceso equivalente a user_can_access_document.
+        Retorna None si el usuario ve todo (Administrador/THA).
+        """
+        from .authentication import Principal
+        if Principal.for_user(user).is_admin_or_tha:
+            return None
+        nivel = nivel_normalizado()
+        return Q(Exact(nivel, 'PUBLICO')) | (
+            Q(Exact(nivel, 'CONFIDENCIAL'))
+            & (Q(caso__responsable_id=user.pk) | Q(usuario_creador_id=user.pk))
+        )
+
+    def visible_to(self, user):
+        """Filtra los documentos que el usuario puede ver, descargar o eliminar."""
+        if not user or not user.is_authenticated:
+            return self.none()
+        q = self._acceso_q(user)
+        return self if q is None else self.filter(q)
+
+    def con_acceso(self, user):
+        """Anota puede_acceder (bool) sin filtrar, para distinguir 403 de 404 en una sola consulta."""
+        if not user or not user.is_authenticated:
+            return self.annotate(puede_acceder=Value(False, output_field=BooleanField()))
+        q = self._acceso_q(user)
+        if q is None:
+            return self.annotate(puede_acceder=Value(True, output_field=BooleanField()))
+        return self.annotate(puede_acceder=ExpressionWrapper(q, output_field=BooleanField()))
+
+
 class Documento(models.Model):
     """Documentos asociados a casos - Mapea a tabla Documento. Sin archivo binario en BD."""
     NIVEL_SENSIBILIDAD_CHOICES = [
@@ -236,7 +366,7 @@ class Documento(models.Model):
     empleado = models.ForeignKey(Empleado, on_delete=models.SET_NULL, blank=True, null=True, db_column='Id_Empleado', related_name='documentos')
     carpeta = models.ForeignKey('Carpeta', on_delete=models.SET_NULL, blank=True, null=True, db_column='Id_Carpeta', related_name='documentos')
     descripcion = models.TextField(blank=True, null=True, db_column='Descripcion')
-    ruta = models.TextField(blank=True, null=True, db_column='Ruta')  # Ruta relativa (nombre UUID.ext), archivo en disco privado
+    ruta = models.TextField(blank=True, null=True, db_column='Ruta')  # Ruta relativa (ab/cd/UUID.ext; antiguas: UUID.ext plano), archivo en disco privado
     extension = models.CharField(max_length=20, blank=True, null=True, db_column='Extension')
     nivel_sensibilidad = models.CharField(
         max_length=20, db_column='Nivel_Sensibilidad', default='CONFIDENCIAL',
@@ -244,12 +374,22 @@ class Documento(models.Model):
     )
     tamano_bytes = models.BigIntegerField(blank=True, null=True, db_column='Tamano_Bytes')
     checksum_sha256 = models.CharField(max_length=64, blank=True, null=True, db_column='Checksum_SHA256')
+    mime_type = models.CharField(max_length=100, blank=True, null=True, db_column='Mime_Type')  # Detectado por contenido al subir (api/tipos_mime.py)
+    
+    objects = DocumentoQuerySet.as_manager()
     
     class Meta:
         db_table = 'Documento'
         verbose_name = 'Documento'
         verbose_name_plural = 'Documentos'
         ordering = ['-fecha_carga']
+        indexes = [
+            models.Index(fields=['-fecha_carga', 'id_documento'], name='documento_keyset_idx'),
+            models.Index(fields=['caso', '-fecha_carga'], name='documento_caso_fecha_idx'),
+            models.Index(fields=['tipo'], name='documento_tipo_idx'),
+            # Sobre la misma expresión que el predicado de acceso (DocumentoQuerySet._acceso_q)
+            models.Index(nivel_normalizado(), F('fecha_carga').desc(), name='documento_nivel_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"{self.nombre or self.ruta} - {self.caso}"
@@ -259,8 +399,74 @@ class Documento(models.Model):
         super().save(*args, **kwargs)
 
 
+class ArchivoDocumento(models.Model):
+    """Contenido físico deduplicado por SHA-256 (almacén CAS) - Tabla adicional"""
+    checksum_sha256 = models.CharField(max_length=64, primary_key=True, db_column='Checksum_SHA256')
+    ruta = models.TextField(db_column='Ruta')  # Relativa a DOCUMENT_STORAGE_ROOT: cas/ab/cd/<sha256>
+    tamano_bytes = models.BigIntegerField(db_column='Tamano_Bytes')
+    referencias = models.PositiveIntegerField(default=0, db_column='Referencias')  # Documento que lo usan
+    fecha_creacion = models.DateTimeField(auto_now_add=True, db_column='Fecha_Creacion')
+    
+    class Meta:
+        db_table = 'Archivo_Documento'
+        verbose_name = 'Archivo de documento'
+        verbose_name_plural = 'Archivos de documentos'
+    
+    def __str__(self):
+        return f"{self.checksum_sha256[:12]}… ({self.referencias} ref.)"
+
+
+class SubidaDocumento(models.Model):
+    """
+    Subida reanudable por fragmentos en curso (api/subidas.py) - Tabla adicional.
+    El contenido recibido está en el temporal .subida-<id>.part de la raíz de documentos;
+    al finalizar se convierte en un Documento y la fila se borra.
+    """
+    id_subida = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, db_column='Id_Subida')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, db_column='Id_Usuario', related_name='subidas_documentos')
+    nombre_archivo = models.CharField(max_length=255, db_column='Nombre_Archivo')
+    datos = models.JSONField(default=dict, db_column='Datos')  # Metadatos del Documento (caso, carpeta, nivel...)
+    tamano_total = models.BigIntegerField(db_column='Tamano_Total')
+    recibidos = models.BigIntegerField(default=0, db_column='Recibidos')  # Bytes contiguos ya escritos
+    reserva = models.UUIDField(blank=True, null=True, db_column='Reserva')  # Fragmento que se está escribiendo (api/subidas.py)
+    fecha_creacion = models.DateTimeField(auto_now_add=True, db_column='Fecha_Creacion')
+    fecha_actualizacion = models.DateTimeField(default=timezone.now, db_column='Fecha_Actualizacion', db_index=True)
+
+    class Meta:
+        db_table = 'Subida_Documento'
+        verbose_name = 'Subida de documento'
+        verbose_name_plural = 'Subidas de documentos'
+
+    def __str__(self):
+        return f"{self.nombre_archivo} ({self.recibidos}/{self.tamano_total} bytes)"
+
+
+class AuditoriaDocumentoQuerySet(models.QuerySet):
+    """
+    Consultas por rango de fechas. En PostgreSQL la tabla está particionada por mes de
+    "Fecha" (ver api/particiones.py): un rango semiabierto [desde, hasta) sobre la columna,
+    sin funciones encima, deja que el planificador lea solo las particiones del rango.
+    """
+
+    def en_rango(self, desde=None, hasta=None):
+        """Eventos con desde <= fecha < hasta (cualquiera de los dos puede omitirse)."""
+        queryset = self
+        if desde is not None:
+            queryset = queryset.filter(fecha__gte=desde)
+        if hasta is not None:
+            queryset = queryset.filter(fecha__lt=hasta)
+        return queryset
+
+    def del_mes(self, anio, mes):
+        from .particiones import limites_mes
+        return self.en_rango(*limites_mes(anio, mes))
+
+
 class AuditoriaDocumento(models.Model):
-    """Auditoría de acciones sobre documentos - Mapea a tabla Auditoria_Documento"""
+    """
+    Auditoría de acciones sobre documentos - Mapea a tabla Auditoria_Documento.
+    En PostgreSQL es una tabla particionada por mes y su PK en BD es (Id_Auditoria, Fecha).
+    """
     ACCION_CHOICES = [
         ('SUBIDA', 'Subida'),
         ('DESCARGA', 'Descarga'),
@@ -270,19 +476,58 @@ class AuditoriaDocumento(models.Model):
     documento = models.ForeignKey(Documento, on_delete=models.CASCADE, db_column='Id_Documento', related_name='auditorias')
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, db_column='Id_Usuario', related_name='auditorias_documento')
     accion = models.CharField(max_length=20, db_column='Accion', choices=ACCION_CHOICES)
-    fecha = models.DateTimeField(auto_now_add=True, db_column='Fecha')
+    # default (no auto_now_add): el escritor asíncrono conserva la hora del evento, no la del INSERT
+    fecha = models.DateTimeField(default=timezone.now, editable=False, db_column='Fecha')
     ip_origen = models.GenericIPAddressField(blank=True, null=True, db_column='Ip_Origen')
+
+    objects = AuditoriaDocumentoQuerySet.as_manager()
     
     class Meta:
         db_table = 'Auditoria_Documento'
         verbose_name = 'Auditoría de documento'
         verbose_name_plural = 'Auditorías de documentos'
         ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['-fecha', 'id_auditoria'], name='auditoria_keyset_idx'),
+            models.Index(fields=['documento', '-fecha'], name='auditoria_documento_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"{self.accion} - Doc #{self.documento_id} - {self.fecha}"
 
 
+class AuditoriaResumenDiario(models.Model):
+    """
+    Conteo de eventos de auditoría por día (TIME_ZONE), documento, usuario y acción.
+    Lo incrementa el mismo escritor que inserta en Auditoria_Documento (api/auditoria.py);
+    se reconstruye con `manage.py recalcular_resumen_auditoria`. Sobrevive al archivo
+    de particiones antiguas de la auditoría.
+    """
+    id_resumen = models.BigAutoField(primary_key=True, db_column='Id_Resumen')
+    dia = models.DateField(db_column='Dia')
+    documento = models.ForeignKey(Documento, on_delete=models.CASCADE, db_column='Id_Documento', related_name='resumen_auditoria')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, db_column='Id_Usuario', related_name='resumen_auditoria')
+    accion = models.CharField(max_length=20, db_column='Accion', choices=AuditoriaDocumento.ACCION_CHOICES)
+    total = models.PositiveIntegerField(default=0, db_column='Total')
+
+    class Meta:
+        db_table = 'Auditoria_Resumen_Diario'
+        verbose_name = 'Resumen diario de auditoría'
+        verbose_name_plural = 'Resúmenes diarios de auditoría'
+        ordering = ['-dia']
+        constraints = [
+            # Clave del upsert incremental (ON CONFLICT); su índice sirve también para rangos por día
+            models.UniqueConstraint(fields=['dia', 'documento', 'usuario', 'accion'], name='resumen_auditoria_clave_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['documento', 'dia'], name='resumen_documento_dia_idx'),
+            models.Index(fields=['usuario', 'dia'], name='resumen_usuario_dia_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.accion} Doc #{self.documento_id} Usr #{self.usuario_id}: {self.total}"
+
+
 class Seguimiento(models.Model):
     """Seguimientos de casos - Mapea a tabla Seguimiento"""
     id_seguimiento = models.AutoField(primary_key=True, db_column='Id_Seguimiento')
@@ -297,6 +542,10 @@ class Seguimiento(models.Model):
         verbose_name = 'Seguimiento'
         verbose_name_plural = 'Seguimientos'
         ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['-fecha', 'id_seguimiento'], name='seguimiento_keyset_idx'),
+            models.Index(fields=['caso', '-fecha'], name='seguimiento_caso_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"Seguimiento #{self.id_seguimiento} - {self.caso} - {self.fecha}"
@@ -0,0 +1,181 @@
+"""
+Paginación del API.
+- Por defecto: PageNumberPagination (?page=N), compatible con el frontend actual.
+- Opt-in ?cursor= (vacío para la primera página): paginación por keyset sobre el
+  Meta.ordering del modelo + PK como desempate. Sin COUNT(*) ni OFFSET.
+  Si el queryset se ordena por una anotación (relevancia de ?search= en PostgreSQL) el
+  keyset no puede reproducir ese orden y se pagina por número de página.
+- ?estimar_total=1 con cursor: total estimado por el planificador (PostgreSQL).
+"""
+import base64
+import binascii
+import json
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+def estimar_total(queryset):
+    """
+    Total aproximado de filas. En PostgreSQL usa la estimación del plan (EXPLAIN),
+    que no recorre la tabla; en otros motores cae a COUNT(*).
+    """
+    queryset = queryset.order_by()
+    if connections[queryset.db].vendor == 'postgresql':
+        plan = json.loads(queryset.explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset.count()
+
+
+def codificar_cursor(valores, reverso=False):
+    """Cursor opaco con los valores (como texto) de los campos de orden de la fila frontera."""
+    datos = {'v': list(valores)}
+    if reverso:
+        datos['r'] = 1
+    return base64.urlsafe_b64encode(json.dumps(datos).encode('ascii')).decode('ascii')
+
+
+def ordenado_por_anotacion(queryset):
+    """Si el order_by explícito usa una anotación o expresión (p. ej. la relevancia de buscar_empleados)."""
+    return any(
+        not isinstance(campo, str) or campo.lstrip('-') in queryset.query.annotations
+        for campo in queryset.query.order_by
+    )
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación por keyset. El orden es `keyset_ordering` de la vista si existe, si no
+    el Meta.ordering del modelo, siempre terminado en la PK. Los campos deben ser no nulos.
+    """
+    cursor_query_param = 'cursor'
+    estimate_query_param = 'estimar_total'
+    invalid_cursor_message = 'Cursor inválido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = api_settings.PAGE_SIZE or 20
+        self.ordering = self._get_ordering(queryset, view)
+        self.campos = [queryset.model._meta.get_field(nombre) for nombre, _ in self.ordering]
+        valores, self.reverso = self._decode_cursor(request)
+        self.total_estimado = None
+        if request.query_params.get(self.estimate_query_param):
+            self.total_estimado = estimar_total(queryset)
+
+        orden = [(nombre, desc != self.reverso) for nombre, desc in self.ordering]
+        queryset = queryset.order_by(*[('-' if desc else '') + nombre for nombre, desc in orden])
+        if valores is not None:
+            queryset = queryset.filter(self._despues_de(orden, valores))
+
+        filas = list(queryset[:self.page_size + 1])
+        hay_mas = len(filas) > self.page_size
+        filas = filas[:self.page_size]
+        if self.reverso:
+            filas.reverse()
+            self.hay_siguiente = bool(filas)
+            self.hay_anterior = hay_mas
+        else:
+            self.hay_siguiente = hay_mas
+            self.hay_anterior = valores is not None and bool(filas)
+        self.filas = filas
+        return filas
+
+    def get_paginated_response(self, data):
+        contenido = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.total_estimado is not None:
+            contenido['total_estimado'] = self.total_estimado
+        return Response(contenido)
+
+    def get_next_link(self):
+        if not self.hay_siguiente:
+            return None
+        return self._link(self.filas[-1], reverso=False)
+
+    def get_previous_link(self):
+        if not self.hay_anterior:
+            return None
+        return self._link(self.filas[0], reverso=True)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'total_estimado': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+
+    # ---------- internos ----------
+
+    def _get_ordering(self, queryset, view):
+        meta = queryset.model._meta
+        ordering = getattr(view, 'keyset_ordering', None) or meta.ordering or []
+        resultado = []
+        for campo in ordering:
+            desc = campo.startswith('-')
+            nombre = campo.lstrip('-')
+            if nombre == 'pk':
+                nombre = meta.pk.name
+            resultado.append((nombre, desc))
+        if meta.pk.name not in [nombre for nombre, _ in resultado]:
+            resultado.append((meta.pk.name, False))
+        return resultado
+
+    def _despues_de(self, orden, valores):
+        """(a, b, c) estrictamente después de (va, vb, vc) según la dirección de cada campo."""
+        condicion = Q()
+        iguales = Q()
+        for (nombre, desc), valor in zip(orden, valores):
+            condicion |= iguales & Q(**{f"{nombre}__{'lt' if desc else 'gt'}": valor})
+            iguales &= Q(**{nombre: valor})
+        return condicion
+
+    def _decode_cursor(self, request):
+        codificado = request.query_params.get(self.cursor_query_param)
+        if not codificado:
+            return None, False
+        try:
+            datos = json.loads(base64.urlsafe_b64decode(codificado.encode('ascii')))
+            if len(datos['v']) != len(self.campos):
+                raise ValueError('Cursor con campos distintos al orden')
+            valores = [campo.to_python(valor) for campo, valor in zip(self.campos, datos['v'])]
+            return valores, bool(datos.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _link(self, fila, reverso):
+        codificado = codificar_cursor([campo.value_to_string(fila) for campo in self.campos], reverso)
+        url = remove_query_param(self.request.build_absolute_uri(), self.estimate_query_param)
+        return replace_query_param(url, self.cursor_query_param, codificado)
+
+
+class PaginacionHibrida(PageNumberPagination):
+    """
+    PageNumberPagination por defecto; KeysetPagination si la petición trae ?cursor= y el
+    orden no es por relevancia (ver ordenado_por_anotacion).
+    """
+    cursor_query_param = KeysetPagination.cursor_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.cursor_query_param in request.query_params and not ordenado_por_anotacion(queryset):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
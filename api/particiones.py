@@ -0,0 +1,136 @@
+"""
+Particiones mensuales de Auditoria_Documento (PostgreSQL, particionado declarativo por
+rango sobre "Fecha"; ver migración 0016).
+- Una partición por mes: Auditoria_Documento_pAAAA_MM, límites en la zona TIME_ZONE.
+- Partición DEFAULT (Auditoria_Documento_pdefault) para filas fuera de las creadas.
+- crear_particion mueve a la nueva partición las filas de su mes que hubiera en DEFAULT.
+- archivar_particion: DETACH, COPY a CSV comprimido (gzip) y DROP.
+Lo usa `manage.py particiones_auditoria`; AuditoriaDocumento.objects.en_rango/del_mes
+filtran por "Fecha" con límites semiabiertos para que el planificador descarte particiones.
+"""
+import gzip
+import os
+import re
+import uuid
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from django.conf import settings
+
+TABLA = 'Auditoria_Documento'
+DEFAULT = f'{TABLA}_pdefault'
+PATRON_PARTICION = re.compile(rf'^{TABLA}_p(\d{{4}})_(\d{{2}})$')
+
+
+def nombre_particion(anio, mes):
+    return f'{TABLA}_p{anio:04d}_{mes:02d}'
+
+
+def sumar_meses(anio, mes, meses):
+    indice = anio * 12 + (mes - 1) + meses
+    return indice // 12, indice % 12 + 1
+
+
+def limites_mes(anio, mes):
+    """[inicio, fin) del mes como datetimes con zona (TIME_ZONE)."""
+    zona = ZoneInfo(settings.TIME_ZONE)
+    siguiente = sumar_meses(anio, mes, 1)
+    return (
+        datetime(anio, mes, 1, tzinfo=zona),
+        datetime(siguiente[0], siguiente[1], 1, tzinfo=zona),
+    )
+
+
+def es_particionada(cursor):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [f'"{TABLA}"'])
+    fila = cursor.fetchone()
+    return bool(fila) and fila[0] == 'p'
+
+
+def listar_particiones(cursor):
+    """
+    Returns: (adjuntas, sueltas). adjuntas: [(anio, mes)] de las particiones mensuales;
+    sueltas: nombres de particiones mensuales ya desacopladas y aún sin archivar.
+    """
+    cursor.execute(
+        "SELECT c.relname, c.relispartition FROM pg_class c "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = current_schema() AND c.relkind = 'r' AND c.relname LIKE %s",
+        [f'{TABLA}_p%'],
+    )
+    adjuntas, sueltas = [], []
+    for nombre, adjunta in cursor.fetchall():
+        coincidencia = PATRON_PARTICION.match(nombre)
+        if not coincidencia:
+            continue
+        if adjunta:
+            adjuntas.append((int(coincidencia.group(1)), int(coincidencia.group(2))))
+        else:
+            sueltas.append(nombre)
+    return sorted(adjuntas), sorted(sueltas)
+
+
+def crear_particion(cursor, anio, mes):
+    """
+    Crea la partición del mes. Las filas de ese mes que hubieran caído en DEFAULT
+    se mueven antes de adjuntarla (ATTACH exige que DEFAULT no tenga filas del rango).
+    Ejecutar dentro de una transacción.
+    """
+    nombre = nombre_particion(anio, mes)
+    desde, hasta = limites_mes(anio, mes)
+    cursor.execute(f'CREATE TABLE "{nombre}" (LIKE "{TABLA}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'WITH movidas AS (DELETE FROM "{DEFAULT}" WHERE "Fecha" >= %s AND "Fecha" < %s RETURNING *) '
+        f'INSERT INTO "{nombre}" SELECT * FROM movidas',
+        [desde, hasta],
+    )
+    # DDL: los límites van como literales (no admite parámetros enlazados en el servidor)
+    cursor.execute(
+        f'ALTER TABLE "{TABLA}" ATTACH PARTITION "{nombre}" '
+        f"FOR VALUES FROM ('{desde.isoformat()}') TO ('{hasta.isoformat()}')"
+    )
+    return nombre
+
+
+def desacoplar_particion(cursor, nombre):
+    cursor.execute(f'ALTER TABLE "{TABLA}" DETACH PARTITION "{nombre}"')
+
+
+def archivar_particion(connection, nombre, directorio):
+    """
+    Copia una partición ya desacoplada a <directorio>/<nombre>.csv.gz (CSV con cabecera)
+    y la elimina. El archivo se escribe a un temporal y se renombra tras fsync: si algo
+    falla, la tabla sigue existiendo y se puede reintentar.
+    Returns: (ruta_archivo, bytes_comprimidos)
+    """
+    os.makedirs(directorio, exist_ok=True)
+    destino = os.path.join(directorio, f'{nombre}.csv.gz')
+    temporal = os.path.join(directorio, f'.{nombre}-{uuid.uuid4().hex}.part')
+    try:
+        with connection.cursor() as cursor:
+            with open(temporal, 'wb') as crudo:
+                with gzip.GzipFile(filename=f'{nombre}.csv', mode='wb', fileobj=crudo) as comprimido:
+                    with cursor.cursor.copy(f'COPY "{nombre}" TO STDOUT WITH (FORMAT csv, HEADER)') as copia:
+                        for bloque in copia:
+                            comprimido.write(bloque)
+                crudo.flush()
+                os.fsync(crudo.fileno())
+            os.replace(temporal, destino)
+            cursor.execute(f'DROP TABLE "{nombre}"')
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return destino, os.path.getsize(destino)
+
+
+def mes_actual():
+    hoy = datetime.now(ZoneInfo(settings.TIME_ZONE)).date()
+    return hoy.year, hoy.month
+
+
+def meses_a_archivar(adjuntas, retener_meses, referencia=None):
+    """Meses adjuntos completamente anteriores a la ventana de retención."""
+    anio, mes = referencia or mes_actual()
+    corte = sumar_meses(anio, mes, -retener_meses)
+    return [m for m in adjuntas if m < corte]
+
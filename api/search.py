@@ -0,0 +1,51 @@
+"""
+Búsqueda de empleados por nombre, apellido o número de documento.
+- PostgreSQL: pg_trgm + unaccent (índice GIN de la migración 0013). Coincidencia por
+  subcadena o por similitud de trigramas, sin distinguir tildes ni mayúsculas,
+  ordenada por relevancia; número de documento por prefijo (índice _like de Django).
+- Otros motores (SQLite en desarrollo/pruebas): icontains, sin ranking.
+"""
+import unicodedata
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, CharField, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+# Debe coincidir exactamente con la expresión del índice empleado_busqueda_trgm_idx
+TEXTO_EMPLEADO_SQL = 'f_unaccent(lower("Empleado"."Nombre" || \' \' || "Empleado"."Apellido"))'
+
+
+def normalizar_busqueda(texto):
+    """Minúsculas y sin tildes (José Peña -> jose pena)."""
+    descompuesto = unicodedata.normalize('NFKD', texto.strip().lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def buscar_empleados(queryset, termino):
+    """Filtra (y en PostgreSQL ordena por relevancia) empleados que coinciden con `termino`."""
+    termino = (termino or '').strip()
+    if not termino:
+        return queryset
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.filter(
+            Q(nombre__icontains=termino) |
+            Q(apellido__icontains=termino) |
+            Q(numero_documento__icontains=termino)
+        )
+    normalizado = normalizar_busqueda(termino)
+    queryset = queryset.annotate(
+        texto_busqueda=RawSQL(TEXTO_EMPLEADO_SQL, [], output_field=CharField()),
+    )
+    coincide_documento = Q(numero_documento__startswith=termino)
+    queryset = queryset.filter(
+        Q(texto_busqueda__contains=normalizado) |
+        Q(texto_busqueda__trigram_word_similar=normalizado) |
+        coincide_documento
+    )
+    return queryset.annotate(
+        relevancia=Case(
+            When(coincide_documento, then=Value(1.0)),
+            default=TrigramWordSimilarity(Value(normalizado), 'texto_busqueda'),
+            output_field=FloatField(),
+        )
+    ).order_by('-relevancia', *queryset.model._meta.ordering)
@@ -1,10 +1,15 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
+from django.conf import settings
+from django.db import models
+from django.db.models import Count
+from django.utils.encoding import filepath_to_uri
 from .models import (
     Rol, User, Empleado, Caso, Alerta, Documento, Carpeta,
-    Seguimiento, Reporte, TokenVerification
+    Seguimiento, Reporte, TokenVerification, AuditoriaDocumento
 )
+from . import fotos, miniaturas
 import os
 
 
@@ -94,11 +99,25 @@ class LoginSerializer(serializers.Serializer):
         return data
 
 
+class FotoEmpleadoField(serializers.ImageField):
+    """ImageField que lee igual pero devuelve la URL con la base de medios cacheada del serializer."""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return self.parent.url_media(value.name)
+
+
 class EmpleadoSerializer(serializers.ModelSerializer):
     """Serializer para empleados"""
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping, models.ImageField: FotoEmpleadoField,
+    }
     id = serializers.SerializerMethodField()
     foto_url = serializers.SerializerMethodField()
+    foto_variantes = serializers.SerializerMethodField()
     total_casos = serializers.SerializerMethodField()
+    casos_por_estado = serializers.SerializerMethodField()
     nombre_completo = serializers.SerializerMethodField()
     
     class Meta:
@@ -107,24 +126,56 @@ class EmpleadoSerializer(serializers.ModelSerializer):
             'id', 'nombre', 'apellido', 'nombre_completo', 'cargo', 
             'division', 'area', 'supervisor', 'fecha_nacimiento', 
             'fecha_ingreso', 'correo', 'telefono', 'estado', 'foto', 
-            'foto_url', 'total_casos', 'ciudad', 'numero_documento', 
-            'tipo_documento'
+            'foto_url', 'foto_variantes', 'total_casos', 'casos_por_estado', 'ciudad',
+            'numero_documento', 'tipo_documento'
         ]
         read_only_fields = ['id']
     
     def get_id(self, obj):
         return obj.id_empleado
     
+    def _media_base(self):
+        """URL absoluta de MEDIA_URL, calculada una vez por serialización (no por fila)."""
+        base = getattr(self, '_media_base_cache', None)
+        if base is None:
+            request = self.context.get('request')
+            base = request.build_absolute_uri(settings.MEDIA_URL) if request else settings.MEDIA_URL
+            if not base.endswith('/'):
+                base += '/'
+            self._media_base_cache = base
+        return base
+    
+    def url_media(self, nombre):
+        return self._media_base() + filepath_to_uri(nombre).lstrip('/')
+    
     def get_foto_url(self, obj):
         if obj.foto:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.foto.url)
-            return obj.foto.url
+            return self.url_media(obj.foto.name)
         return None
     
+    def get_foto_variantes(self, obj):
+        """{'thumb'|'card'|'full': {'webp', 'jpeg', 'ancho', 'alto'}}; None hasta que se generan."""
+        if not obj.foto or fotos.pendiente(obj):
+            return None
+        return {
+            variante: {
+                **{ext: self.url_media(datos[ext]) for ext in fotos.FORMATOS},
+                'ancho': datos['ancho'], 'alto': datos['alto'],
+            }
+            for variante, datos in obj.foto_variantes['variantes'].items()
+        }
+    
+    # Los totales vienen anotados por Empleado.objects.con_totales(); COUNT solo si faltan
     def get_total_casos(self, obj):
-        return obj.casos.count()
+        total = getattr(obj, 'total_casos', None)
+        return obj.casos.count() if total is None else total
+    
+    def get_casos_por_estado(self, obj):
+        estados = [estado for estado, _ in Caso.ESTADO_CHOICES]
+        if all(hasattr(obj, f'casos_{estado}') for estado in estados):
+            return {estado: getattr(obj, f'casos_{estado}') for estado in estados}
+        conteos = dict(obj.casos.order_by().values_list('estado').annotate(total=Count('pk')))
+        return {estado: conteos.get(estado, 0) for estado in estados}
     
     def get_nombre_completo(self, obj):
         return f"{obj.nombre} {obj.apellido}"
@@ -194,14 +245,18 @@ class CasoSerializer(serializers.ModelSerializer):
     def get_responsable_nombre(self, obj):
         return obj.responsable.nombre if obj.responsable else None
     
+    # Los totales vienen anotados por Caso.objects.con_totales(); COUNT solo si faltan
     def get_total_documentos(self, obj):
-        return obj.documentos.count()
+        total = getattr(obj, 'total_documentos', None)
+        return obj.documentos.count() if total is None else total
     
     def get_total_alertas(self, obj):
-        return obj.alertas.count()
+        total = getattr(obj, 'total_alertas', None)
+        return obj.alertas.count() if total is None else total
     
     def get_total_seguimientos(self, obj):
-        return obj.seguimientos.count()
+        total = getattr(obj, 'total_seguimientos', None)
+        return obj.seguimientos.count() if total is None else total
     
     def validate_empleado(self, value):
         """Validar que el empleado existe y está activo"""
@@ -322,6 +377,7 @@ class DocumentoSerializer(serializers.ModelSerializer):
     """Serializer para documentos. Sin archivo binario; descarga solo vía URL protegida."""
     id = serializers.SerializerMethodField()
     download_url = serializers.SerializerMethodField()
+    miniatura_url = serializers.SerializerMethodField()
     caso_info = serializers.SerializerMethodField()
     usuario_creador_nombre = serializers.SerializerMethodField()
     caso = serializers.PrimaryKeyRelatedField(queryset=Caso.objects.all(), required=False, allow_null=True)
@@ -332,12 +388,12 @@ class DocumentoSerializer(serializers.ModelSerializer):
             'id', 'caso', 'caso_info', 'nombre', 'tipo',
             'fecha_carga', 'fecha_modificacion', 'usuario_creador',
             'usuario_creador_nombre', 'descripcion', 'ruta',
-            'download_url', 'extension', 'empleado', 'carpeta',
-            'nivel_sensibilidad', 'tamano_bytes', 'checksum_sha256',
+            'download_url', 'miniatura_url', 'extension', 'empleado', 'carpeta',
+            'nivel_sensibilidad', 'tamano_bytes', 'checksum_sha256', 'mime_type',
         ]
         read_only_fields = [
             'id', 'fecha_carga', 'fecha_modificacion', 'extension',
-            'ruta', 'tamano_bytes', 'checksum_sha256',
+            'ruta', 'tamano_bytes', 'checksum_sha256', 'mime_type',
         ]
     
     def get_id(self, obj):
@@ -350,6 +406,15 @@ class DocumentoSerializer(serializers.ModelSerializer):
             return None
         return request.build_absolute_uri(f'/api/documentos/{obj.id_documento}/descargar/')
     
+    def get_miniatura_url(self, obj):
+        """URL protegida de la miniatura; ?v= (checksum) permite cachearla sin revalidar."""
+        request = self.context.get('request')
+        if not request or not obj.checksum_sha256 or not miniaturas.soporta(obj.extension):
+            return None
+        return request.build_absolute_uri(
+            f'/api/documentos/{obj.id_documento}/miniatura/?v={obj.checksum_sha256[:16]}'
+        )
+    
     def get_caso_info(self, obj):
         if obj.caso:
             return f"Caso #{obj.caso.id_caso} - {obj.caso.empleado}"
@@ -422,4 +487,18 @@ class TokenVerificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = TokenVerification
         fields = ['id', 'operacion', 'fecha_creacion', 'fecha_expiracion', 'usado']
-        read_only_fields = ['id', 'fecha_creacion', 'fecha_expiracion', 'usado']
\ No newline at end of file
+        read_only_fields = ['id', 'fecha_creacion', 'fecha_expiracion', 'usado']
+
+
+class AuditoriaDocumentoSerializer(serializers.ModelSerializer):
+    """Evento de auditoría de documentos (solo lectura)."""
+    documento_nombre = serializers.CharField(source='documento.nombre', read_only=True)
+    usuario_username = serializers.CharField(source='usuario.username', read_only=True)
+
+    class Meta:
+        model = AuditoriaDocumento
+        fields = [
+            'id_auditoria', 'documento', 'documento_nombre', 'usuario',
+            'usuario_username', 'accion', 'fecha', 'ip_origen',
+        ]
+        read_only_fields = fields
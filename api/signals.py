@@ -0,0 +1,55 @@
+"""Señales del API: invalidación de la caché de tokens, borrado de archivos de documentos y variantes de fotos."""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import fotos
+from .document_service import delete_document_file
+from .models import Documento, Empleado, ExpiringToken, Rol, User
+from .token_cache import invalidate_all, invalidate_token, invalidate_user
+
+
+@receiver(post_delete, sender=ExpiringToken)
+def invalidar_token_eliminado(sender, instance, **kwargs):
+    """logout, renovar_token, rotación en login y expiración borran el token."""
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_tokens_usuario(sender, instance, **kwargs):
+    """Desactivación, cambio de rol o eliminación del usuario."""
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Rol)
+@receiver(post_delete, sender=Rol)
+def invalidar_tokens_rol(sender, instance, **kwargs):
+    """El tipo de rol está cacheado en el principal de cada token."""
+    invalidate_all()
+
+
+@receiver(post_delete, sender=Documento)
+def eliminar_archivo_documento(sender, instance, using, **kwargs):
+    """
+    Borra el archivo (o suelta la referencia CAS) al eliminar un Documento, también en
+    cascada desde Caso o Empleado. Tras el commit: si la transacción se revierte, la fila
+    sigue apuntando a un archivo que existe.
+    """
+    transaction.on_commit(partial(delete_document_file, instance), using=using)
+
+
+@receiver(post_save, sender=Empleado)
+def generar_variantes_foto(sender, instance, using, **kwargs):
+    """Si la foto cambió (o se quitó), regenera sus variantes tras el commit (api/fotos.py)."""
+    if fotos.pendiente(instance):
+        transaction.on_commit(partial(fotos.programar, instance), using=using)
+
+
+@receiver(post_delete, sender=Empleado)
+def eliminar_variantes_foto(sender, instance, using, **kwargs):
+    """Borra las variantes generadas al eliminar el Empleado (la foto original se trata como hasta ahora)."""
+    if instance.foto_variantes:
+        transaction.on_commit(partial(fotos.borrar_variantes, instance.foto_variantes), using=using)
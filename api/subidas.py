@@ -0,0 +1,347 @@
+"""
+Subidas reanudables por fragmentos para documentos grandes (escaneos de cientos de MB en
+conexiones inestables), sin pasar el archivo entero por un único multipart:
+  POST   /api/documentos/subidas/                 nombre_archivo, tamano_total y los metadatos
+                                                  de la subida normal → sesión (id, recibidos)
+  PUT    /api/documentos/subidas/<id>/            fragmento en el cuerpo, con
+                                                  Content-Range: bytes <inicio>-<fin>/<total>
+  GET    /api/documentos/subidas/<id>/            bytes recibidos (desde dónde seguir)
+  POST   /api/documentos/subidas/<id>/finalizar/  crea el Documento
+  DELETE /api/documentos/subidas/<id>/            cancela
+- Cada fragmento se escribe directamente en el temporal .subida-<id>.part de la raíz de
+  documentos (sin temporales de Django); si la conexión se corta se conserva lo recibido.
+- Cada fragmento reserva la sesión con un bloqueo corto de su fila (comprueba el
+  desplazamiento y anota la reserva), se escribe fuera de la transacción y vuelve a
+  bloquearla solo para confirmar `recibidos`. Otro fragmento de la misma sesión mientras
+  tanto recibe 409; una reserva sin renovar durante _RESERVA_CADUCA se da por abandonada.
+- El SHA-256 se calcula a medida que llegan los fragmentos mientras los atienda el mismo
+  proceso (el estado del hash vive en su memoria). Si un fragmento llega a otro proceso se
+  deja de calcular y se hace una sola lectura completa al finalizar.
+- El tipo de contenido se valida (api/tipos_mime.py) en cuanto llegan los primeros KB y
+  otra vez al finalizar.
+- Al finalizar, el temporal se renombra a su ruta definitiva (o al almacén CAS) y se crea el
+  Documento en la misma transacción que borra la sesión.
+- Las sesiones sin actividad durante DOCUMENT_CHUNKED_UPLOAD_EXPIRY_HOURS se borran con su
+  temporal en `manage.py limpiar_huerfanos`.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .document_service import discard_uploaded_file, get_document_storage_root, publish_staged_file
+from . import tipos_mime
+from .integridad import PREFIJO_TEMPORAL
+from .models import SubidaDocumento
+
+logger = logging.getLogger(__name__)
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+TEMPORAL_RE = re.compile(r'^' + re.escape(PREFIJO_TEMPORAL) + r'([0-9a-f]{32})\.part$')
+
+# Una reserva se renueva cada _RENOVAR_RESERVA segundos mientras se escribe el fragmento
+_RESERVA_CADUCA = timedelta(minutes=2)
+_RENOVAR_RESERVA = 30
+
+# Hash en curso por sesión: {id_subida: (bytes_hasheados, hasher)}, solo los más recientes
+_MAX_HASHES = 64
+_hashes = OrderedDict()
+_hashes_lock = threading.Lock()
+
+
+class FragmentoFueraDeOrden(Exception):
+    """El fragmento no empieza donde termina lo recibido (el cliente debe seguir desde `recibidos`)."""
+
+    def __init__(self, recibidos):
+        super().__init__(recibidos)
+        self.recibidos = recibidos
+
+
+class SubidaIncompleta(FragmentoFueraDeOrden):
+    pass
+
+
+class FragmentoEnCurso(FragmentoFueraDeOrden):
+    """Otro fragmento de la misma sesión se está escribiendo."""
+
+
+class SubidaPerdida(Exception):
+    """El temporal de la sesión ya no existe o está incompleto: hay que empezar de nuevo."""
+
+
+def tamano_maximo():
+    return getattr(settings, 'DOCUMENT_CHUNKED_UPLOAD_MAX_BYTES', 2 * 1024 ** 3)
+
+
+def _caducidad():
+    return timedelta(hours=getattr(settings, 'DOCUMENT_CHUNKED_UPLOAD_EXPIRY_HOURS', 24))
+
+
+def expira(subida):
+    return subida.fecha_actualizacion + _caducidad()
+
+
+def _bloque():
+    return getattr(settings, 'DOCUMENT_IO_CHUNK_SIZE', 1024 * 1024)
+
+
+def path_temporal(id_subida):
+    return os.path.join(get_document_storage_root(), f'{PREFIJO_TEMPORAL}{id_subida.hex}.part')
+
+
+def id_de_temporal(nombre):
+    """UUID de la sesión dueña del temporal `nombre` de la raíz, o None si no es de una sesión."""
+    coincidencia = TEMPORAL_RE.match(nombre)
+    return uuid.UUID(coincidencia.group(1)) if coincidencia else None
+
+
+def parse_content_range(cabecera):
+    """
+    Content-Range de un fragmento. Returns: (inicio, longitud, total o None).
+    Lanza ValueError si falta o no es válido.
+    """
+    coincidencia = CONTENT_RANGE_RE.match((cabecera or '').strip())
+    if not coincidencia:
+        raise ValueError("Se requiere Content-Range: bytes <inicio>-<fin>/<total>")
+    inicio, fin, total = coincidencia.groups()
+    inicio, fin = int(inicio), int(fin)
+    if fin < inicio:
+        raise ValueError("Content-Range no válido")
+    return inicio, fin - inicio + 1, None if total == '*' else int(total)
+
+
+def obtener(id_subida, usuario):
+    """Sesión del usuario o None (también si el id no es un UUID)."""
+    try:
+        id_subida = uuid.UUID(str(id_subida))
+    except ValueError:
+        return None
+    return SubidaDocumento.objects.filter(pk=id_subida, usuario=usuario).first()
+
+
+def _bloquear(id_subida, usuario):
+    subida = SubidaDocumento.objects.select_for_update().filter(pk=id_subida, usuario=usuario).first()
+    if subida is None:
+        raise SubidaDocumento.DoesNotExist()
+    return subida
+
+
+def crear(usuario, nombre_archivo, tamano_total, datos):
+    """Abre una sesión y su temporal vacío."""
+    if tamano_total < 0:
+        raise ValueError("tamano_total no válido")
+    if tamano_total > tamano_maximo():
+        raise ValueError(f"El archivo supera el máximo de {tamano_maximo()} bytes")
+    with transaction.atomic():
+        subida = SubidaDocumento.objects.create(
+            usuario=usuario, nombre_archivo=nombre_archivo[:255], tamano_total=tamano_total, datos=datos,
+        )
+        path = path_temporal(subida.pk)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'xb'):
+            pass
+    return subida
+
+
+def _tomar_hash(id_subida, bytes_hasheados):
+    """Hash en curso de la sesión si cubre exactamente `bytes_hasheados`; si no, None."""
+    with _hashes_lock:
+        entrada = _hashes.pop(id_subida, None)
+    if entrada is not None and entrada[0] == bytes_hasheados:
+        return entrada[1]
+    return None
+
+
+def _guardar_hash(id_subida, bytes_hasheados, hasher):
+    with _hashes_lock:
+        _hashes[id_subida] = (bytes_hasheados, hasher)
+        while len(_hashes) > _MAX_HASHES:
+            _hashes.popitem(last=False)
+
+
+def _hash_archivo(path, tamano):
+    """SHA-256 de los primeros `tamano` bytes del temporal, en una sola lectura."""
+    hasher = hashlib.sha256()
+    pendientes = tamano
+    try:
+        with open(path, 'rb') as f:
+            while pendientes:
+                bloque = f.read(min(_bloque(), pendientes))
+                if not bloque:
+                    raise SubidaPerdida()
+                hasher.update(bloque)
+                pendientes -= len(bloque)
+    except FileNotFoundError:
+        raise SubidaPerdida()
+    return hasher
+
+
+def _validar_tipo(subida, path):
+    """Tipo de la subida según la cabecera ya escrita en el temporal (lanza TipoNoPermitido)."""
+    with open(path, 'rb') as f:
+        cabecera = f.read(tipos_mime.TAMANO_CABECERA)
+    return tipos_mime.validar(cabecera, subida.nombre_archivo, subida.datos.get('nivel_sensibilidad'))
+
+
+def _reservar(id_subida, usuario, inicio, longitud, total, reserva):
+    """Comprueba el fragmento con la fila bloqueada y anota la reserva. Returns: la sesión."""
+    with transaction.atomic():
+        subida = _bloquear(id_subida, usuario)
+        if total is not None and total != subida.tamano_total:
+            raise ValueError(f"El total no coincide con el de la sesión ({subida.tamano_total})")
+        if subida.reserva is not None and subida.fecha_actualizacion > timezone.now() - _RESERVA_CADUCA:
+            raise FragmentoEnCurso(subida.recibidos)
+        if inicio != subida.recibidos:
+            raise FragmentoFueraDeOrden(subida.recibidos)
+        if inicio + longitud > subida.tamano_total:
+            raise ValueError("El fragmento excede el tamaño declarado")
+        subida.reserva = reserva
+        subida.fecha_actualizacion = timezone.now()
+        subida.save(update_fields=['reserva', 'fecha_actualizacion'])
+    return subida
+
+
+def _renovar(id_subida, reserva):
+    """Renueva la reserva. Returns: False si ya no es nuestra (caducó o se canceló la sesión)."""
+    return SubidaDocumento.objects.filter(pk=id_subida, reserva=reserva).update(fecha_actualizacion=timezone.now()) > 0
+
+
+def escribir_fragmento(id_subida, usuario, inicio, longitud, total, stream):
+    """
+    Añade al temporal `longitud` bytes leídos de `stream` a partir de `inicio`, que debe ser
+    lo ya recibido. Si el cuerpo llega cortado se conserva lo leído.
+    La transferencia no retiene el bloqueo de la fila: se reserva la sesión antes y se
+    confirma `recibidos` después (FragmentoEnCurso si hay otro fragmento reservado).
+    Lanza tipos_mime.TipoNoPermitido en cuanto la cabecera completa muestra un tipo no admitido.
+    Returns: la sesión actualizada.
+    """
+    reserva = uuid.uuid4()
+    subida = _reservar(id_subida, usuario, inicio, longitud, total, reserva)
+    path = path_temporal(subida.pk)
+    hasher = _tomar_hash(subida.pk, inicio)
+    if hasher is None and inicio == 0:
+        hasher = hashlib.sha256()
+    escritos = 0
+    confirmado = False
+    try:
+        try:
+            with open(path, 'r+b') as f:
+                # Descarta lo que quedara de un fragmento anterior no confirmado
+                f.seek(inicio)
+                f.truncate()
+                renovada = time.monotonic()
+                while escritos < longitud:
+                    try:
+                        bloque = stream.read(min(_bloque(), longitud - escritos)) if stream else b''
+                    except OSError as e:
+                        logger.info("Fragmento cortado en la subida %s: %s", subida.pk, e)
+                        break
+                    if not bloque:
+                        break
+                    if time.monotonic() - renovada > _RENOVAR_RESERVA:
+                        if not _renovar(subida.pk, reserva):
+                            raise FragmentoFueraDeOrden(inicio)
+                        renovada = time.monotonic()
+                    f.write(bloque)
+                    if hasher is not None:
+                        hasher.update(bloque)
+                    escritos += len(bloque)
+        except FileNotFoundError:
+            raise SubidaPerdida()
+        recibidos = inicio + escritos
+        if inicio < tipos_mime.TAMANO_CABECERA and (
+            recibidos >= tipos_mime.TAMANO_CABECERA or recibidos == subida.tamano_total
+        ):
+            _validar_tipo(subida, path)
+        with transaction.atomic():
+            subida = _bloquear(id_subida, usuario)
+            if subida.reserva != reserva:
+                raise FragmentoFueraDeOrden(subida.recibidos)
+            subida.recibidos = recibidos
+            subida.reserva = None
+            subida.fecha_actualizacion = timezone.now()
+            subida.save(update_fields=['recibidos', 'reserva', 'fecha_actualizacion'])
+        confirmado = True
+    finally:
+        if not confirmado:
+            SubidaDocumento.objects.filter(pk=subida.pk, reserva=reserva).update(reserva=None)
+    if hasher is not None:
+        _guardar_hash(subida.pk, subida.recibidos, hasher)
+    return subida
+
+
+def _comprobar_completa(subida):
+    if subida.recibidos != subida.tamano_total:
+        raise SubidaIncompleta(subida.recibidos)
+    try:
+        if os.path.getsize(path_temporal(subida.pk)) != subida.tamano_total:
+            raise SubidaPerdida()
+    except FileNotFoundError:
+        raise SubidaPerdida()
+
+
+def finalizar(id_subida, usuario, crear_documento):
+    """
+    Publica el temporal completo y crea el Documento con `crear_documento(meta)` (meta como
+    en save_uploaded_file) en la misma transacción que borra la sesión. Si la creación
+    falla, el archivo publicado se descarta.
+    Completa, la sesión ya no admite fragmentos: si hace falta, el SHA-256 se calcula
+    leyendo el temporal antes de bloquear la fila.
+    Returns: el Documento.
+    """
+    subida = SubidaDocumento.objects.filter(pk=id_subida, usuario=usuario).first()
+    if subida is None:
+        raise SubidaDocumento.DoesNotExist()
+    _comprobar_completa(subida)
+    path = path_temporal(subida.pk)
+    hasher = _tomar_hash(subida.pk, subida.tamano_total) or _hash_archivo(path, subida.tamano_total)
+    checksum = hasher.hexdigest()
+    with transaction.atomic():
+        subida = _bloquear(id_subida, usuario)
+        _comprobar_completa(subida)
+        mime_type = _validar_tipo(subida, path)
+        meta = publish_staged_file(path, subida.tamano_total, checksum, subida.nombre_archivo, mime_type)
+        try:
+            documento = crear_documento(meta)
+            subida.delete()
+        except BaseException:
+            discard_uploaded_file(meta['ruta'])
+            raise
+    return documento
+
+
+def cancelar(id_subida, usuario=None):
+    """Borra la sesión y su temporal. Returns: si existía."""
+    filtro = {'pk': id_subida} if usuario is None else {'pk': id_subida, 'usuario': usuario}
+    with transaction.atomic():
+        borradas, _ = SubidaDocumento.objects.filter(**filtro).delete()
+    with _hashes_lock:
+        _hashes.pop(id_subida, None)
+    if borradas:
+        try:
+            os.remove(path_temporal(id_subida))
+        except FileNotFoundError:
+            pass
+    return bool(borradas)
+
+
+def expirar():
+    """Cancela las sesiones sin actividad desde hace más de la caducidad. Returns: cuántas."""
+    limite = timezone.now() - _caducidad()
+    ids = SubidaDocumento.objects.filter(fecha_actualizacion__lt=limite).values_list('pk', flat=True)
+    total = 0
+    for id_subida in list(ids):
+        with transaction.atomic():
+            # Se vuelve a comprobar bloqueada: pudo llegar un fragmento entretanto
+            if not SubidaDocumento.objects.select_for_update().filter(pk=id_subida, fecha_actualizacion__lt=limite).exists():
+                continue
+            total += cancelar(id_subida)
+    return total
@@ -1,3 +1,994 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Value
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from . import auditoria, descargas, document_service, integridad, miniaturas, particiones, subidas, tipos_mime
+from .document_service import get_document_file_path, user_can_access_document
+from .miniaturas import ruta_miniatura
+from .authentication import ExpiringTokenAuthentication
+from .models import (
+    Alerta, ArchivoDocumento, AuditoriaDocumento, AuditoriaResumenDiario, Carpeta, Caso, Documento, Empleado,
+    ExpiringToken, Rol, Seguimiento, SubidaDocumento, User,
+)
+from .pagination import PaginacionHibrida, codificar_cursor
+from .serializers import DocumentoSerializer, EmpleadoSerializer
+from .token_cache import LocalTokenCache, SharedTokenCache, get_token_cache, invalidate_all
+
+
+def crear_empleado(n, **campos):
+    datos = dict(
+        nombre=f'Nombre{n}', apellido=f'Apellido{n}', fecha_nacimiento=date(1990, 1, 1),
+        fecha_ingreso=date(2020, 1, 1), correo=f'empleado{n}@example.com', telefono='3000000000',
+        numero_documento=f'1000{n}', tipo_documento='CC', estado='Activo', ciudad='Bogotá', cargo='Analista',
+    )
+    datos.update(campos)
+    return Empleado.objects.create(**datos)
+
+
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 8
+
+
+def crear_usuario(username, rol_tipo='Administrador', **campos):
+    rol = Rol.objects.get_or_create(tipo=rol_tipo)[0] if rol_tipo else None
+    return User.objects.create(
+        username=username, nombre=username.title(), correo=f'{username}@example.com', rol=rol, **campos,
+    )
+
+
+class AlmacenamientoTemporalMixin:
+    """DOCUMENT_STORAGE_ROOT en un directorio temporal, sin miniaturas ni auditoría asíncrona."""
+
+    def setUp(self):
+        super().setUp()
+        self.raiz = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.raiz, True)
+        ajustes = override_settings(DOCUMENT_STORAGE_ROOT=self.raiz, DOCUMENT_THUMBNAILS=False, AUDIT_ASYNC=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+
+class UsuarioAutenticadoMixin:
+    """self.client autenticado como self.usuario, con rol `rol_tipo`."""
+    rol_tipo = 'Administrador'
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = crear_usuario('admin', self.rol_tipo)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+
+class DocumentosApiMixin(UsuarioAutenticadoMixin, AlmacenamientoTemporalMixin):
+    """Almacenamiento temporal y cliente autenticado para subir y descargar documentos."""
+
+    def subir(self, nombre='a.pdf', contenido=PDF, **datos):
+        return self.client.post(
+            '/api/documentos/', {'archivo': SimpleUploadedFile(nombre, contenido), **datos}, format='multipart',
+        )
+
+
+@override_settings(AUDIT_ASYNC=False)
+class ConsultasListadosTests(UsuarioAutenticadoMixin, TestCase):
+    """
+    Número de consultas de los listados de casos y empleados: debe ser el mismo con pocas
+    filas que con una página completa (una consulta por fila sería un N+1).
+    """
+    # Consultas esperadas: COUNT de la paginación + la página (con select_related y subconsultas)
+    CONSULTAS_LISTADO = 2
+    # get_object + casos del empleado
+    CONSULTAS_CASOS_EMPLEADO = 2
+
+    def _poblar(self, cantidad):
+        """`cantidad` empleados con un caso cada uno (responsable distinto); el primero tiene además `cantidad` casos cerrados."""
+        empleados = []
+        for n in range(cantidad):
+            empleado = crear_empleado(n)
+            responsable = crear_usuario(f'resp{n}', None)
+            caso = Caso.objects.create(empleado=empleado, responsable=responsable, estado='abierto')
+            Documento.objects.create(caso=caso, nombre=f'doc{n}.pdf')
+            Alerta.objects.create(caso=caso, titulo='Alerta')
+            Seguimiento.objects.create(caso=caso, accion_realizada='Revisión')
+            empleados.append(empleado)
+        for n in range(cantidad):
+            Caso.objects.create(empleado=empleados[0], responsable=self.usuario, estado='cerrado')
+        return empleados
+
+    def _comprobar(self, url, consultas, filas):
+        with self.assertNumQueries(consultas):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        datos = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual(len(datos), filas)
+        return datos
+
+    def test_casos_pocos(self):
+        self._poblar(2)
+        self._comprobar('/api/casos/', self.CONSULTAS_LISTADO, 4)
+
+    def test_casos_pagina_completa(self):
+        self._poblar(30)
+        datos = self._comprobar('/api/casos/', self.CONSULTAS_LISTADO, 20)
+        self.assertTrue(all(c['responsable_nombre'] for c in datos))
+
+    def test_empleados_pocos(self):
+        self._poblar(2)
+        self._comprobar('/api/empleados/', self.CONSULTAS_LISTADO, 2)
+
+    def test_empleados_pagina_completa(self):
+        self._poblar(30)
+        datos = self._comprobar('/api/empleados/', self.CONSULTAS_LISTADO, 20)
+        self.assertTrue(all(e['total_casos'] >= 1 for e in datos))
+
+    def test_casos_de_empleado_pocos(self):
+        empleado = self._poblar(2)[0]
+        self._comprobar(f'/api/empleados/{empleado.pk}/casos/', self.CONSULTAS_CASOS_EMPLEADO, 3)
+
+    def test_casos_de_empleado_muchos(self):
+        empleado = self._poblar(30)[0]
+        datos = self._comprobar(f'/api/empleados/{empleado.pk}/casos/', self.CONSULTAS_CASOS_EMPLEADO, 31)
+        self.assertTrue(all(c['total_documentos'] is not None for c in datos))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tokens-tests'}},
+    TOKEN_CACHE_ALIAS='default', TOKEN_CACHE_TTL_SECONDS=60,
+)
+class CacheTokensTests(TestCase):
+    """Caché compartida de validación de tokens (api/token_cache.py)."""
+
+    def setUp(self):
+        self.usuario = crear_usuario('e1', 'Empleado')
+        self.usuario.set_password('secreta-123')
+        self.usuario.save()
+        self.token = ExpiringToken.objects.create(user=self.usuario)
+        self.auth = ExpiringTokenAuthentication()
+        get_token_cache().cache.clear()
+
+    def test_cachea_solo_el_principal(self):
+        self.auth.authenticate_credentials(self.token.key)
+        datos = get_token_cache().get(self.token.key)
+        self.assertEqual(set(datos), {'user_id', 'rol_id', 'rol_tipo', 'is_active', 'ultima_actividad'})
+        self.assertNotIn(self.usuario.password, repr(datos))
+
+    def test_acierto_sin_consultas(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user.pk, self.usuario.pk)
+        self.assertEqual(user.rol.tipo, 'Empleado')
+        # Los campos no cacheados se cargan de la BD al usarlos
+        self.assertEqual(user.username, 'e1')
+
+    def test_invalidate_all_cambia_la_generacion(self):
+        self.assertIsInstance(get_token_cache(), SharedTokenCache)
+        self.auth.authenticate_credentials(self.token.key)
+        invalidate_all()
+        self.assertIsNone(get_token_cache().get(self.token.key))
+
+    def test_usuario_desactivado(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.usuario.is_active = False
+        self.usuario.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_token_revocado(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.token.delete()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_revocacion_llega_a_los_demas_workers(self):
+        self.auth.authenticate_credentials(self.token.key)
+        otro_worker = SharedTokenCache('default', 60)
+        self.assertIsNotNone(otro_worker.get(self.token.key))
+        ExpiringToken.objects.filter(pk=self.token.pk).delete()
+        self.assertIsNone(otro_worker.get(self.token.key))
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    @override_settings(TOKEN_CACHE_ALIAS='', TOKEN_CACHE_LOCAL_TTL_SECONDS=2)
+    def test_sin_cache_compartida_ttl_corto(self):
+        cache = get_token_cache()
+        self.assertIsInstance(cache, LocalTokenCache)
+        self.assertEqual(cache.ttl, 2)
+        with override_settings(TOKEN_CACHE_LOCAL_TTL_SECONDS=0):
+            self.assertIsNone(get_token_cache())
+
+
+@override_settings(TOKEN_ACTIVITY_THRESHOLD_SECONDS=60)
+class ActividadTokenTests(TestCase):
+    """ExpiringToken.registrar_actividad: la última actividad solo se escribe al superar el umbral."""
+
+    def setUp(self):
+        self.token = ExpiringToken.objects.create(user=crear_usuario('e1', 'Empleado'))
+
+    def envejecer(self, segundos):
+        hace = timezone.now() - timedelta(seconds=segundos)
+        ExpiringToken.objects.filter(pk=self.token.pk).update(ultima_actividad=hace)
+        return ExpiringToken.objects.get(pk=self.token.pk)
+
+    def test_dentro_del_umbral_no_escribe(self):
+        token = self.envejecer(30)
+        with self.assertNumQueries(0):
+            self.assertFalse(token.registrar_actividad())
+        self.assertEqual(ExpiringToken.objects.get(pk=token.pk).ultima_actividad, token.ultima_actividad)
+
+    def test_pasado_el_umbral_escribe_una_vez(self):
+        token = self.envejecer(120)
+        concurrente = ExpiringToken.objects.get(pk=token.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(token.registrar_actividad())
+        # Otra petición con la misma lectura antigua no vuelve a escribir la fila
+        self.assertFalse(concurrente.registrar_actividad())
+        self.assertEqual(ExpiringToken.objects.get(pk=token.pk).ultima_actividad, token.ultima_actividad)
+
+    @override_settings(TOKEN_ACTIVITY_THRESHOLD_SECONDS=0)
+    def test_umbral_cero_escribe_siempre(self):
+        token = self.envejecer(1)
+        self.assertTrue(token.registrar_actividad())
+        self.assertTrue(token.registrar_actividad())
+
+    def test_autenticacion_dentro_del_umbral_sin_update(self):
+        token = self.envejecer(30)
+        auth = ExpiringTokenAuthentication()
+        with CaptureQueriesContext(connection) as consultas:
+            for _ in range(3):
+                auth.authenticate_credentials(self.token.key)
+        self.assertFalse([c for c in consultas if c['sql'].startswith('UPDATE')])
+        self.assertEqual(ExpiringToken.objects.get(pk=token.pk).ultima_actividad, token.ultima_actividad)
+
+
+class DeteccionTiposTests(SimpleTestCase):
+    """Detección del tipo por contenido (api/tipos_mime.py)."""
+
+    def _pe(self, resto=b''):
+        # Cabecera DOS con e_lfanew = 0x80 y la firma PE ahí
+        cabecera = bytearray(b'MZ' + b'\x00' * 0x7e)
+        cabecera[0x3C:0x40] = (0x80).to_bytes(4, 'little')
+        return bytes(cabecera) + b'PE\x00\x00' + b'\x00' * 60 + resto
+
+    def test_pdf(self):
+        self.assertEqual(tipos_mime.detectar(b'%PDF-1.7\n'), 'application/pdf')
+        self.assertEqual(tipos_mime.detectar(b'\xef\xbb\xbf\r\n %PDF-1.4\n'), 'application/pdf')
+
+    def test_pdf_solo_al_inicio(self):
+        self.assertEqual(tipos_mime.detectar(b'hola mundo\n%PDF-1.4\n'), tipos_mime.TEXTO)
+        self.assertEqual(tipos_mime.detectar(b'\x00\x01basura%PDF-1.4\n'), tipos_mime.GENERICO)
+
+    def test_poliglota_ejecutable_y_pdf(self):
+        poliglota = self._pe(b'%PDF-1.4\n1 0 obj\n')
+        self.assertEqual(tipos_mime.detectar(poliglota), 'application/x-msdownload')
+        with self.assertRaises(tipos_mime.TipoNoPermitido):
+            tipos_mime.validar(poliglota, 'informe.pdf', 'CONFIDENCIAL')
+
+    def test_comprimidos_y_ejecutables_primero(self):
+        self.assertEqual(tipos_mime.detectar(b'\x7fELF\x02\x01%PDF-1.4'), 'application/x-executable')
+        self.assertEqual(tipos_mime.detectar(b'\x1f\x8b\x08\x00%PDF-1.4'), 'application/gzip')
+
+    def test_texto_que_empieza_por_mz(self):
+        self.assertEqual(tipos_mime.detectar(b'MZ Logistica;Bogota;2024\n'), tipos_mime.TEXTO)
+
+
+class IfRangeTests(DocumentosApiMixin, TestCase):
+    """If-Range en la descarga de documentos (api/descargas.py)."""
+
+    def setUp(self):
+        super().setUp()
+        respuesta = self.subir()
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        self.url = f"/api/documentos/{respuesta.data['id']}/descargar/"
+        completa = self.client.get(self.url)
+        self.etag, self.last_modified = completa['ETag'], completa['Last-Modified']
+
+    def test_etag_coincide(self):
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=self.etag)
+        self.assertEqual(respuesta.status_code, 206)
+
+    def test_fecha_de_fecha_modificacion_no_es_fuerte(self):
+        # fecha_modificacion es un día entero: se envía el archivo completo
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=self.last_modified)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(b''.join(respuesta.streaming_content), PDF)
+
+    def test_fecha_exacta_con_validador_fuerte(self):
+        request = RequestFactory().get('/', HTTP_IF_RANGE=http_date(1000000))
+        self.assertTrue(descargas._if_range_vigente(request, self.etag, 1000000, True))
+        self.assertFalse(descargas._if_range_vigente(request, self.etag, 999999, True))
+        self.assertFalse(descargas._if_range_vigente(request, self.etag, 1000000, False))
+
+
+class RangosDescargaTests(DocumentosApiMixin, TestCase):
+    """Range y GET condicional en la descarga de documentos."""
+
+    def setUp(self):
+        super().setUp()
+        self.id = self.subir().data['id']
+        self.url = f"/api/documentos/{self.id}/descargar/"
+
+    def test_rango_parcial(self):
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertEqual(respuesta['Content-Range'], f'bytes 10-19/{len(PDF)}')
+        self.assertEqual(b''.join(respuesta.streaming_content), PDF[10:20])
+        sufijo = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(sufijo.streaming_content), PDF[-5:])
+
+    def test_rango_fuera_del_archivo(self):
+        respuesta = self.client.get(self.url, HTTP_RANGE=f'bytes={len(PDF)}-')
+        self.assertEqual(respuesta.status_code, 416)
+        self.assertEqual(respuesta['Content-Range'], f'bytes */{len(PDF)}')
+
+    def test_no_modificado(self):
+        etag = self.client.get(self.url)['ETag']
+        respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta['ETag'], etag)
+
+    def test_auditoria_solo_desde_el_byte_cero(self):
+        for rango in ('bytes=0-99', 'bytes=100-199', 'bytes=200-299'):
+            self.client.get(self.url, HTTP_RANGE=rango)
+        self.assertEqual(AuditoriaDocumento.objects.filter(documento_id=self.id, accion='DESCARGA').count(), 1)
+
+
+class EntregaDelegadaTests(DocumentosApiMixin, TestCase):
+    """DOCUMENT_DELIVERY_BACKEND: el proxy envía el archivo; la vista solo pone cabeceras."""
+
+    def setUp(self):
+        super().setUp()
+        respuesta = self.subir()
+        self.id, self.ruta = respuesta.data['id'], respuesta.data['ruta']
+        self.url = f"/api/documentos/{self.id}/descargar/"
+
+    @override_settings(DOCUMENT_DELIVERY_BACKEND='x-accel', DOCUMENT_ACCEL_PREFIX='/internos/')
+    def test_x_accel_redirect(self):
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['X-Accel-Redirect'], f'/internos/{self.ruta}')
+        self.assertEqual(respuesta.content, b'')
+        self.assertIn('attachment', respuesta['Content-Disposition'])
+        self.assertIn('ETag', respuesta)
+        self.assertEqual(AuditoriaDocumento.objects.filter(documento_id=self.id, accion='DESCARGA').count(), 1)
+
+    @override_settings(DOCUMENT_DELIVERY_BACKEND='x-sendfile')
+    def test_x_sendfile(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta['X-Sendfile'], get_document_file_path(Documento.objects.get(pk=self.id)))
+        self.assertEqual(respuesta.content, b'')
+
+
+class FotoEmpleadoTests(TestCase):
+    """Variantes de Empleado.foto generadas en línea (EMPLEADO_FOTO_WORKERS=0)."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        ajustes = override_settings(MEDIA_ROOT=media, EMPLEADO_FOTO_WORKERS=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_foto_ilegible_no_rompe_el_guardado(self):
+        with self.assertLogs('api.fotos', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            empleado = crear_empleado(1, foto=SimpleUploadedFile('foto.jpg', b'no es una imagen'))
+        empleado.refresh_from_db()
+        self.assertTrue(empleado.foto)
+        self.assertIsNone(empleado.foto_variantes)
+
+    def test_listado_calcula_la_url_base_una_vez(self):
+        imagen = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(imagen, 'JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(3):
+                crear_empleado(n, foto=SimpleUploadedFile(f'foto{n}.jpg', imagen.getvalue()))
+        request = RequestFactory().get('/api/empleados/')
+        with mock.patch.object(request, 'build_absolute_uri', wraps=request.build_absolute_uri) as absoluta:
+            datos = EmpleadoSerializer(Empleado.objects.all(), many=True, context={'request': request}).data
+        absoluta.assert_called_once()
+        for fila in datos:
+            self.assertTrue(fila['foto'].startswith('http://testserver/'))
+            self.assertEqual(fila['foto'], fila['foto_url'])
+            self.assertTrue(fila['foto_variantes']['thumb']['webp'].startswith('http://testserver/'))
+
+
+class SubidaLoteTests(DocumentosApiMixin, TestCase):
+    """POST /api/documentos/subir-lote/."""
+
+    def test_nombre_no_valido_es_error_del_archivo(self):
+        largo = 'x' * 200 + '.pdf'
+        archivos = [SimpleUploadedFile(largo, PDF), SimpleUploadedFile('bien.pdf', PDF)]
+        respuesta = self.client.post('/api/documentos/subir-lote/', {'archivos': archivos}, format='multipart')
+        self.assertEqual(respuesta.status_code, 207, respuesta.data)
+        primero, segundo = respuesta.data['resultados']
+        self.assertEqual(primero['estado'], 'error')
+        self.assertEqual(segundo['estado'], 'creado')
+        self.assertEqual(list(Documento.objects.values_list('nombre', flat=True)), ['bien.pdf'])
+
+    def test_el_primer_nombre_no_invalida_el_lote(self):
+        archivos = [SimpleUploadedFile('x' * 200 + '.pdf', PDF)]
+        respuesta = self.client.post('/api/documentos/subir-lote/', {'archivos': archivos}, format='multipart')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.data['resultados'][0]['estado'], 'error')
+
+
+class SubidaFragmentosTests(AlmacenamientoTemporalMixin, TestCase):
+    """Reserva de fragmentos y SHA-256 de las subidas reanudables (api/subidas.py)."""
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = crear_usuario('u1', None)
+        self.subida = subidas.crear(self.usuario, 'a.pdf', len(PDF), {'nivel_sensibilidad': 'PUBLICO'})
+
+    def _escribir(self, inicio, fin):
+        return subidas.escribir_fragmento(
+            self.subida.pk, self.usuario, inicio, fin - inicio, len(PDF), io.BytesIO(PDF[inicio:fin]),
+        )
+
+    def test_fragmento_concurrente_recibe_conflicto(self):
+        SubidaDocumento.objects.filter(pk=self.subida.pk).update(reserva=self.subida.pk)
+        with self.assertRaises(subidas.FragmentoEnCurso):
+            self._escribir(0, 100)
+
+    def test_reserva_abandonada_caduca(self):
+        SubidaDocumento.objects.filter(pk=self.subida.pk).update(
+            reserva=self.subida.pk, fecha_actualizacion=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(self._escribir(0, 100).recibidos, 100)
+        self.assertIsNone(SubidaDocumento.objects.get(pk=self.subida.pk).reserva)
+
+    def test_checksum_si_el_hash_se_pierde_entre_fragmentos(self):
+        self._escribir(0, 1000)
+        subidas._hashes.clear()  # el siguiente fragmento lo atiende otro proceso
+        self._escribir(1000, len(PDF))
+        documento = subidas.finalizar(
+            self.subida.pk, self.usuario, lambda meta: Documento.objects.create(nombre='a.pdf', **meta),
+        )
+        self.assertEqual(documento.checksum_sha256, hashlib.sha256(PDF).hexdigest())
+
+
+@override_settings(DOCUMENT_STORAGE_DEDUP=True)
+class AlmacenCASTests(DocumentosApiMixin, TestCase):
+    """Almacén deduplicado por SHA-256 con recuento de referencias (ArchivoDocumento)."""
+
+    def _borrar(self, documento_id):
+        # El contenido se suelta tras el commit (señal post_delete y release_blob)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/documentos/{documento_id}/').status_code, 204)
+
+    def test_subida_duplicada_comparte_contenido(self):
+        primero, segundo = self.subir('a.pdf'), self.subir('b.pdf')
+        self.assertEqual(primero.data['ruta'], segundo.data['ruta'])
+        self.assertTrue(primero.data['ruta'].startswith('cas/'))
+        self.assertEqual(ArchivoDocumento.objects.get().referencias, 2)
+
+    def test_contenido_se_borra_con_la_ultima_referencia(self):
+        primero, segundo = self.subir('a.pdf'), self.subir('b.pdf')
+        path = get_document_file_path(Documento.objects.get(pk=primero.data['id']))
+        self._borrar(primero.data['id'])
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(ArchivoDocumento.objects.get().referencias, 1)
+        self._borrar(segundo.data['id'])
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ArchivoDocumento.objects.exists())
+
+    def test_subida_rechazada_no_deja_referencia(self):
+        self.assertEqual(self.subir(caso=999999).status_code, 400)
+        self.assertEqual(self.subir('a.pdf', b'texto plano').status_code, 400)
+        self.assertFalse(ArchivoDocumento.objects.exists())
+        # Falla la creación del Documento con el archivo ya publicado
+        with self.captureOnCommitCallbacks(execute=True):
+            with mock.patch.object(DocumentoSerializer, 'save', side_effect=DatabaseError):
+                with self.assertRaises(DatabaseError):
+                    self.subir()
+        self.assertFalse(ArchivoDocumento.objects.exists())
+        self.assertFalse(Documento.objects.exists())
+
+    def test_migracion_idempotente(self):
+        with override_settings(DOCUMENT_STORAGE_DEDUP=False):
+            ids = [self.subir(nombre).data['id'] for nombre in ('a.pdf', 'b.pdf')]
+            ids.append(self.subir('c.pdf', PDF + b'%%EOF').data['id'])
+        self.assertFalse(any(d.ruta.startswith('cas/') for d in Documento.objects.all()))
+        for _ in range(2):
+            salida = io.StringIO()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('migrar_almacenamiento_cas', stdout=salida, stderr=io.StringIO())
+            rutas = dict(Documento.objects.values_list('pk', 'ruta'))
+            self.assertEqual(rutas[ids[0]], rutas[ids[1]])
+            self.assertNotEqual(rutas[ids[0]], rutas[ids[2]])
+            self.assertEqual(
+                sorted(ArchivoDocumento.objects.values_list('referencias', flat=True)), [1, 2],
+            )
+            self.assertTrue(all(os.path.isfile(get_document_file_path(d)) for d in Documento.objects.all()))
+        self.assertIn("'migrados': 0", salida.getvalue())
+
+
+@mock.patch.object(auditoria.EscritorAuditoria, '_arrancar_hilo')
+class EscritorAuditoriaTests(TestCase):
+    """Un lote de auditoría que no se puede insertar no retiene a los siguientes."""
+
+    def setUp(self):
+        self.spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool, True)
+        self.usuario = crear_usuario('admin')
+        self.documento = Documento.objects.create(nombre='a.pdf', usuario_creador=self.usuario)
+
+    def evento(self, documento_id=None):
+        return {
+            'documento_id': documento_id or self.documento.pk, 'usuario_id': self.usuario.pk,
+            'accion': 'DESCARGA', 'ip_origen': '10.0.0.1', 'fecha': timezone.now().isoformat(),
+        }
+
+    def spools(self):
+        return sorted(n for n in os.listdir(self.spool) if n.endswith('.jsonl'))
+
+    def test_lote_envenenado_no_bloquea_los_siguientes(self, _hilo):
+        escritor = auditoria.EscritorAuditoria(self.spool, batch_size=100, intervalo=0, max_reintentos=2)
+        self.addCleanup(escritor.cerrar)
+        escritor.encolar(self.evento('no-es-un-id'))
+        with self.assertLogs('api.auditoria', 'ERROR'):
+            escritor.vaciar()
+        escritor.encolar(self.evento())
+        escritor.encolar(self.evento())
+        with self.assertLogs('api.auditoria', 'ERROR') as registro:
+            escritor.vaciar()
+        self.assertIn('descartado tras 2 intentos', registro.output[-1])
+        self.assertEqual(AuditoriaDocumento.objects.count(), 2)
+        self.assertEqual(self.spools(), [])
+        self.assertEqual(len(os.listdir(os.path.join(self.spool, auditoria.DESCARTADOS))), 1)
+        metricas = escritor.metricas()
+        self.assertEqual((metricas['profundidad_cola'], metricas['descartados']), (0, 1))
+
+    def test_lote_fallido_espera_antes_de_reintentar(self, _hilo):
+        escritor = auditoria.EscritorAuditoria(self.spool, batch_size=100, intervalo=60)
+        self.addCleanup(escritor.cerrar)
+        escritor.encolar(self.evento('no-es-un-id'))
+        with self.assertLogs('api.auditoria', 'ERROR'):
+            escritor.vaciar()
+        escritor.encolar(self.evento())
+        with mock.patch.object(auditoria, '_crear_auditorias', wraps=auditoria._crear_auditorias) as crear:
+            escritor.vaciar()
+        # Solo el lote nuevo: el fallido no vuelve a intentarse hasta que pase su espera
+        crear.assert_called_once()
+        self.assertEqual(AuditoriaDocumento.objects.count(), 1)
+        self.assertEqual(escritor.metricas()['lotes_pendientes'], 1)
+
+    def test_recuperar_spools_aparta_el_ilegible(self, _hilo):
+        for nombre, evento in (('1-a-1.jsonl', self.evento('no-es-un-id')), ('1-a-2.jsonl', self.evento())):
+            with open(os.path.join(self.spool, nombre), 'w', encoding='utf-8') as f:
+                f.write(json.dumps(evento) + '\n')
+        with self.assertLogs('api.auditoria', 'ERROR'):
+            archivos, eventos = auditoria.recuperar_spools(self.spool, forzar=True)
+        self.assertEqual((archivos, eventos), (1, 1))
+        self.assertEqual(AuditoriaDocumento.objects.count(), 1)
+        self.assertEqual(self.spools(), [])
+        self.assertEqual(os.listdir(os.path.join(self.spool, auditoria.DESCARTADOS)), ['1-a-1.jsonl'])
+
+
+class LimpiarHuerfanosTests(AlmacenamientoTemporalMixin, TestCase):
+    """manage.py limpiar_huerfanos: qué archivos del almacenamiento se borran."""
+
+    def archivo(self, ruta, antiguo=True, contenido=b'x'):
+        path = os.path.join(self.raiz, *ruta.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(contenido)
+        if antiguo:
+            hace_dos_dias = time.time() - 48 * 3600
+            os.utime(path, (hace_dos_dias, hace_dos_dias))
+        return path
+
+    def limpiar(self):
+        call_command('limpiar_huerfanos', '--gracia-horas', '24', stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_solo_borra_antiguos_sin_documento(self):
+        usado = self.archivo('ab/cd/abcd-usado.pdf')
+        plano = self.archivo('ef/01/ef01-plano.pdf')  # fila antigua con la ruta plana
+        Documento.objects.create(nombre='u.pdf', ruta='ab/cd/abcd-usado.pdf', checksum_sha256='1' * 64)
+        Documento.objects.create(nombre='p.pdf', ruta='ef01-plano.pdf')
+        huerfano = self.archivo('12/34/1234-huerfano.pdf')
+        reciente = self.archivo('56/78/5678-reciente.pdf', antiguo=False)
+        miniatura_usada = self.archivo(ruta_miniatura('1' * 64))
+        miniatura_huerfana = self.archivo(ruta_miniatura('2' * 64))
+        call_command('limpiar_huerfanos', '--dry-run', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(huerfano))
+        self.limpiar()
+        self.assertFalse(os.path.exists(huerfano))
+        self.assertFalse(os.path.exists(miniatura_huerfana))
+        for path in (usado, plano, reciente, miniatura_usada):
+            self.assertTrue(os.path.exists(path), path)
+
+    @override_settings(DOCUMENT_STORAGE_DEDUP=True)
+    def test_contenido_cas_con_referencias_se_conserva(self):
+        contenido = b'compartido'
+        checksum = hashlib.sha256(contenido).hexdigest()
+        ruta = document_service.cas_relative_path(checksum)
+        path = self.archivo(ruta, contenido=contenido)
+        ArchivoDocumento.objects.create(checksum_sha256=checksum, ruta=ruta, tamano_bytes=len(contenido), referencias=1)
+        self.limpiar()
+        self.assertTrue(os.path.exists(path))
+        ArchivoDocumento.objects.filter(pk=checksum).update(referencias=0)
+        self.limpiar()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ArchivoDocumento.objects.exists())
+
+    def test_temporales_fuera_de_la_raiz_se_borran(self):
+        repartido = self.archivo(f'ab/cd/.subida-{"1" * 32}.part')
+        miniatura = self.archivo(f'miniaturas/ab/.subida-{"2" * 32}.part')
+        cas = self.archivo(f'cas/ab/cd/.subida-{"4" * 32}.part')
+        huerfano_raiz = self.archivo(f'.subida-{"3" * 32}.part')
+        subida = subidas.crear(crear_usuario('u1', None), 'a.pdf', len(PDF), {})
+        abierta = self.archivo(f'.subida-{subida.pk.hex}.part')
+        self.limpiar()
+        self.assertFalse(os.path.exists(repartido))
+        self.assertFalse(os.path.exists(miniatura))
+        self.assertFalse(os.path.exists(cas))
+        self.assertFalse(os.path.exists(huerfano_raiz))
+        self.assertTrue(os.path.exists(abierta))
+
+
+@override_settings(AUDIT_ASYNC=False)
+class AuditoriaApiTests(UsuarioAutenticadoMixin, TestCase):
+    """/api/auditoria/ y /api/auditoria/resumen/."""
+
+    def setUp(self):
+        super().setUp()
+        self.documento = Documento.objects.create(nombre='a.pdf', usuario_creador=self.usuario)
+        auditoria.registrar(self.documento.pk, self.usuario.pk, 'DESCARGA', '10.0.0.1')
+
+    def test_filtros_no_enteros_son_400(self):
+        for url, campo in (('/api/auditoria/', 'documento'), ('/api/auditoria/resumen/', 'usuario')):
+            respuesta = self.client.get(url, {campo: 'abc'})
+            self.assertEqual(respuesta.status_code, 400)
+            self.assertEqual(respuesta.data, {campo: 'Debe ser un entero.'})
+
+    def test_resumen_acumula_por_dia(self):
+        auditoria.registrar_varios([self.documento.pk] * 2, self.usuario.pk, 'DESCARGA')
+        auditoria.registrar(self.documento.pk, self.usuario.pk, 'SUBIDA')
+        self.assertEqual(AuditoriaResumenDiario.objects.count(), 2)
+        respuesta = self.client.get('/api/auditoria/resumen/', {'agrupar': 'accion'})
+        self.assertEqual(
+            {f['accion']: f['total'] for f in respuesta.data['resultados']}, {'DESCARGA': 3, 'SUBIDA': 1},
+        )
+        por_usuario = self.client.get('/api/auditoria/resumen/', {'agrupar': 'usuario', 'usuario': self.usuario.pk})
+        self.assertEqual(por_usuario.data['resultados'][0]['total'], 4)
+
+    def test_filtro_por_documento(self):
+        respuesta = self.client.get('/api/auditoria/', {'documento': self.documento.pk})
+        self.assertEqual([f['accion'] for f in respuesta.data['results']], ['DESCARGA'])
+        self.assertEqual(self.client.get('/api/auditoria/', {'documento': self.documento.pk + 1}).data['results'], [])
+
+
+class VisibilidadDocumentosTests(TestCase):
+    """visible_to/con_acceso (SQL) deben coincidir con user_can_access_document (Python)."""
+    NIVELES = ('PUBLICO', 'publico', '', 'CONFIDENCIAL', 'confidencial', 'RESTRINGIDO', 'restringido')
+
+    def setUp(self):
+        self.usuarios = [
+            crear_usuario('admin'), crear_usuario('tha', 'THA'), crear_usuario('analista', 'administrador'),
+            crear_usuario('responsable', 'Empleado'), crear_usuario('creador', 'Empleado'),
+            crear_usuario('otro', 'Empleado'), crear_usuario('sinrol', None),
+        ]
+        usuarios = {u.username: u for u in self.usuarios}
+        caso = Caso.objects.create(empleado=crear_empleado(1), responsable=usuarios['responsable'])
+        self.documentos = {}
+        for nivel in self.NIVELES:
+            for sufijo, campos in (
+                ('caso', {'caso': caso}), ('creador', {'usuario_creador': usuarios['creador']}), ('ajeno', {}),
+            ):
+                self.documentos[nivel, sufijo] = Documento.objects.create(
+                    nombre=f'{nivel or "vacio"}-{sufijo}.pdf', nivel_sensibilidad=nivel, **campos,
+                )
+        self.otro = usuarios['otro']
+
+    def test_visible_to_coincide_con_user_can_access_document(self):
+        for usuario in self.usuarios:
+            usuario = User.objects.select_related('rol').get(pk=usuario.pk)
+            esperados = {
+                d.pk for d in Documento.objects.select_related('caso') if user_can_access_document(usuario, d)
+            }
+            with self.subTest(usuario=usuario.username):
+                self.assertEqual(set(Documento.objects.visible_to(usuario).values_list('pk', flat=True)), esperados)
+                anotados = Documento.objects.con_acceso(usuario).values_list('pk', 'puede_acceder')
+                self.assertEqual({pk for pk, puede in anotados if puede}, esperados)
+
+    def test_api_no_expone_documentos_no_visibles(self):
+        client = APIClient()
+        client.force_authenticate(self.otro)
+        respuesta = client.get('/api/documentos/')
+        datos = respuesta.data['results'] if isinstance(respuesta.data, dict) else respuesta.data
+        self.assertEqual(
+            {d['id'] for d in datos},
+            {d.pk for (nivel, _), d in self.documentos.items() if nivel.upper() == 'PUBLICO'},
+        )
+        for nivel in ('', 'confidencial', 'RESTRINGIDO'):
+            pk = self.documentos[nivel, 'ajeno'].pk
+            with self.subTest(nivel=nivel):
+                self.assertEqual(client.get(f'/api/documentos/{pk}/').status_code, 403)
+                self.assertEqual(client.get(f'/api/documentos/{pk}/descargar/').status_code, 403)
+        inexistente = max(d.pk for d in self.documentos.values()) + 1
+        self.assertEqual(client.get(f'/api/documentos/{inexistente}/').status_code, 404)
+        self.assertEqual(client.get(f'/api/documentos/{inexistente}/descargar/').status_code, 404)
+
+
+class PaginacionKeysetTests(UsuarioAutenticadoMixin, TestCase):
+    """?cursor= en los listados (PaginacionHibrida/KeysetPagination)."""
+
+    def setUp(self):
+        super().setUp()
+        # Empates en (apellido, nombre): el orden lo desempata la PK
+        for n in range(45):
+            crear_empleado(n, apellido='Igual' if n % 3 else f'Apellido{n:02d}', nombre='Igual' if n % 3 else f'N{n}')
+        self.esperados = list(Empleado.objects.order_by('apellido', 'nombre', 'pk').values_list('pk', flat=True))
+
+    def test_recorre_todas_las_paginas_sin_repetir(self):
+        ids, url, paginas = [], '/api/empleados/?cursor=', 0
+        while url:
+            respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertNotIn('count', respuesta.data)
+            ids.extend(fila['id'] for fila in respuesta.data['results'])
+            url, paginas = respuesta.data['next'], paginas + 1
+        self.assertEqual(ids, self.esperados)
+        self.assertEqual(paginas, 3)
+
+    def test_pagina_anterior(self):
+        primera = self.client.get('/api/empleados/?cursor=').data
+        segunda = self.client.get(primera['next']).data
+        anterior = self.client.get(segunda['previous']).data
+        self.assertEqual([f['id'] for f in anterior['results']], [f['id'] for f in primera['results']])
+        self.assertIsNone(anterior['previous'])
+
+    def test_cursor_invalido(self):
+        for cursor in ('no-es-base64!', codificar_cursor(['solo-uno'])):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/api/empleados/', {'cursor': cursor}).status_code, 404)
+
+    def test_orden_por_relevancia_usa_paginas(self):
+        # Como buscar_empleados en PostgreSQL: el orden por una anotación no admite keyset
+        queryset = Empleado.objects.annotate(relevancia=Value(1.0)).order_by('-relevancia', 'pk')
+        request = Request(RequestFactory().get('/api/empleados/', {'cursor': '', 'search': 'x'}))
+        paginacion = PaginacionHibrida()
+        filas = paginacion.paginate_queryset(queryset, request)
+        self.assertIsNone(paginacion.keyset)
+        self.assertEqual([f.pk for f in filas], list(queryset.values_list('pk', flat=True)[:20]))
+        self.assertEqual(paginacion.get_paginated_response([]).data['count'], 45)
+
+
+class EscrituraAtomicaTests(DocumentosApiMixin, TestCase):
+    """write_stream_atomic: SHA-256 y tamaño en la misma pasada, sin archivos a medias."""
+
+    def test_checksum_y_tamano(self):
+        destino = os.path.join(self.raiz, 'destino.bin')
+        tamano, checksum = document_service.write_stream_atomic(iter([b'a' * 10, b'b' * 5]), destino)
+        self.assertEqual((tamano, checksum), (15, hashlib.sha256(b'a' * 10 + b'b' * 5).hexdigest()))
+        with open(destino, 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 10 + b'b' * 5)
+
+    def test_fallo_a_mitad_no_deja_nada(self):
+        def trozos():
+            yield b'a' * 10
+            raise OSError('conexión cortada')
+
+        destino = os.path.join(self.raiz, 'destino.bin')
+        with self.assertRaises(OSError):
+            document_service.write_stream_atomic(trozos(), destino)
+        self.assertEqual(os.listdir(self.raiz), [])
+
+    def test_subida_guarda_checksum_y_tamano(self):
+        respuesta = self.subir()
+        self.assertEqual(respuesta.status_code, 201)
+        documento = Documento.objects.get(pk=respuesta.data['id'])
+        self.assertEqual(documento.tamano_bytes, len(PDF))
+        self.assertEqual(documento.checksum_sha256, hashlib.sha256(PDF).hexdigest())
+        self.assertEqual(document_service.compute_sha256(get_document_file_path(documento)), documento.checksum_sha256)
+
+
+class AlmacenamientoRepartidoTests(DocumentosApiMixin, TestCase):
+    """Reparto del almacenamiento en <aa>/<bb>/ (DOCUMENT_STORAGE_SHARDED)."""
+
+    def test_subida_va_a_subdirectorios(self):
+        ruta = self.subir().data['ruta']
+        nombre = ruta.rsplit('/', 1)[-1]
+        self.assertEqual(ruta, document_service.sharded_relative_path(nombre))
+        self.assertTrue(os.path.isfile(os.path.join(self.raiz, *ruta.split('/'))))
+
+    def test_reorganizar_mueve_los_planos(self):
+        with override_settings(DOCUMENT_STORAGE_SHARDED=False):
+            documento = Documento.objects.get(pk=self.subir().data['id'])
+        self.assertTrue(document_service.is_flat_path(documento.ruta))
+        call_command('reorganizar_almacenamiento', stdout=io.StringIO())
+        movido = Documento.objects.get(pk=documento.pk)
+        self.assertEqual(movido.ruta, document_service.sharded_relative_path(documento.ruta))
+        self.assertFalse(os.path.exists(os.path.join(self.raiz, documento.ruta)))
+        # Una fila leída antes de mover sigue encontrando el archivo
+        self.assertEqual(get_document_file_path(documento), get_document_file_path(movido))
+        self.assertEqual(self.client.get(f'/api/documentos/{documento.pk}/descargar/').status_code, 200)
+
+
+class ParticionesAuditoriaTests(TestCase):
+    """Meses de Auditoria_Documento: límites, retención y archivo (api/particiones.py)."""
+
+    def setUp(self):
+        self.usuario = crear_usuario('admin')
+        self.documento = Documento.objects.create(nombre='a.pdf', usuario_creador=self.usuario)
+
+    def auditar(self, fecha):
+        return AuditoriaDocumento.objects.create(
+            documento=self.documento, usuario=self.usuario, accion='DESCARGA', fecha=fecha,
+        )
+
+    def test_limites_y_retencion(self):
+        desde, hasta = particiones.limites_mes(2025, 12)
+        self.assertEqual((desde.year, desde.month, hasta.year, hasta.month), (2025, 12, 2026, 1))
+        adjuntas = [(2023, 11), (2023, 12), (2024, 1), (2025, 12)]
+        self.assertEqual(particiones.meses_a_archivar(adjuntas, 24, referencia=(2026, 1)), [(2023, 11), (2023, 12)])
+        self.assertEqual(particiones.sumar_meses(2026, 1, -1), (2025, 12))
+
+    def test_del_mes_semiabierto(self):
+        desde, hasta = particiones.limites_mes(2026, 3)
+        dentro = [self.auditar(desde), self.auditar(hasta - timedelta(microseconds=1))]
+        self.auditar(desde - timedelta(microseconds=1))
+        self.auditar(hasta)
+        self.assertEqual(
+            set(AuditoriaDocumento.objects.del_mes(2026, 3).values_list('pk', flat=True)), {f.pk for f in dentro},
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'Auditoria_Documento solo está particionada en PostgreSQL')
+    def test_archiva_meses_fuera_de_retencion(self):
+        archivo = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archivo, True)
+        viejo = particiones.sumar_meses(*particiones.mes_actual(), -30)
+        fila = self.auditar(particiones.limites_mes(*viejo)[0] + timedelta(days=3))
+        reciente = self.auditar(timezone.now())
+        with connection.cursor() as cursor:
+            particiones.crear_particion(cursor, *viejo)
+        call_command('particiones_auditoria', '--retener-meses', '24', '--archivo-dir', archivo, stdout=io.StringIO())
+        nombre = particiones.nombre_particion(*viejo)
+        with gzip.open(os.path.join(archivo, f'{nombre}.csv.gz'), 'rt') as f:
+            self.assertIn(str(fila.pk), f.read())
+        self.assertEqual(list(AuditoriaDocumento.objects.values_list('pk', flat=True)), [reciente.pk])
+        with connection.cursor() as cursor:
+            adjuntas, sueltas = particiones.listar_particiones(cursor)
+        self.assertNotIn(viejo, adjuntas)
+        self.assertEqual(sueltas, [])
+
+
+class VerificarIntegridadTests(DocumentosApiMixin, TestCase):
+    """manage.py verificar_integridad: corruptos, faltantes y huérfanos."""
+
+    def test_informa_de_cada_problema(self):
+        ids = [self.subir(f'{n}.pdf', PDF + bytes([n])).data['id'] for n in range(3)]
+        sano, corrupto, faltante = (Documento.objects.get(pk=pk) for pk in ids)
+        with open(get_document_file_path(corrupto), 'r+b') as f:
+            f.seek(100)
+            f.write(b'\xff')  # mismo tamaño, otro contenido
+        os.remove(get_document_file_path(faltante))
+        with open(os.path.join(self.raiz, 'suelto.pdf'), 'wb') as f:
+            f.write(PDF)
+        salida = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, salida, True)
+        informe = os.path.join(salida, 'informe.jsonl')
+        call_command(
+            'verificar_integridad', '--procesos', '1', '--mb-por-segundo', '0', '--bufer-mb', '1',
+            '--estado', os.path.join(salida, 'estado.json'), '--informe', informe,
+            stdout=io.StringIO(), stderr=io.StringIO(),
+        )
+        with open(informe, encoding='utf-8') as f:
+            problemas = {(p['estado'], p.get('documento'), p.get('ruta')) for p in map(json.loads, f)}
+        self.assertEqual(problemas, {
+            ('corrupto', corrupto.pk, corrupto.ruta), ('faltante', faltante.pk, faltante.ruta),
+            ('huerfano', None, 'suelto.pdf'),
+        })
+        self.assertNotIn(sano.pk, {documento for _, documento, _ in problemas})
+
+    def test_verificar_archivo(self):
+        path = os.path.join(self.raiz, 'a.bin')
+        with open(path, 'wb') as f:
+            f.write(b'abc')
+        checksum = hashlib.sha256(b'abc').hexdigest()
+        self.assertEqual(integridad.verificar_archivo((path, 3, checksum))[0], integridad.ESTADO_OK)
+        self.assertEqual(integridad.verificar_archivo((path, 3, '0' * 64))[0], integridad.ESTADO_CORRUPTO)
+        self.assertEqual(integridad.verificar_archivo((path, 4, checksum))[0], integridad.ESTADO_TAMANO)
+        self.assertEqual(integridad.verificar_archivo((None, 3, checksum))[0], integridad.ESTADO_FALTANTE)
+
+
+class DescargaZipTests(DocumentosApiMixin, TestCase):
+    """GET /api/casos/<id>/descargar-zip/: ZIP en flujo solo con lo que el usuario puede ver."""
+
+    def setUp(self):
+        super().setUp()
+        self.responsable = crear_usuario('responsable', 'Empleado')
+        empleado = crear_empleado(1)
+        self.caso = Caso.objects.create(empleado=empleado, responsable=self.responsable)
+        informes = Carpeta.objects.create(empleado=empleado, nombre='Informes')
+        self.ids = {}
+        for nombre, nivel, carpeta, contenido in (
+            ('publico', 'PUBLICO', None, PDF + b'1'), ('confidencial', 'CONFIDENCIAL', informes, PDF + b'2'),
+            ('restringido', 'RESTRINGIDO', None, PDF + b'3'), ('perdido', 'PUBLICO', None, PDF + b'4'),
+        ):
+            pk = self.subir(f'{nombre}.pdf', contenido).data['id']
+            Documento.objects.filter(pk=pk).update(nombre=nombre, nivel_sensibilidad=nivel, caso=self.caso, carpeta=carpeta)
+            self.ids[nombre] = pk
+        os.remove(get_document_file_path(Documento.objects.get(pk=self.ids['perdido'])))
+
+    def test_zip_con_los_visibles(self):
+        client = APIClient()
+        client.force_authenticate(self.responsable)
+        respuesta = client.get(f'/api/casos/{self.caso.pk}/descargar-zip/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(b''.join(respuesta.streaming_content))) as archivo:
+            self.assertIsNone(archivo.testzip())
+            self.assertEqual(
+                sorted(archivo.namelist()), ['Informes/confidencial.pdf', 'LEEME.txt', 'publico.pdf'],
+            )
+            self.assertEqual(archivo.read('Informes/confidencial.pdf'), PDF + b'2')
+            self.assertIn('perdido.pdf', archivo.read('LEEME.txt').decode('utf-8'))
+        auditados = set(AuditoriaDocumento.objects.filter(accion='DESCARGA').values_list('documento_id', flat=True))
+        self.assertEqual(auditados, {self.ids['publico'], self.ids['confidencial']})
+
+
+@override_settings(DOCUMENT_THUMBNAIL_SIZE=64)
+class MiniaturasTests(DocumentosApiMixin, TestCase):
+    """Miniaturas WebP por checksum (api/miniaturas.py) y GET /api/documentos/<id>/miniatura/."""
+
+    def png(self, ancho=400, alto=200):
+        datos = io.BytesIO()
+        Image.new('RGB', (ancho, alto), 'red').save(datos, 'PNG')
+        return datos.getvalue()
+
+    def test_se_genera_al_pedirla_y_se_revalida(self):
+        respuesta = self.subir('foto.png', self.png())
+        self.assertTrue(respuesta.data['miniatura_url'].endswith(f"?v={respuesta.data['checksum_sha256'][:16]}"))
+        url = f"/api/documentos/{respuesta.data['id']}/miniatura/"
+        miniatura = self.client.get(url)
+        self.assertEqual(miniatura.status_code, 200)
+        self.assertEqual(miniatura['Content-Type'], 'image/webp')
+        with Image.open(io.BytesIO(b''.join(miniatura.streaming_content))) as imagen:
+            self.assertEqual((imagen.format, imagen.size), ('WEBP', (64, 32)))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=miniatura['ETag']).status_code, 304)
+
+    def test_mismo_contenido_comparte_miniatura(self):
+        contenido = self.png()
+        primero, segundo = self.subir('a.png', contenido).data, self.subir('b.png', contenido).data
+        self.client.get(f"/api/documentos/{primero['id']}/miniatura/")
+        with mock.patch.object(miniaturas, 'generar_miniatura') as generar:
+            self.assertEqual(self.client.get(f"/api/documentos/{segundo['id']}/miniatura/").status_code, 200)
+        generar.assert_not_called()
+
+    @override_settings(DOCUMENT_THUMBNAILS=True)
+    def test_se_encola_al_subir(self):
+        futuros = []
+        programar = miniaturas.programar
+        with mock.patch.object(miniaturas, 'programar', side_effect=lambda *a: futuros.append(programar(*a))):
+            checksum = self.subir('foto.png', self.png()).data['checksum_sha256']
+        self.assertEqual(len(futuros), 1)
+        self.assertEqual(futuros[0].result(timeout=30), miniaturas.path_miniatura(checksum))
+        self.assertTrue(os.path.isfile(miniaturas.path_miniatura(checksum)))
+
+    def test_sin_miniatura(self):
+        texto = self.subir('notas.txt', b'solo texto').data['id']
+        self.assertEqual(self.client.get(f'/api/documentos/{texto}/miniatura/').status_code, 404)
+        ilegible = self.subir('roto.png', b'\x89PNG\r\n\x1a\n' + b'\x00' * 64).data['id']
+        with self.assertLogs('api.miniaturas', 'WARNING'):
+            self.assertEqual(self.client.get(f'/api/documentos/{ilegible}/miniatura/').status_code, 404)
@@ -0,0 +1,249 @@
+"""
+Tipo de contenido (MIME) de los documentos, detectado por la firma de sus primeros bytes
+(magic bytes) y no por el nombre que envía el cliente.
+- Se detecta una vez al subir, con la cabecera que ya está en memoria (TAMANO_CABECERA),
+  y se guarda en Documento.mime_type; la descarga usa ese valor.
+- La extensión debe corresponder al contenido (un ejecutable renombrado a .pdf se rechaza).
+- DOCUMENT_MIME_POLICY: tipos permitidos por nivel de sensibilidad (patrones como 'image/*').
+Sin dependencias externas (libmagic): solo las firmas de los formatos que maneja el sistema.
+"""
+import fnmatch
+import mimetypes
+from django.conf import settings
+
+TAMANO_CABECERA = 8192
+
+GENERICO = 'application/octet-stream'
+TEXTO = 'text/plain'
+ZIP = 'application/zip'
+OLE = 'application/x-ole-storage'  # Office 97-2003 y Outlook .msg comparten contenedor
+
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+PPTX = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+ODT = 'application/vnd.oasis.opendocument.text'
+ODS = 'application/vnd.oasis.opendocument.spreadsheet'
+ODP = 'application/vnd.oasis.opendocument.presentation'
+
+# Ejecutables y comprimidos: se comprueban primero y solo en el desplazamiento 0, para que
+# un políglota (un ejecutable con %PDF- más adelante) no pase por otro tipo
+FIRMAS_PRIORITARIAS = [
+    (0, b'\x7fELF', 'application/x-executable'),
+    (0, b'\xcf\xfa\xed\xfe', 'application/x-mach-binary'),
+    (0, b'\xce\xfa\xed\xfe', 'application/x-mach-binary'),
+    (0, b'\xca\xfe\xba\xbe', 'application/x-mach-binary'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (0, b'Rar!\x1a\x07', 'application/vnd.rar'),
+]
+# (desplazamiento, firma, tipo), en orden de comprobación
+FIRMAS = [
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+    (0, b'{\\rtf', 'application/rtf'),
+    (0, b'%!PS', 'application/postscript'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', OLE),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'ID3', 'audio/mpeg'),
+]
+# Firmas de 2 bytes: solo si el contenido no es texto ('BMW...', 'MZ...' en un .txt);
+# un MZ con cabecera PE se reconoce antes que nada (_es_pe)
+FIRMAS_BINARIAS = [
+    (0, b'MZ', 'application/x-msdownload'),
+    (0, b'BM', 'image/bmp'),
+]
+RIFF = {b'WEBP': 'image/webp', b'WAVE': 'audio/wav', b'AVI ': 'video/x-msvideo'}
+FTYP = {b'qt  ': 'video/quicktime', b'M4A ': 'audio/mp4', b'heic': 'image/heic', b'heix': 'image/heic', b'mif1': 'image/heif'}
+CABECERAS_CORREO = (b'received:', b'return-path:', b'from:', b'mime-version:', b'message-id:', b'delivered-to:')
+
+# Extensión -> (tipo que se guarda, tipos detectados compatibles con ella)
+EXTENSIONES = {
+    'pdf': ('application/pdf', {'application/pdf'}),
+    'png': ('image/png', {'image/png'}),
+    'jpg': ('image/jpeg', {'image/jpeg'}),
+    'jpeg': ('image/jpeg', {'image/jpeg'}),
+    'gif': ('image/gif', {'image/gif'}),
+    'webp': ('image/webp', {'image/webp'}),
+    'tif': ('image/tiff', {'image/tiff'}),
+    'tiff': ('image/tiff', {'image/tiff'}),
+    'bmp': ('image/bmp', {'image/bmp'}),
+    'heic': ('image/heic', {'image/heic', 'image/heif'}),
+    'txt': (TEXTO, {TEXTO}),
+    'csv': ('text/csv', {TEXTO}),
+    'rtf': ('application/rtf', {'application/rtf'}),
+    'doc': ('application/msword', {OLE}),
+    'xls': ('application/vnd.ms-excel', {OLE}),
+    'ppt': ('application/vnd.ms-powerpoint', {OLE}),
+    'msg': ('application/vnd.ms-outlook', {OLE}),
+    # OOXML/ODF son ZIP: si la primera entrada no los delata se aceptan como ZIP genérico
+    'docx': (DOCX, {DOCX, ZIP}),
+    'xlsx': (XLSX, {XLSX, ZIP}),
+    'pptx': (PPTX, {PPTX, ZIP}),
+    'odt': (ODT, {ODT, ZIP}),
+    'ods': (ODS, {ODS, ZIP}),
+    'odp': (ODP, {ODP, ZIP}),
+    'eml': ('message/rfc822', {'message/rfc822', TEXTO}),
+    'zip': (ZIP, {ZIP, DOCX, XLSX, PPTX, ODT, ODS, ODP}),
+    'gz': ('application/gzip', {'application/gzip'}),
+    '7z': ('application/x-7z-compressed', {'application/x-7z-compressed'}),
+    'rar': ('application/vnd.rar', {'application/vnd.rar'}),
+    'mp3': ('audio/mpeg', {'audio/mpeg'}),
+    'wav': ('audio/wav', {'audio/wav'}),
+    'ogg': ('audio/ogg', {'audio/ogg'}),
+    'm4a': ('audio/mp4', {'audio/mp4', 'video/mp4'}),
+    'mp4': ('video/mp4', {'video/mp4'}),
+    'mov': ('video/quicktime', {'video/quicktime', 'video/mp4'}),
+    'avi': ('video/x-msvideo', {'video/x-msvideo'}),
+    'xml': ('application/xml', {'application/xml', TEXTO}),
+    'html': ('text/html', {'text/html'}),
+    'htm': ('text/html', {'text/html'}),
+    'svg': ('image/svg+xml', {'image/svg+xml', 'application/xml'}),
+}
+
+
+class TipoNoPermitido(ValueError):
+    """El contenido no corresponde a la extensión o su tipo no se admite para el nivel."""
+
+
+def _tipo_zip(cabecera):
+    # ODF guarda 'mimetype' sin comprimir como primera entrada; OOXML, sus carpetas
+    if cabecera[30:38] == b'mimetype':
+        tipo = cabecera[38:38 + 80].split(b'PK', 1)[0].decode('ascii', 'ignore').strip()
+        if tipo.startswith('application/vnd.oasis.opendocument.'):
+            return tipo
+    if b'word/' in cabecera:
+        return DOCX
+    if b'xl/' in cabecera:
+        return XLSX
+    if b'ppt/' in cabecera:
+        return PPTX
+    return ZIP
+
+
+def _es_texto(cabecera):
+    if b'\x00' in cabecera:
+        return False
+    try:
+        cabecera.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # La cabecera puede cortar un carácter multibyte al final
+        if e.start < len(cabecera) - 3:
+            # Latin-1 / Windows-1252 (CSV exportados de Excel): sin caracteres de control
+            return not any(b < 32 and b not in (9, 10, 12, 13) for b in cabecera)
+    return True
+
+
+def _tipo_texto(cabecera):
+    inicio = cabecera.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if inicio.startswith(b'<!doctype html') or inicio.startswith(b'<html') or b'<script' in inicio[:1024]:
+        return 'text/html'
+    if inicio.startswith(b'<svg') or (inicio.startswith(b'<?xml') and b'<svg' in inicio):
+        return 'image/svg+xml'
+    if inicio.startswith(b'<?xml'):
+        return 'application/xml'
+    if inicio.startswith(CABECERAS_CORREO):
+        return 'message/rfc822'
+    return TEXTO
+
+
+def _es_pe(cabecera):
+    """Ejecutable de Windows: MZ y, en el desplazamiento e_lfanew (0x3C), la firma PE."""
+    if cabecera[:2] != b'MZ' or len(cabecera) < 0x40:
+        return False
+    pe = int.from_bytes(cabecera[0x3C:0x40], 'little')
+    return cabecera[pe:pe + 4] == b'PE\x00\x00'
+
+
+def _es_pdf(cabecera):
+    # %PDF- al inicio; delante solo se admite un BOM o espacios en blanco
+    if cabecera.startswith(b'\xef\xbb\xbf'):
+        cabecera = cabecera[3:]
+    return cabecera.lstrip(b' \t\r\n\x0c').startswith(b'%PDF-')
+
+
+def detectar(cabecera):
+    """Tipo según la firma de `cabecera` (primeros bytes del archivo); GENERICO si no se reconoce."""
+    if not cabecera:
+        return TEXTO
+    if _es_pe(cabecera):
+        return 'application/x-msdownload'
+    for desplazamiento, firma, tipo in FIRMAS_PRIORITARIAS:
+        if cabecera[desplazamiento:desplazamiento + len(firma)] == firma:
+            return tipo
+    if cabecera.startswith((b'PK\x03\x04', b'PK\x05\x06')):
+        return _tipo_zip(cabecera)
+    if _es_pdf(cabecera):
+        return 'application/pdf'
+    if cabecera[:4] == b'RIFF' and cabecera[8:12] in RIFF:
+        return RIFF[cabecera[8:12]]
+    if cabecera[4:8] == b'ftyp':
+        return FTYP.get(cabecera[8:12], 'video/mp4')
+    if cabecera[:2] in (b'\xff\xfb', b'\xff\xf3', b'\xff\xf2'):
+        return 'audio/mpeg'
+    for desplazamiento, firma, tipo in FIRMAS:
+        if cabecera[desplazamiento:desplazamiento + len(firma)] == firma:
+            return tipo
+    if _es_texto(cabecera):
+        return _tipo_texto(cabecera)
+    for desplazamiento, firma, tipo in FIRMAS_BINARIAS:
+        if cabecera[desplazamiento:desplazamiento + len(firma)] == firma:
+            return tipo
+    return GENERICO
+
+
+def _extension(nombre):
+    return nombre.rsplit('.', 1)[-1].lower() if nombre and '.' in nombre else ''
+
+
+def tipo_contenido(cabecera, nombre=None):
+    """
+    Tipo a guardar para un archivo con esa cabecera y ese nombre.
+    Returns: (tipo, coincide) - coincide es False si la extensión conocida no corresponde
+    al contenido (entonces tipo es el detectado).
+    """
+    detectado = detectar(cabecera)
+    conocido = EXTENSIONES.get(_extension(nombre))
+    if conocido is None:
+        return detectado, True
+    tipo, compatibles = conocido
+    if detectado not in compatibles:
+        return detectado, False
+    # Compatible: se guarda el de la extensión (.xls en vez del contenedor OLE, .csv...)
+    return tipo, True
+
+
+def politica(nivel_sensibilidad):
+    """Patrones de tipos permitidos para el nivel, o None si no hay restricción."""
+    niveles = getattr(settings, 'DOCUMENT_MIME_POLICY', None) or {}
+    return niveles.get((nivel_sensibilidad or 'CONFIDENCIAL').upper())
+
+
+def permitido(tipo, nivel_sensibilidad):
+    patrones = politica(nivel_sensibilidad)
+    return patrones is None or any(fnmatch.fnmatchcase(tipo, p) for p in patrones)
+
+
+def validar(cabecera, nombre, nivel_sensibilidad):
+    """
+    Tipo de un archivo que se está subiendo. Lanza TipoNoPermitido si la extensión no
+    corresponde al contenido o el tipo no se admite para `nivel_sensibilidad`.
+    """
+    tipo, coincide = tipo_contenido(cabecera, nombre)
+    if not coincide:
+        raise TipoNoPermitido(
+            f"El contenido del archivo ({tipo}) no corresponde a la extensión .{_extension(nombre)}"
+        )
+    if not permitido(tipo, nivel_sensibilidad):
+        raise TipoNoPermitido(
+            f"Tipo de archivo no permitido para documentos {(nivel_sensibilidad or 'CONFIDENCIAL').upper()}: {tipo}"
+        )
+    return tipo
+
+
+def tipo_por_nombre(nombre):
+    """Tipo deducido del nombre, para documentos anteriores a la detección (mime_type vacío)."""
+    return mimetypes.guess_type(nombre or '')[0] or GENERICO
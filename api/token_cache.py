@@ -0,0 +1,179 @@
+"""
+Caché de validación de tokens para ExpiringTokenAuthentication.
+- Caché compartida de Django (TOKEN_CACHE_ALIAS, o 'default' si CACHES configura un backend
+  compartido como Redis o Memcached) con TOKEN_CACHE_TTL_SECONDS; si no hay ninguna, LRU en
+  proceso con el TTL corto TOKEN_CACHE_LOCAL_TTL_SECONDS.
+- Guarda solo el principal del token (ver ExpiringTokenAuthentication.principal_de):
+  id de usuario, rol, is_active y última actividad; nunca el usuario con su hash de
+  contraseña. Un acierto autentica sin ir a la BD.
+- Se invalida al borrar el token (logout, renovar_token, rotación en login, expiración)
+  y al guardar/eliminar el usuario (desactivación, cambio de rol). Ver api/signals.py.
+  invalidate_all (cambio de un Rol) cambia la generación de la caché compartida.
+Con el LRU en proceso y varios workers, un token revocado en otro proceso sigue siendo
+aceptado como máximo TOKEN_CACHE_LOCAL_TTL_SECONDS (0 = sin caché si no es compartida).
+"""
+import threading
+import uuid
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class LocalTokenCache:
+    """LRU en memoria del proceso con TTL; guarda el principal (copia por petición)."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._por_usuario = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._datos.get(key)
+            if item is None:
+                return None
+            vence, user_id, datos = item
+            if vence < time.monotonic():
+                self._quitar(key)
+                return None
+            self._datos.move_to_end(key)
+        return dict(datos)
+
+    def set(self, key, datos):
+        with self._lock:
+            self._quitar(key)
+            self._datos[key] = (time.monotonic() + self.ttl, datos['user_id'], dict(datos))
+            self._por_usuario[datos['user_id']] = key
+            while len(self._datos) > self.maxsize:
+                self._quitar(next(iter(self._datos)))
+
+    def delete(self, key):
+        with self._lock:
+            self._quitar(key)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            key = self._por_usuario.get(user_id)
+            if key is not None:
+                self._quitar(key)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+            self._por_usuario.clear()
+
+    def _quitar(self, key):
+        item = self._datos.pop(key, None)
+        if item is not None and self._por_usuario.get(item[1]) == key:
+            del self._por_usuario[item[1]]
+
+
+class SharedTokenCache:
+    """
+    Caché de Django (memcached, redis, archivo...) compartida según el backend.
+    Cada entrada lleva la generación vigente al guardarla; clear() cambia la generación
+    y las entradas anteriores dejan de valer (la API de caché no borra por prefijo).
+    """
+    PREFIJO = 'api:token:'
+    CLAVE_GENERACION = 'api:token:generacion'
+
+    def __init__(self, alias, ttl):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key):
+        valores = self.cache.get_many([self.PREFIJO + key, self.CLAVE_GENERACION])
+        entrada = valores.get(self.PREFIJO + key)
+        generacion = valores.get(self.CLAVE_GENERACION)
+        if entrada is None or generacion is None or entrada.get('generacion') != generacion:
+            return None
+        return entrada['datos']
+
+    def _generacion(self):
+        generacion = self.cache.get(self.CLAVE_GENERACION)
+        if generacion is None:
+            # Aleatoria y no un contador: si la caché la expulsa, no revive entradas antiguas
+            self.cache.add(self.CLAVE_GENERACION, uuid.uuid4().hex, None)
+            generacion = self.cache.get(self.CLAVE_GENERACION)
+        return generacion
+
+    def set(self, key, datos):
+        self.cache.set_many({
+            self.PREFIJO + key: {'generacion': self._generacion(), 'datos': datos},
+            f"{self.PREFIJO}user:{datos['user_id']}": key,
+        }, self.ttl)
+
+    def delete(self, key):
+        self.cache.delete(self.PREFIJO + key)
+
+    def delete_user(self, user_id):
+        clave_usuario = f'{self.PREFIJO}user:{user_id}'
+        key = self.cache.get(clave_usuario)
+        if key is not None:
+            self.cache.delete_many([self.PREFIJO + key, clave_usuario])
+
+    def clear(self):
+        self.cache.set(self.CLAVE_GENERACION, uuid.uuid4().hex, None)
+
+
+_token_cache = None
+
+
+def _cache_compartida(alias):
+    """Si el backend de CACHES[alias] se comparte entre procesos (no locmem ni dummy)."""
+    backend = getattr(settings, 'CACHES', {}).get(alias, {}).get('BACKEND', '')
+    return bool(backend) and not backend.endswith(('.LocMemCache', '.DummyCache'))
+
+
+def get_token_cache():
+    """Caché de tokens configurada, o None si el TTL que corresponde es 0."""
+    global _token_cache
+    if _token_cache is None:
+        alias = getattr(settings, 'TOKEN_CACHE_ALIAS', '')
+        if not alias and _cache_compartida('default'):
+            alias = 'default'
+        if alias and alias != 'local':
+            ttl = getattr(settings, 'TOKEN_CACHE_TTL_SECONDS', 30)
+            if not ttl:
+                return None
+            _token_cache = SharedTokenCache(alias, ttl)
+        else:
+            # Sin caché compartida la revocación no llega a los demás workers: TTL corto
+            ttl = min(
+                getattr(settings, 'TOKEN_CACHE_TTL_SECONDS', 30),
+                getattr(settings, 'TOKEN_CACHE_LOCAL_TTL_SECONDS', 2),
+            )
+            if not ttl:
+                return None
+            _token_cache = LocalTokenCache(getattr(settings, 'TOKEN_CACHE_MAXSIZE', 10000), ttl)
+    return _token_cache
+
+
+def invalidate_token(key):
+    cache = get_token_cache()
+    if cache is not None:
+        cache.delete(key)
+
+
+def invalidate_user(user_id):
+    cache = get_token_cache()
+    if cache is not None:
+        cache.delete_user(user_id)
+
+
+def invalidate_all():
+    cache = get_token_cache()
+    if cache is not None:
+        cache.clear()
+
+
+@receiver(setting_changed)
+def _reset_token_cache(setting, **kwargs):
+    global _token_cache
+    if setting.startswith('TOKEN_CACHE_') or setting == 'CACHES':
+        _token_cache = None
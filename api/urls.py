@@ -12,6 +12,7 @@ router.register(r'documentos', views.DocumentoViewSet, basename='documento')
 router.register(r'carpetas', views.CarpetaViewSet, basename='carpeta')
 router.register(r'seguimientos', views.SeguimientoViewSet, basename='seguimiento')
 router.register(r'reportes', views.ReporteViewSet, basename='reporte')
+router.register(r'auditoria', views.AuditoriaDocumentoViewSet, basename='auditoria')
 
 urlpatterns = [
     # Información de la API (público)
@@ -29,6 +30,9 @@ urlpatterns = [
     # Restablecimiento de contraseña
     path('auth/password-reset/', views.password_reset_request, name='password_reset_request'),
     
+    # Auditoría
+    path('auditoria/metricas/', views.metricas_auditoria, name='metricas_auditoria'),
+    
     # Rutas del router
     path('', include(router.urls)),
 ]
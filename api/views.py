@@ -4,33 +4,50 @@ from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from .models import ExpiringToken
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, BasePermission
+from rest_framework.exceptions import APIException
 from django.contrib.auth import authenticate
 from django.core.mail import send_mail
-from django.db.models import Q
+import os
 import secrets
 import logging
-from datetime import timedelta
+from datetime import datetime, timedelta
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
 
 # Configurar logger
 logger = logging.getLogger(__name__)
 
 from .models import (
     Rol, User, Empleado, Caso, Alerta, Documento, Carpeta,
-    Seguimiento, Reporte, TokenVerification
+    Seguimiento, Reporte, TokenVerification, AuditoriaDocumento, AuditoriaResumenDiario,
+    SubidaDocumento,
 )
+from .authentication import get_principal
+from . import auditoria
+from .search import buscar_empleados
+from .descargas import (
+    responder_descarga, debe_auditar_descarga, nombre_descarga, nombres_en_zip, responder_miniatura, responder_zip,
+)
+from . import miniaturas, subidas
+from .tipos_mime import TipoNoPermitido, tipo_por_nombre
+from .pagination import KeysetPagination
 from .document_service import (
     save_uploaded_file,
+    save_uploaded_files,
     get_document_file_path,
-    delete_document_file,
+    discard_uploaded_file,
     registrar_auditoria_documento,
-    user_can_access_document,
+    registrar_auditoria_documentos,
 )
 from .serializers import (
     RolSerializer, UserSerializer, UserPublicSerializer, LoginSerializer,
     EmpleadoSerializer, CasoSerializer, AlertaSerializer, DocumentoSerializer,
-    CarpetaSerializer, SeguimientoSerializer, ReporteSerializer, CambioRolSerializer, TokenVerificationSerializer
+    CarpetaSerializer, SeguimientoSerializer, ReporteSerializer, CambioRolSerializer, TokenVerificationSerializer,
+    AuditoriaDocumentoSerializer,
 )
 
 
@@ -42,41 +59,16 @@ class IsAdminOrTHA(BasePermission):
     'Administrador' o 'THA' (case-insensitive)
     """
     def has_permission(self, request, view):
-        # Verificar que el usuario esté autenticado
-        if not request.user or not request.user.is_authenticated:
-            print(f"[IsAdminOrTHA] Usuario no autenticado: {request.user}")
-            return False
-        
-        # IMPORTANTE: Recargar el usuario con el rol desde la BD para evitar problemas de cache
-        try:
-            # Usar select_related para cargar el rol en una sola consulta
-            user = User.objects.select_related('rol').get(pk=request.user.pk)
-            print(f"[IsAdminOrTHA] Usuario cargado: {user.username}, ID: {user.pk}")
-        except User.DoesNotExist:
-            print(f"[IsAdminOrTHA] Usuario no encontrado en BD: {request.user.pk}")
+        # El rol ya viene resuelto en el principal de la petición (sin recargar el usuario)
+        principal = get_principal(request)
+        if principal is None:
+            logger.debug("[IsAdminOrTHA] Usuario no autenticado: %s", request.user)
             return False
-        except Exception as e:
-            print(f"[IsAdminOrTHA] Error al cargar usuario: {e}")
-            return False
-        
-        # Verificar que el usuario tenga un rol asignado
-        if not user.rol:
-            print(f"[IsAdminOrTHA] Usuario {user.username} sin rol asignado")
-            return False
-        
-        # Verificar que el rol sea 'Administrador' o 'THA' (case-insensitive)
-        rol_tipo = user.rol.tipo
-        if not rol_tipo:
-            print(f"[IsAdminOrTHA] Rol sin tipo para usuario {user.username}")
-            return False
-        
-        # Convertir a minúsculas para comparación case-insensitive
-        rol_tipo_lower = rol_tipo.lower()
-        resultado = rol_tipo_lower in ['administrador', 'tha']
-        
-        print(f"[IsAdminOrTHA] Usuario: {user.username}, Rol tipo: '{rol_tipo}' -> '{rol_tipo_lower}', Permiso: {resultado}")
-        
-        return resultado
+        logger.debug(
+            "[IsAdminOrTHA] Usuario ID %s, rol '%s', permiso: %s",
+            principal.user_id, principal.rol_tipo, principal.is_admin_or_tha,
+        )
+        return principal.is_admin_or_tha
 
 
 # ==================== FUNCIONES PÚBLICAS ====================
@@ -185,8 +177,8 @@ def verificar_token(request):
                 'mensaje': 'Token expirado'
             }, status=status.HTTP_200_OK)
         
-        # Actualizar última actividad
-        token.save()
+        # Actualizar última actividad (solo se escribe si superó el umbral)
+        token.registrar_actividad()
         
         # Calcular tiempo restante
         minutos_expiracion = getattr(settings, 'TOKEN_EXPIRATION_MINUTES', 30)
@@ -352,6 +344,13 @@ def password_reset_request(request):
         )
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminOrTHA])
+def metricas_auditoria(request):
+    """Estado del escritor de auditoría de este proceso: cola, lotes y latencia de vaciado"""
+    return Response(auditoria.metricas())
+
+
 # ==================== VIEWSETS ====================
 
 class RolViewSet(viewsets.ModelViewSet):
@@ -458,7 +457,7 @@ class EmpleadoViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        queryset = Empleado.objects.all()
+        queryset = Empleado.objects.con_totales()
         
         # Filtros opcionales
         # Aceptar tanto 'search' como 'nombre' para compatibilidad
@@ -471,11 +470,8 @@ class EmpleadoViewSet(viewsets.ModelViewSet):
         numero_documento = self.request.query_params.get('numero_documento', None)
         
         if nombre:
-            queryset = queryset.filter(
-                Q(nombre__icontains=nombre) | 
-                Q(apellido__icontains=nombre) |
-                Q(numero_documento__icontains=nombre)
-            )
+            # Trigramas sin tildes y con ranking en PostgreSQL; icontains en otros motores
+            queryset = buscar_empleados(queryset, nombre)
         if estado:
             queryset = queryset.filter(estado=estado)
         if area:
@@ -493,11 +489,43 @@ class EmpleadoViewSet(viewsets.ModelViewSet):
     def casos(self, request, pk=None):
         """Obtener casos de un empleado"""
         empleado = self.get_object()
-        casos = empleado.casos.all()
+        casos = empleado.casos.con_totales()
         serializer = CasoSerializer(casos, many=True, context={'request': request})
         return Response(serializer.data)
 
 
+def _descargar_zip(request, documentos, filename, por_carpeta=False):
+    """
+    ZIP en flujo con los documentos de `documentos` que el usuario puede descargar.
+    Los que no están en el almacenamiento se listan en LEEME.txt. Registra DESCARGA de
+    todos los incluidos en una sola inserción.
+    """
+    documentos = (
+        documentos.visible_to(request.user).select_related('carpeta')
+        .only('pk', 'nombre', 'ruta', 'extension', 'carpeta__nombre').order_by('carpeta__nombre', 'pk')
+    )
+    incluidos, rutas, faltantes = [], [], []
+    for documento in documentos:
+        path = get_document_file_path(documento)
+        if path:
+            incluidos.append(documento)
+            rutas.append(path)
+        else:
+            faltantes.append(documento)
+    if not incluidos:
+        return Response({"detail": "No hay documentos disponibles para descargar."}, status=status.HTTP_404_NOT_FOUND)
+    nombres = nombres_en_zip(
+        (d.carpeta.nombre if por_carpeta and d.carpeta else None, nombre_descarga(d)) for d in incluidos
+    )
+    notas = None
+    if faltantes:
+        notas = "Documentos no encontrados en el almacenamiento:\n" + "".join(
+            f"- {nombre_descarga(d)} (Id {d.pk})\n" for d in faltantes
+        )
+    registrar_auditoria_documentos('DESCARGA', incluidos, request.user, request)
+    return responder_zip(list(zip(nombres, rutas)), filename, notas)
+
+
 class CasoViewSet(viewsets.ModelViewSet):
     """ViewSet para casos"""
     queryset = Caso.objects.all()
@@ -505,7 +533,7 @@ class CasoViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        queryset = Caso.objects.all()
+        queryset = Caso.objects.con_totales()
         
         # Filtros opcionales
         estado = self.request.query_params.get('estado', None)
@@ -521,6 +549,12 @@ class CasoViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    @action(detail=True, methods=['get'], url_path='descargar-zip')
+    def descargar_zip(self, request, pk=None):
+        """ZIP con los documentos del caso (subcarpetas por Carpeta) que el usuario puede descargar."""
+        caso = self.get_object()
+        return _descargar_zip(request, Documento.objects.filter(caso=caso), f"caso-{caso.pk}.zip", por_carpeta=True)
+    
     def perform_create(self, serializer):
         # Asignar responsable automáticamente si no se proporciona
         if 'responsable' not in serializer.validated_data or serializer.validated_data.get('responsable') is None:
@@ -601,6 +635,12 @@ class CarpetaViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(empleado_id=empleado_id)
         
         return queryset
+    
+    @action(detail=True, methods=['get'], url_path='descargar-zip')
+    def descargar_zip(self, request, pk=None):
+        """ZIP con los documentos de la carpeta que el usuario puede descargar."""
+        carpeta = self.get_object()
+        return _descargar_zip(request, Documento.objects.filter(carpeta=carpeta), f"{carpeta.nombre or 'carpeta'}.zip")
 
 
 class DocumentoViewSet(viewsets.ModelViewSet):
@@ -610,7 +650,9 @@ class DocumentoViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        queryset = Documento.objects.select_related('caso', 'usuario_creador', 'empleado', 'carpeta')
+        queryset = Documento.objects.select_related(
+            'caso', 'caso__empleado', 'usuario_creador', 'empleado', 'carpeta'
+        ).con_acceso(self.request.user)
         caso_id = self.request.query_params.get('caso', None)
         tipo = self.request.query_params.get('tipo', None)
         if caso_id:
@@ -620,13 +662,8 @@ class DocumentoViewSet(viewsets.ModelViewSet):
         return queryset
     
     def _filter_by_permission(self, queryset, request):
-        """Filtra documentos a los que el usuario tiene acceso (Rol + Nivel_Sensibilidad)."""
-        user = request.user
-        allowed = []
-        for doc in queryset:
-            if user_can_access_document(user, doc):
-                allowed.append(doc.pk)
-        return queryset.filter(pk__in=allowed) if allowed else queryset.none()
+        """Filtra documentos a los que el usuario tiene acceso (Rol + Nivel_Sensibilidad) en SQL."""
+        return queryset.visible_to(request.user)
     
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
@@ -650,28 +687,22 @@ class DocumentoViewSet(viewsets.ModelViewSet):
                 return self.get_paginated_response(serializer.data)
             serializer = self.get_serializer(queryset, many=True, context={'request': request})
             return Response(serializer.data)
+        except APIException:
+            # Errores de la API (p. ej. cursor inválido) conservan su código de estado
+            raise
         except Exception:
             logger.exception("Error al listar documentos")
             return Response({"detail": "Error interno al listar documentos"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        if not user_can_access_document(request.user, instance):
+        if not instance.puede_acceder:
             return Response({"detail": "No tiene permiso para ver este documento."}, status=status.HTTP_403_FORBIDDEN)
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
     
-    def create(self, request, *args, **kwargs):
-        archivo = request.FILES.get('archivo') or request.FILES.get('file')
-        if not archivo:
-            return Response(
-                {"detail": "Se requiere un archivo (campo 'archivo' o 'file')."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        try:
-            meta = save_uploaded_file(archivo, nombre_logico=archivo.name)
-        except ValueError as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    def _datos_subida(self, request, nombre_archivo):
+        """Metadatos del documento a partir del formulario multipart de subida."""
         nivel = request.data.get('nivel_sensibilidad') or 'CONFIDENCIAL'
         if nivel.upper() not in ('PUBLICO', 'CONFIDENCIAL', 'RESTRINGIDO'):
             nivel = 'CONFIDENCIAL'
@@ -683,8 +714,8 @@ class DocumentoViewSet(viewsets.ModelViewSet):
                 return int(val)
             except (ValueError, TypeError):
                 return None
-        data = {
-            'nombre': request.data.get('nombre') or archivo.name,
+        return {
+            'nombre': request.data.get('nombre') or nombre_archivo,
             'tipo': request.data.get('tipo') or '',
             'descripcion': request.data.get('descripcion') or '',
             'caso': _pk(request.data.get('caso')),
@@ -692,51 +723,367 @@ class DocumentoViewSet(viewsets.ModelViewSet):
             'carpeta': _pk(request.data.get('carpeta')),
             'nivel_sensibilidad': nivel.upper(),
         }
-        serializer = self.get_serializer(data=data)
+    
+    def create(self, request, *args, **kwargs):
+        archivo = request.FILES.get('archivo') or request.FILES.get('file')
+        if not archivo:
+            return Response(
+                {"detail": "Se requiere un archivo (campo 'archivo' o 'file')."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = self.get_serializer(data=self._datos_subida(request, archivo.name))
         serializer.is_valid(raise_exception=True)
+        # El archivo se guarda tras validar: con DOCUMENT_STORAGE_DEDUP no quedan referencias huérfanas
+        try:
+            meta = save_uploaded_file(
+                archivo, nombre_logico=archivo.name,
+                nivel_sensibilidad=serializer.validated_data.get('nivel_sensibilidad'),
+            )
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         # ruta, extension, tamano_bytes, checksum_sha256 son read_only; pasarlos en save()
-        doc = serializer.save(
-            usuario_creador=request.user,
-            ruta=meta['ruta'],
-            extension=meta['extension'],
-            tamano_bytes=meta['tamano_bytes'],
-            checksum_sha256=meta['checksum_sha256'],
-        )
+        try:
+            doc = serializer.save(
+                usuario_creador=request.user,
+                ruta=meta['ruta'],
+                extension=meta['extension'],
+                tamano_bytes=meta['tamano_bytes'],
+                checksum_sha256=meta['checksum_sha256'],
+                mime_type=meta['mime_type'],
+            )
+        except BaseException:
+            discard_uploaded_file(meta['ruta'])
+            raise
         registrar_auditoria_documento('SUBIDA', doc, request.user, request)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        if not user_can_access_document(request.user, instance):
+        if not instance.puede_acceder:
             return Response({"detail": "No tiene permiso para eliminar este documento."}, status=status.HTTP_403_FORBIDDEN)
         registrar_auditoria_documento('ELIMINADO', instance, request.user, request)
-        delete_document_file(instance)
+        # El archivo se borra tras el commit (señal post_delete de Documento)
         instance.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
     
+    @action(detail=False, methods=['post'], url_path='subir-lote')
+    def subir_lote(self, request):
+        """
+        Sube varios archivos (campo 'archivos' o 'files', repetido) con los mismos metadatos
+        (caso, empleado, carpeta, nivel_sensibilidad, tipo, descripcion); el nombre de cada
+        documento es el de su archivo. Los archivos se escriben y hashean en paralelo y los
+        Documento y su auditoría SUBIDA se insertan en lote en una transacción.
+        Responde 201 si se crearon todos, 207 si solo algunos y 400 si ninguno, con el
+        resultado de cada archivo en el orden recibido.
+        """
+        archivos = request.FILES.getlist('archivos') or request.FILES.getlist('files')
+        if not archivos:
+            return Response(
+                {"detail": "Se requiere al menos un archivo (campo 'archivos' o 'files')."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        maximo = getattr(settings, 'DOCUMENT_BULK_UPLOAD_MAX_FILES', 50)
+        if len(archivos) > maximo:
+            return Response(
+                {"detail": f"Máximo {maximo} archivos por petición."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Metadatos comunes: el nombre de cada archivo se valida aparte, con su resultado
+        datos = self._datos_subida(request, None)
+        datos['nombre'] = 'lote'
+        serializer = self.get_serializer(data=datos)
+        serializer.is_valid(raise_exception=True)
+        comunes = {k: v for k, v in serializer.validated_data.items() if k != 'nombre'}
+
+        resultados = [None] * len(archivos)
+        nombres = {}
+        campo_nombre = serializer.fields['nombre']
+        for i, archivo in enumerate(archivos):
+            try:
+                nombres[i] = campo_nombre.run_validation(archivo.name)
+            except ValidationError as e:
+                resultados[i] = {'indice': i, 'nombre': archivo.name, 'estado': 'error', 'detail': ' '.join(map(str, e.detail))}
+        guardados = save_uploaded_files(
+            [archivos[i] for i in nombres], nivel_sensibilidad=comunes.get('nivel_sensibilidad'),
+        )
+        nuevos = []
+        for i, meta in zip(nombres, guardados):
+            if isinstance(meta, Exception):
+                resultados[i] = {'indice': i, 'nombre': archivos[i].name, 'estado': 'error', 'detail': str(meta)}
+                continue
+            nuevos.append((i, Documento(
+                **comunes,
+                nombre=nombres[i],
+                usuario_creador=request.user,
+                ruta=meta['ruta'],
+                extension=meta['extension'],
+                tamano_bytes=meta['tamano_bytes'],
+                checksum_sha256=meta['checksum_sha256'],
+                mime_type=meta['mime_type'],
+            )))
+        try:
+            with transaction.atomic():
+                creados = Documento.objects.bulk_create([doc for _, doc in nuevos])
+                registrar_auditoria_documentos('SUBIDA', creados, request.user, request)
+        except BaseException:
+            for _, doc in nuevos:
+                discard_uploaded_file(doc.ruta)
+            raise
+        documentos = Documento.objects.select_related('caso', 'caso__empleado', 'usuario_creador').in_bulk(
+            [doc.pk for doc in creados]
+        )
+        for i, doc in nuevos:
+            resultados[i] = {
+                'indice': i, 'nombre': archivos[i].name, 'estado': 'creado',
+                'documento': self.get_serializer(documentos[doc.pk]).data,
+            }
+        if not creados:
+            codigo = status.HTTP_400_BAD_REQUEST
+        elif len(creados) < len(archivos):
+            codigo = status.HTTP_207_MULTI_STATUS
+        else:
+            codigo = status.HTTP_201_CREATED
+        return Response({'creados': len(creados), 'errores': len(archivos) - len(creados), 'resultados': resultados}, status=codigo)
+    
+    def _estado_subida(self, subida):
+        return {
+            'id': str(subida.pk),
+            'nombre_archivo': subida.nombre_archivo,
+            'tamano_total': subida.tamano_total,
+            'recibidos': subida.recibidos,
+            'expira': subidas.expira(subida),
+        }
+    
+    @action(detail=False, methods=['post'], url_path='subidas')
+    def iniciar_subida(self, request):
+        """
+        Abre una subida reanudable por fragmentos (ver api/subidas.py): nombre_archivo y
+        tamano_total, más los metadatos de la subida normal. Se validan ahora y otra vez al finalizar.
+        """
+        nombre_archivo = request.data.get('nombre_archivo') or ''
+        try:
+            tamano_total = int(request.data.get('tamano_total'))
+        except (TypeError, ValueError):
+            tamano_total = None
+        if not nombre_archivo or tamano_total is None:
+            return Response(
+                {"detail": "Se requieren nombre_archivo y tamano_total."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        datos = self._datos_subida(request, nombre_archivo)
+        serializer = self.get_serializer(data=datos)
+        serializer.is_valid(raise_exception=True)
+        try:
+            subida = subidas.crear(request.user, nombre_archivo, tamano_total, datos)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self._estado_subida(subida), status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['get', 'put', 'delete'], url_path=r'subidas/(?P<subida_id>[0-9a-fA-F-]+)')
+    def subida(self, request, subida_id=None):
+        """
+        GET: bytes recibidos (desde dónde reanudar). DELETE: cancela.
+        PUT: fragmento en el cuerpo con Content-Range: bytes <inicio>-<fin>/<total>; <inicio>
+        debe ser lo ya recibido (409 con `recibidos` si no).
+        """
+        subida = subidas.obtener(subida_id, request.user)
+        if subida is None:
+            return Response({"detail": "Subida no encontrada."}, status=status.HTTP_404_NOT_FOUND)
+        if request.method == 'GET':
+            return Response(self._estado_subida(subida))
+        if request.method == 'DELETE':
+            subidas.cancelar(subida.pk, request.user)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        try:
+            inicio, longitud, total = subidas.parse_content_range(request.META.get('HTTP_CONTENT_RANGE'))
+            subida = subidas.escribir_fragmento(subida.pk, request.user, inicio, longitud, total, request.stream)
+        except SubidaDocumento.DoesNotExist:
+            return Response({"detail": "Subida no encontrada."}, status=status.HTTP_404_NOT_FOUND)
+        except subidas.FragmentoEnCurso as e:
+            return Response(
+                {"detail": "Otro fragmento de esta subida se está recibiendo.", "recibidos": e.recibidos},
+                status=status.HTTP_409_CONFLICT
+            )
+        except subidas.FragmentoFueraDeOrden as e:
+            return Response(
+                {"detail": "El fragmento no empieza donde termina lo recibido.", "recibidos": e.recibidos},
+                status=status.HTTP_409_CONFLICT
+            )
+        except TipoNoPermitido as e:
+            # Se detecta con los primeros KB: no tiene sentido recibir el resto
+            subidas.cancelar(subida.pk, request.user)
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except subidas.SubidaPerdida:
+            subidas.cancelar(subida.pk, request.user)
+            return Response({"detail": "La subida se perdió; debe iniciarse de nuevo."}, status=status.HTTP_410_GONE)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self._estado_subida(subida))
+    
+    @action(detail=False, methods=['post'], url_path=r'subidas/(?P<subida_id>[0-9a-fA-F-]+)/finalizar')
+    def finalizar_subida(self, request, subida_id=None):
+        """Crea el Documento de una subida completa (201, igual que la subida normal)."""
+        subida = subidas.obtener(subida_id, request.user)
+        if subida is None:
+            return Response({"detail": "Subida no encontrada."}, status=status.HTTP_404_NOT_FOUND)
+        serializer = self.get_serializer(data=subida.datos)
+        serializer.is_valid(raise_exception=True)
+        
+        def crear_documento(meta):
+            return serializer.save(
+                usuario_creador=request.user,
+                ruta=meta['ruta'],
+                extension=meta['extension'],
+                tamano_bytes=meta['tamano_bytes'],
+                checksum_sha256=meta['checksum_sha256'],
+                mime_type=meta['mime_type'],
+            )
+        
+        try:
+            doc = subidas.finalizar(subida.pk, request.user, crear_documento)
+        except SubidaDocumento.DoesNotExist:
+            return Response({"detail": "Subida no encontrada."}, status=status.HTTP_404_NOT_FOUND)
+        except subidas.SubidaIncompleta as e:
+            return Response(
+                {"detail": "Faltan fragmentos por recibir.", "recibidos": e.recibidos},
+                status=status.HTTP_409_CONFLICT
+            )
+        except TipoNoPermitido as e:
+            subidas.cancelar(subida.pk, request.user)
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except subidas.SubidaPerdida:
+            subidas.cancelar(subida.pk, request.user)
+            return Response({"detail": "La subida se perdió; debe iniciarse de nuevo."}, status=status.HTTP_410_GONE)
+        registrar_auditoria_documento('SUBIDA', doc, request.user, request)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
     @action(detail=True, methods=['get'], url_path='descargar')
     def descargar(self, request, pk=None):
-        """Descarga el archivo solo vía vista protegida (sin URL directa)."""
+        """Descarga el archivo solo vía vista protegida (sin URL directa). Soporta Range y GET condicional."""
         documento = self.get_object()
-        if not user_can_access_document(request.user, documento):
+        if not documento.puede_acceder:
             return Response({"detail": "No tiene permiso para descargar este documento."}, status=status.HTTP_403_FORBIDDEN)
         path = get_document_file_path(documento)
         if not path:
             return Response({"detail": "Archivo no encontrado en almacenamiento."}, status=status.HTTP_404_NOT_FOUND)
-        registrar_auditoria_documento('DESCARGA', documento, request.user, request)
-        from django.http import FileResponse
-        import mimetypes
-        name = documento.nombre or documento.ruta or 'documento'
-        if documento.extension and not name.endswith('.' + documento.extension):
-            name = f"{name}.{documento.extension}"
-        content_type, _ = mimetypes.guess_type(name) or ('application/octet-stream', None)
-        return FileResponse(open(path, 'rb'), as_attachment=True, filename=name, content_type=content_type)
+        name = nombre_descarga(documento)
+        # Tipo detectado al subir; los documentos anteriores se deducen por el nombre
+        content_type = documento.mime_type or tipo_por_nombre(name)
+        # Range / ETag / GET condicional; la auditoría sigue DOCUMENT_DOWNLOAD_AUDIT
+        respuesta = responder_descarga(request, documento, path, filename=name, content_type=content_type)
+        if debe_auditar_descarga(respuesta):
+            registrar_auditoria_documento('DESCARGA', documento, request.user, request)
+        return respuesta
+    
+    @action(detail=True, methods=['get'], url_path='miniatura')
+    def miniatura(self, request, pk=None):
+        """Miniatura WebP del documento (imágenes y PDF); se genera aquí si aún no existe."""
+        documento = self.get_object()
+        if not documento.puede_acceder:
+            return Response({"detail": "No tiene permiso para ver este documento."}, status=status.HTTP_403_FORBIDDEN)
+        sin_miniatura = Response({"detail": "El documento no tiene miniatura."}, status=status.HTTP_404_NOT_FOUND)
+        if not documento.checksum_sha256 or not miniaturas.soporta(documento.extension):
+            return sin_miniatura
+
+        def obtener_path():
+            path = miniaturas.path_miniatura(documento.checksum_sha256)
+            if os.path.isfile(path):
+                return path
+            origen = get_document_file_path(documento)
+            return origen and miniaturas.generar_miniatura(origen, documento.checksum_sha256, documento.extension)
+
+        return responder_miniatura(request, documento.checksum_sha256, obtener_path) or sin_miniatura
     
     def perform_create(self, serializer):
         # create() sobrescrito; no se usa perform_create para subida con archivo
         serializer.save(usuario_creador=self.request.user)
 
 
+def _parse_fecha_filtro(valor, nombre, fin_de_dia=False):
+    """
+    Fecha (YYYY-MM-DD) o fecha-hora ISO de un filtro. Una fecha sola es el inicio del día
+    (o el inicio del día siguiente con fin_de_dia, para 'hasta' inclusivo).
+    Returns: (datetime con zona, date) o (None, None).
+    """
+    if not valor:
+        return None, None
+    try:
+        dia = parse_date(valor) if len(valor) == 10 else None
+        momento = None if dia else parse_datetime(valor)
+    except ValueError:
+        dia = momento = None
+    if dia is None and momento is None:
+        raise ValidationError({nombre: 'Use YYYY-MM-DD o fecha-hora ISO 8601.'})
+    if dia is not None:
+        if fin_de_dia:
+            dia += timedelta(days=1)
+        momento = datetime.combine(dia, datetime.min.time())
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento, timezone.localdate(momento)
+
+
+class AuditoriaDocumentoViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Auditoría de documentos, solo lectura (Administrador/THA).
+    Filtros: documento, usuario, accion, desde, hasta (hasta inclusivo si es solo fecha).
+    Listado con paginación por keyset (?cursor=); /resumen/ agrega desde Auditoria_Resumen_Diario.
+    """
+    serializer_class = AuditoriaDocumentoSerializer
+    permission_classes = [IsAuthenticated, IsAdminOrTHA]
+    pagination_class = KeysetPagination
+    CAMPOS_RESUMEN = {
+        'dia': ['dia'],
+        'documento': ['documento', 'documento__nombre'],
+        'usuario': ['usuario', 'usuario__username'],
+        'accion': ['accion'],
+    }
+
+    def _filtros(self):
+        params = self.request.query_params
+        filtros = {}
+        for campo in ('documento', 'usuario'):
+            if params.get(campo):
+                try:
+                    filtros[f'{campo}_id'] = int(params[campo])
+                except ValueError:
+                    raise ValidationError({campo: 'Debe ser un entero.'})
+        if params.get('accion'):
+            filtros['accion'] = params['accion'].upper()
+        desde, desde_dia = _parse_fecha_filtro(params.get('desde'), 'desde')
+        hasta, hasta_dia = _parse_fecha_filtro(params.get('hasta'), 'hasta', fin_de_dia=True)
+        return filtros, (desde, hasta), (desde_dia, hasta_dia)
+
+    def get_queryset(self):
+        filtros, rango, _ = self._filtros()
+        return AuditoriaDocumento.objects.select_related('documento', 'usuario').filter(**filtros).en_rango(*rango)
+
+    @action(detail=False, methods=['get'])
+    def resumen(self, request):
+        """
+        Conteos agregados: ?agrupar=dia,documento,usuario,accion (uno o varios; por defecto dia)
+        con los mismos filtros. Los rangos se toman por día completo. ?limite= (máx. 10000).
+        """
+        agrupar = [c.strip() for c in request.query_params.get('agrupar', 'dia').split(',') if c.strip()]
+        desconocidos = [c for c in agrupar if c not in self.CAMPOS_RESUMEN]
+        if not agrupar or desconocidos:
+            raise ValidationError({'agrupar': f"Valores permitidos: {', '.join(self.CAMPOS_RESUMEN)}"})
+        try:
+            limite = min(int(request.query_params.get('limite', 1000)), 10000)
+        except ValueError:
+            raise ValidationError({'limite': 'Debe ser un entero.'})
+        filtros, _, (desde_dia, hasta_dia) = self._filtros()
+        queryset = AuditoriaResumenDiario.objects.filter(**filtros)
+        if desde_dia:
+            queryset = queryset.filter(dia__gte=desde_dia)
+        if hasta_dia:
+            queryset = queryset.filter(dia__lt=hasta_dia)
+        campos = [campo for c in agrupar for campo in self.CAMPOS_RESUMEN[c]]
+        orden = ['dia', '-total'] if 'dia' in agrupar else ['-total']
+        filas = queryset.values(*campos).annotate(total=Sum('total')).order_by(*orden)[:limite]
+        return Response({'agrupar': agrupar, 'resultados': list(filas)})
+
+
 class SeguimientoViewSet(viewsets.ModelViewSet):
     """ViewSet para seguimientos"""
     queryset = Seguimiento.objects.all()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import json
 import os
 from pathlib import Path
 
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
@@ -98,6 +100,16 @@ DATABASES = {
     #}
 #}
 
+# Caché compartida entre workers (p. ej. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# y CACHE_LOCATION=redis://127.0.0.1:6379/1). Sin CACHE_BACKEND: locmem por proceso (y la caché
+# de tokens se limita a TOKEN_CACHE_LOCAL_TTL_SECONDS).
+if os.environ.get('CACHE_BACKEND'):
+    CACHES = {
+        'default': {
+            'BACKEND': os.environ['CACHE_BACKEND'],
+            'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+        }
+    }
 
 
 # Password validation
@@ -153,7 +165,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # PageNumberPagination por defecto; ?cursor= activa la paginación por keyset
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PaginacionHibrida',
     'PAGE_SIZE': 20,
 }
 
@@ -207,8 +220,109 @@ DOCUMENT_STORAGE_ROOT = os.environ.get(
     str(BASE_DIR / 'documentos_privados')
 )
 
+# Reparto en subdirectorios <aa>/<bb>/ por prefijo del nombre UUID (evita un directorio con
+# cientos de miles de entradas). Las rutas planas antiguas se siguen resolviendo; para
+# moverlas: python manage.py reorganizar_almacenamiento
+DOCUMENT_STORAGE_SHARDED = os.environ.get('DOCUMENT_STORAGE_SHARDED', 'True').lower() in ('1', 'true', 'yes')
+
+# Almacén deduplicado: el mismo contenido se guarda una sola vez (cas/<aa>/<bb>/<sha256>).
+# Para mover los archivos existentes: python manage.py migrar_almacenamiento_cas
+DOCUMENT_STORAGE_DEDUP = os.environ.get('DOCUMENT_STORAGE_DEDUP', 'False').lower() in ('1', 'true', 'yes')
+
+# Cuándo registrar DESCARGA en la auditoría: 'completa' (descarga entera o rango desde el
+# byte 0, no cada trozo del visor), 'cada_rango' (cada 200/206) o 'siempre' (también 304)
+DOCUMENT_DOWNLOAD_AUDIT = os.environ.get('DOCUMENT_DOWNLOAD_AUDIT', 'completa')
+
+# Entrega de descargas: 'python' (desde el worker), 'x-accel' (nginx) o 'x-sendfile' (Apache).
+# Con nginx, DOCUMENT_ACCEL_PREFIX debe ser una location `internal` con alias a DOCUMENT_STORAGE_ROOT:
+#   location /documentos-internos/ { internal; alias /ruta/documentos_privados/; }
+DOCUMENT_DELIVERY_BACKEND = os.environ.get('DOCUMENT_DELIVERY_BACKEND', 'python')
+DOCUMENT_ACCEL_PREFIX = os.environ.get('DOCUMENT_ACCEL_PREFIX', '/documentos-internos/')
+
+# Bloque de E/S para subir y verificar documentos, y fsync antes de publicar cada archivo
+DOCUMENT_IO_CHUNK_SIZE = int(os.environ.get('DOCUMENT_IO_CHUNK_SIZE', str(1024 * 1024)))
+DOCUMENT_STORAGE_FSYNC = os.environ.get('DOCUMENT_STORAGE_FSYNC', 'False').lower() in ('1', 'true', 'yes')
+
+# Verificación de integridad (python manage.py verificar_integridad): lectura total máxima
+# en MB/s (0 = sin límite) y archivo donde se guarda el avance para reanudar
+DOCUMENT_SCRUB_MB_PER_SECOND = float(os.environ.get('DOCUMENT_SCRUB_MB_PER_SECOND', '20'))
+DOCUMENT_SCRUB_STATE_FILE = os.environ.get('DOCUMENT_SCRUB_STATE_FILE', str(BASE_DIR / 'verificacion_integridad.json'))
+
+# Archivos sin Documento más antiguos que este margen (horas) los borra
+# python manage.py limpiar_huerfanos; el margen protege las subidas en curso
+DOCUMENT_ORPHAN_GRACE_HOURS = float(os.environ.get('DOCUMENT_ORPHAN_GRACE_HOURS', '24'))
+
+# Subida en lote (POST /api/documentos/subir-lote/): máximo de archivos por petición e
+# hilos que escriben y calculan el SHA-256 en paralelo
+DOCUMENT_BULK_UPLOAD_MAX_FILES = int(os.environ.get('DOCUMENT_BULK_UPLOAD_MAX_FILES', '50'))
+DOCUMENT_BULK_UPLOAD_WORKERS = int(os.environ.get('DOCUMENT_BULK_UPLOAD_WORKERS', '4'))
+
+# Subidas reanudables por fragmentos (POST /api/documentos/subidas/): tamaño máximo del
+# archivo y horas sin recibir fragmentos tras las que limpiar_huerfanos borra la sesión
+DOCUMENT_CHUNKED_UPLOAD_MAX_BYTES = int(os.environ.get('DOCUMENT_CHUNKED_UPLOAD_MAX_BYTES', str(2 * 1024 ** 3)))
+DOCUMENT_CHUNKED_UPLOAD_EXPIRY_HOURS = float(os.environ.get('DOCUMENT_CHUNKED_UPLOAD_EXPIRY_HOURS', '24'))
+
+# Tipos de archivo (detectados por contenido, api/tipos_mime.py) que se admiten al subir, por
+# nivel de sensibilidad; patrones como 'image/*'. Un nivel ausente no tiene restricción.
+# Se puede sustituir entero con un JSON en DOCUMENT_MIME_POLICY.
+_MIME_DOCUMENTOS = [
+    'application/pdf', 'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/tiff',
+    'image/bmp', 'image/heic', 'image/heif', 'text/plain', 'text/csv', 'application/rtf',
+    'application/msword', 'application/vnd.ms-excel', 'application/vnd.ms-powerpoint',
+    'application/vnd.openxmlformats-officedocument.*', 'application/vnd.oasis.opendocument.*',
+]
+_MIME_CORREO_Y_MEDIOS = ['message/rfc822', 'application/vnd.ms-outlook', 'audio/*', 'video/*']
+_MIME_COMPRIMIDOS = ['application/zip', 'application/gzip', 'application/x-7z-compressed', 'application/vnd.rar']
+DOCUMENT_MIME_POLICY = json.loads(os.environ['DOCUMENT_MIME_POLICY']) if os.environ.get('DOCUMENT_MIME_POLICY') else {
+    'PUBLICO': _MIME_DOCUMENTOS,
+    'CONFIDENCIAL': _MIME_DOCUMENTOS + _MIME_CORREO_Y_MEDIOS + _MIME_COMPRIMIDOS,
+    # Sin comprimidos: su contenido no se puede revisar sin extraerlo
+    'RESTRINGIDO': _MIME_DOCUMENTOS + _MIME_CORREO_Y_MEDIOS,
+}
+
+# Miniaturas de documentos (GET /api/documentos/<id>/miniatura/): lado máximo en px e hilos
+# por proceso que las generan al subir. Los PDF necesitan pdftoppm (paquete poppler-utils).
+DOCUMENT_THUMBNAILS = os.environ.get('DOCUMENT_THUMBNAILS', 'True').lower() in ('1', 'true', 'yes')
+DOCUMENT_THUMBNAIL_SIZE = int(os.environ.get('DOCUMENT_THUMBNAIL_SIZE', '320'))
+DOCUMENT_THUMBNAIL_WORKERS = int(os.environ.get('DOCUMENT_THUMBNAIL_WORKERS', '2'))
+DOCUMENT_PDFTOPPM_PATH = os.environ.get('DOCUMENT_PDFTOPPM_PATH', 'pdftoppm')
+
+# Variantes WebP/JPEG de Empleado.foto (api/fotos.py): hilos por proceso que las generan
+# tras guardar; 0 = en el mismo hilo al hacer commit
+EMPLEADO_FOTO_WORKERS = int(os.environ.get('EMPLEADO_FOTO_WORKERS', '2'))
+
+# Auditoría de documentos en lote: cola en memoria + spool local, bulk_create por tamaño/tiempo.
+# AUDIT_ASYNC=False escribe cada fila en la petición (tests, scripts).
+AUDIT_ASYNC = os.environ.get('AUDIT_ASYNC', 'True').lower() in ('1', 'true', 'yes')
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '500'))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.environ.get('AUDIT_FLUSH_INTERVAL_SECONDS', '2'))
+AUDIT_SPOOL_DIR = os.environ.get('AUDIT_SPOOL_DIR', str(BASE_DIR / 'spool_auditoria'))
+AUDIT_SPOOL_FSYNC = os.environ.get('AUDIT_SPOOL_FSYNC', 'False').lower() in ('1', 'true', 'yes')
+# Un lote que falla se reintenta con espera creciente (intervalo * 2^n, hasta
+# AUDIT_RETRY_MAX_SECONDS); tras AUDIT_MAX_RETRIES intentos pasa a <spool>/descartados/
+AUDIT_MAX_RETRIES = int(os.environ.get('AUDIT_MAX_RETRIES', '5'))
+AUDIT_RETRY_MAX_SECONDS = float(os.environ.get('AUDIT_RETRY_MAX_SECONDS', '300'))
+
+# Particiones mensuales de Auditoria_Documento (PostgreSQL): meses que se conservan en la
+# tabla y destino de los meses archivados (CSV gzip). 0 = no archivar.
+# python manage.py particiones_auditoria (programar mensualmente)
+AUDIT_RETENTION_MONTHS = int(os.environ.get('AUDIT_RETENTION_MONTHS', '24'))
+AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR', str(BASE_DIR / 'archivo_auditoria'))
+
 # Token Expiration (minutos)
 TOKEN_EXPIRATION_MINUTES = int(os.environ.get('TOKEN_EXPIRATION_MINUTES', '30'))
+# Segundos mínimos entre escrituras de ultima_actividad (0 = escribir en cada petición)
+TOKEN_ACTIVITY_THRESHOLD_SECONDS = int(os.environ.get('TOKEN_ACTIVITY_THRESHOLD_SECONDS', '60'))
+# Caché de validación de tokens: TTL en segundos (0 = desactivada), tamaño del LRU en proceso
+# y alias de CACHES para compartirla entre procesos (vacío = 'default' si es compartida,
+# Redis/Memcached...; 'local' = LRU en proceso)
+TOKEN_CACHE_TTL_SECONDS = int(os.environ.get('TOKEN_CACHE_TTL_SECONDS', '30'))
+# TTL del LRU en proceso (sin caché compartida): es lo que otro worker puede seguir aceptando
+# un token revocado o un usuario desactivado. Con varios workers usar CACHE_BACKEND compartido
+# o 0 para no cachear.
+TOKEN_CACHE_LOCAL_TTL_SECONDS = int(os.environ.get('TOKEN_CACHE_LOCAL_TTL_SECONDS', '2'))
+TOKEN_CACHE_MAXSIZE = int(os.environ.get('TOKEN_CACHE_MAXSIZE', '10000'))
+TOKEN_CACHE_ALIAS = os.environ.get('TOKEN_CACHE_ALIAS', '')
 
 # Email Configuration
 EMAIL_BACKEND = os.environ.get(